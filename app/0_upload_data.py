@@ -1,7 +1,15 @@
+import os
+
 import pandas as pd
 import streamlit as st
-from buttons import download_data_button_in_sidebar
-from plots import plot_growth_data_w_mask
+from buttons import download_archive_button_in_sidebar, download_data_button_in_sidebar
+from plots import growth_data_w_mask_images
+from ui_components import (
+    get_column_cache,
+    get_time_axis,
+    select_page,
+    show_images,
+)
 
 import piogrowth
 
@@ -11,6 +19,12 @@ df_wide_raw_od_data = st.session_state.get("df_wide_raw_od_data")
 df_wide_raw_od_data_filtered = st.session_state.get("df_wide_raw_od_data_filtered")
 df_rolling = st.session_state.get("df_rolling")
 masked = st.session_state.get("masked")
+# reactor of each column of the wide data (columns are reactors for one channel)
+column_reactors = st.session_state.get("column_reactors")
+if column_reactors is None and df_wide_raw_od_data is not None:
+    column_reactors = pd.Series(
+        df_wide_raw_od_data.columns, index=df_wide_raw_od_data.columns
+    )
 min_periods = st.session_state.get("min_periods", 5)
 
 st.title("Upload Data")
@@ -70,9 +84,18 @@ with st.form("Upload_data_form", clear_on_submit=False):
     round_time = st.slider(
         "Round time to nearest second (defining timesteps)", 0, 15, 5, step=1
     )
+    single_precision = st.checkbox(
+        "Use single precision (float32) for OD readings",
+        value=False,
+        help=(
+            "Halves the memory of large uploads. Spline fits are still computed in"
+            " double precision."
+        ),
+    )
+    od_dtype = "float32" if single_precision else None
     # Options for handeling negative OD readings
     st.write("Data filtering options:")
-    filter_columns = st.columns(3)
+    filter_columns = st.columns(4)
     remove_negative = filter_columns[0].checkbox(
         "Remove negative OD readings",
         value=False,
@@ -99,12 +122,33 @@ with st.form("Upload_data_form", clear_on_submit=False):
         1.5,
         step=0.1,
     )
+    filter_by_mad = filter_columns[3].checkbox(
+        "Remove outliers by robust residuals (MAD)",
+        value=False,
+        help=(
+            "Residuals to a rolling median over 11 timepoints, refitted without"
+            " the outliers. Follows sharp drops (dilutions) closely."
+        ),
+    )
+    mad_factor = filter_columns[3].slider(
+        "Multiple of the scaled MAD for outlier removal",
+        3.0,
+        10.0,
+        5.0,
+        step=0.5,
+    )
+    # default: the duration of 31 rows of the wide data, at least the slider minimum
+    window_default = 31
+    if df_wide_raw_od_data is not None:
+        window_default = max(
+            10, int(piogrowth.filter.default_window(df_wide_raw_od_data.index))
+        )
     rolling_window = filter_columns[2].slider(
-        "Rolling window (in seconds)",
-        11,
-        61,
-        31,
-        step=2,
+        "Rolling window (in seconds, centered on each timepoint)",
+        10,
+        max(3600, window_default),
+        window_default,
+        step=10 if window_default > 300 else 1,
     )
     st.divider()
     st.write(
@@ -115,30 +159,29 @@ with st.form("Upload_data_form", clear_on_submit=False):
         "reactors."
     )
     min_date, max_date = None, None
-    if df_raw_od_data is not None:
+    # decimated slider options (precomputed once per upload)
+    time_options = st.session_state.get("time_options")
+    if time_options is not None:
         min_date, max_date = st.select_slider(
             "Select overall time window (inferred).",
-            options=df_raw_od_data["timestamp_rounded"],
-            value=(
-                df_raw_od_data["timestamp_rounded"].min(),
-                df_raw_od_data["timestamp_rounded"].max(),
-            ),
+            options=time_options,
+            value=(time_options[0], time_options[-1]),
         )
     st.divider()
-    if df_wide_raw_od_data is not None:
+    time_ranges = dict()
+    reactor_time_options = st.session_state.get("reactor_time_options")
+    if reactor_time_options is not None:
         with st.expander("Select time window per reactor"):
             st.info("Note: Minimum and maximum for slider are reactor specific!")
             # per reactor, get min and max timestamps
-            time_ranges = dict()
-            for reactor in df_wide_raw_od_data.columns:
+            for reactor, options in reactor_time_options.items():
+                if options.empty:
+                    continue
                 time_ranges[reactor] = st.select_slider(
                     f"Select time window (inferred) for {reactor}."
                     " Bounded by overall time window.",
-                    options=df_wide_raw_od_data[reactor].dropna().index,
-                    value=(
-                        df_wide_raw_od_data[reactor].dropna().index.min(),
-                        df_wide_raw_od_data[reactor].dropna().index.max(),
-                    ),
+                    options=options,
+                    value=(options[0], options[-1]),
                 )
     st.divider()
     st.write("Plotting options:")
@@ -172,7 +215,7 @@ msg = ""
 
 # this runs wheather the button is pressed or not, but only if a file is uploaded?
 if file is not None:
-    df_raw_od_data = piogrowth.load.read_csv(file)
+    df_raw_od_data = piogrowth.load.read_csv(file, dtype=od_dtype)
     msg = (
         f"- Loaded {df_raw_od_data.shape[0]:,d} rows "
         f"and {df_raw_od_data.shape[1]:,d} columns.\n"
@@ -194,19 +237,41 @@ if file is not None:
     # wide data of raw data
     # - can be used in plot for visualization,
     # - and in curve fitting (where gaps would be interpolated)
+    # (time x reactor x channel) array, channels (angle and channel) of a reactor
+    # become separate columns of the wide data if there are several
     try:
-        df_wide_raw_od_data = df_raw_od_data.pivot(
-            index="timestamp_rounded",
-            columns="pioreactor_unit",
-            values="od_reading",
-        )
+        od_array = piogrowth.load.to_od_array(df_raw_od_data, dtype=od_dtype or float)
     except ValueError:
         st.error(
             "Rounding produced duplicated timepoints in reactors,"
             f" please decrease below: {round_time} seconds."
         )
         st.stop()
+    df_wide_raw_od_data = od_array.to_frame()
+    if len(od_array.channels) > 1:
+        msg += (
+            f"- Found {len(od_array.channels)} channels (angle_channel):"
+            f" {', '.join(od_array.channels)}. Each channel of a reactor is"
+            " analysed as separate column named reactor_angle_channel.\n"
+        )
     st.session_state["df_wide_raw_od_data"] = df_wide_raw_od_data
+    # reactor of each column, the same for all channels of a reactor
+    column_reactors = od_array.column_reactors()
+    st.session_state["column_reactors"] = column_reactors
+    # a few hundred slider options instead of one per timepoint
+    st.session_state["time_options"] = piogrowth.trim.decimate_options(
+        df_wide_raw_od_data.index
+    )
+    # one time window per reactor, spanning the valid values of all its channels
+    bounds = piogrowth.trim.valid_bounds(df_wide_raw_od_data)
+    bounds = bounds.loc[bounds["end"] > bounds["start"]]
+    bounds = bounds.groupby(column_reactors.loc[bounds.index]).agg(
+        start=("start", "min"), end=("end", "max")
+    )
+    st.session_state["reactor_time_options"] = {
+        reactor: piogrowth.trim.decimate_options(df_wide_raw_od_data.index, start, end)
+        for reactor, (start, end) in bounds.iterrows()
+    }
     if rerun:
         # ? replace with callback function that creates the input form?
         st.rerun()
@@ -221,10 +286,16 @@ if button_pressed:
             reactors_selected = reactors_selected.split(",")
             st.write(f"Filtering reactors: {reactors_selected}")
         mask = df_raw_od_data["pioreactor_unit"].isin(reactors_selected)
+        # all channels (columns) of the selected reactors
+        mask_columns = column_reactors.reindex(df_wide_raw_od_data.columns).isin(
+            reactors_selected
+        )
         if filter_option == "Remove":
             df_raw_od_data = df_raw_od_data.loc[~mask]
+            df_wide_raw_od_data = df_wide_raw_od_data.loc[:, ~mask_columns.to_numpy()]
         else:
             df_raw_od_data = df_raw_od_data.loc[mask]
+            df_wide_raw_od_data = df_wide_raw_od_data.loc[:, mask_columns.to_numpy()]
     # skip first or last measurements based on user input (after first loading the data)
     # ! won't be plotted in red as filtered data, but just not appear in the plots
     # ! applied to wide raw data
@@ -232,74 +303,58 @@ if button_pressed:
         df_wide_raw_od_data = df_wide_raw_od_data.loc[min_date:max_date]
         st.info(f"Time range: {min_date} to {max_date}")
 
-    for reactor, time_range in time_ranges.items():
-        if reactor not in df_wide_raw_od_data.columns:
-            continue
-        _min_date, _max_date = time_range
-        _min_date = max(_min_date, min_date)
-        _max_date = min(_max_date, max_date)
-        df_wide_raw_od_data[reactor] = df_wide_raw_od_data.loc[
-            _min_date:_max_date, reactor
-        ]
-
-    # initalize masked here
-    masked = pd.DataFrame(
-        False,
-        index=df_wide_raw_od_data.index,
-        columns=df_wide_raw_od_data.columns,
+    # per reactor time windows as row bounds of all its columns (no copies of the
+    # data)
+    time_ranges = {
+        col: (
+            max(time_ranges[reactor][0], min_date),
+            min(time_ranges[reactor][1], max_date),
+        )
+        for col, reactor in column_reactors.items()
+        if reactor in time_ranges and col in df_wide_raw_od_data.columns
+    }
+    reactor_bounds = piogrowth.trim.time_ranges_to_bounds(
+        df_wide_raw_od_data.index, time_ranges
     )
-    df_wide_raw_od_data_filtered = df_wide_raw_od_data.copy()
-
-    # Handle negative values
+    st.session_state["reactor_bounds"] = reactor_bounds
+
+    # all filters and the rolling median (centered time window in seconds) in one go,
+    # only reactors with changed data, time window or filter settings are recomputed
+    filter_pipeline = piogrowth.filter.FilterPipeline(
+        remove_negative=remove_negative,
+        quantile_max=quantile_max if remove_max else None,
+        iqr_factor=iqr_range_value if filter_by_iqr_range else None,
+        window=rolling_window,
+        mad_factor=mad_factor if filter_by_mad else None,
+        min_periods=min_periods,
+        dtype=od_dtype or float,
+    )
+    filter_result = filter_pipeline.run(
+        df_wide_raw_od_data, bounds=reactor_bounds, cache=get_column_cache()
+    )
+    counts = filter_result.counts
+    Reason = piogrowth.filter.FilterReason
     if remove_negative:
-        mask_negative = df_wide_raw_od_data_filtered < 0
-        msg += (
-            f"- Setting {mask_negative.sum().sum():,d} negative OD readings to NaN.\n"
-        )
-        msg += f"   - in detail: {mask_negative.sum().to_dict()}\n"
-        df_wide_raw_od_data_filtered = df_wide_raw_od_data_filtered.mask(mask_negative)
-        masked = masked | mask_negative
-
+        n_removed = counts.loc[Reason.NEGATIVE.name]
+        msg += f"- Setting {n_removed.sum():,d} negative OD readings to NaN.\n"
+        msg += f"   - in detail: {n_removed.to_dict()}\n"
     if remove_max:
-        mask_extreme_values = (
-            df_wide_raw_od_data_filtered
-            > df_wide_raw_od_data_filtered.quantile(quantile_max)
-        )
-        msg += (
-            f"- Number of extreme values detected: {mask_extreme_values.sum().sum()}\n"
-        )
-        msg += f"   - in detail: {mask_extreme_values.sum().to_dict()}\n"
-        df_wide_raw_od_data_filtered = df_wide_raw_od_data_filtered.mask(
-            mask_extreme_values
-        )
-        masked = masked | mask_extreme_values
-
-    # outlier detection using IQR on rolling window: sets for center value of window a
-    # true or false (this would be arguing maybe for long data format)
-    # can be used in plot for visualization
-    # https://pandas.pydata.org/docs/reference/api/pandas.DataFrame.rolling.html
-
+        n_removed = counts.loc[Reason.QUANTILE.name]
+        msg += f"- Number of extreme values detected: {n_removed.sum()}\n"
+        msg += f"   - in detail: {n_removed.to_dict()}\n"
+    # outlier detection using IQR on rolling window around each value
     if filter_by_iqr_range:
-        mask_outliers = (
-            df_wide_raw_od_data_filtered.rolling(
-                rolling_window,
-                min_periods=min_periods,
-                center=True,
-                closed="both",
-            )
-            .apply(piogrowth.filter.out_of_iqr, kwargs={"factor": iqr_range_value})
-            .astype(bool)
-        )
-        # st.write(f"### Number of outliers detected: {mask_outliers.sum().sum()}")
-        msg += f"- Number of outliers detected: {mask_outliers.sum().sum()}\n"
-        msg += f"   - in detail: {mask_outliers.sum().to_dict()}\n"
-        masked = masked | mask_outliers
-
-        # apply mask to entire dataframe
-
-        df_wide_raw_od_data_filtered = df_wide_raw_od_data_filtered.mask(mask_outliers)
-
-    masked = masked.convert_dtypes()
+        n_removed = counts.loc[Reason.IQR.name]
+        msg += f"- Number of outliers detected: {n_removed.sum()}\n"
+        msg += f"   - in detail: {n_removed.to_dict()}\n"
+    # outlier detection using residuals to a robust smoother
+    if filter_by_mad:
+        n_removed = counts.loc[Reason.MAD.name]
+        msg += f"- Number of outliers detected by residuals: {n_removed.sum()}\n"
+        msg += f"   - in detail: {n_removed.to_dict()}\n"
+
+    df_wide_raw_od_data_filtered = filter_result.filtered
+    masked = filter_result.flags.astype(bool).convert_dtypes()
 
     # from pathlib import Path
     # fpath = Path(f"playground/data/{custom_id}_masked_values.csv")
@@ -308,13 +363,12 @@ if button_pressed:
     # df_wide_raw_od_data.to_csv(Path(f"playground/data/{custom_id}_raw_wide_data.csv"))
     st.session_state["df_wide_raw_od_data_filtered"] = df_wide_raw_od_data_filtered
     st.session_state["masked"] = masked
+    st.session_state["filter_flags"] = filter_result.flags
 
-    df_rolling = df_wide_raw_od_data_filtered.rolling(
-        rolling_window,
-        min_periods=min_periods,
-        center=True,
-    ).median()
+    df_rolling = filter_result.rolling_median
     st.session_state["df_rolling"] = df_rolling
+    # timestamps in seconds, computed once for all fits of the rolling median
+    get_time_axis("df_rolling")
 
 
 with container_raw_data:
@@ -324,10 +378,16 @@ if df_wide_raw_od_data is not None and masked is not None:
     # Download options
     if not use_same_yaxis_scale:
         st.warning("Using different y-axis scale for each reactor.")
-    fig = plot_growth_data_w_mask(
-        df_wide_raw_od_data, masked, sharey=use_same_yaxis_scale
+    # only the reactors of the selected page are drawn, each as cached image
+    reactors = select_page(df_wide_raw_od_data.columns, key="upload_plot_page")
+    images = growth_data_w_mask_images(
+        df_wide_raw_od_data,
+        masked,
+        reactors,
+        sharey=use_same_yaxis_scale,
+        bounds=st.session_state.get("reactor_bounds"),
     )
-    st.write(fig)
+    show_images(images)
 
 if msg:
     st.subheader("Processing summary of OD readings")
@@ -358,6 +418,102 @@ if df_rolling is not None:
         file_name="rolling_median_on_filtered_wide_data_with_rounded_timestamps.csv",
     )
 
+########################################################################################
+# Save and reopen analysed experiments
+st.markdown("### Save or reopen analysed experiment")
+SESSION_FRAMES = [
+    "df_wide_raw_od_data",
+    "df_wide_raw_od_data_filtered",
+    "masked",
+    "filter_flags",
+    "df_rolling",
+    "splines",
+    "derivatives",
+    "df_rolling_turbidostat",
+    "df_splines_turbidostat",
+    "df_derivatives_turbidostat",
+]
+SESSION_TABLES = [
+    "df_raw_od_data",
+    "batch_analysis_summary_df",
+    "growth_model_params_df",
+    "df_summary",
+]
+SESSION_PARAMS = ["custom_id", "round_time"]
+download_archive_button_in_sidebar(
+    SESSION_FRAMES + SESSION_TABLES,
+    params={k: st.session_state.get(k) for k in SESSION_PARAMS},
+    label="Download all results (Parquet tables)",
+    file_name=f"{custom_id}_results.zip",
+)
+with st.expander("Save analysis on the server or reopen a saved analysis"):
+    # analyses are kept by name below a configured root, so they can be reopened
+    # in later sessions
+    experiments_root = os.environ.get("PIOGROWTH_EXPERIMENTS_DIR", "experiments")
+    experiment_name = st.text_input("Name of analysed experiment", value=custom_id)
+    saved = piogrowth.store.list_experiments(experiments_root)
+    overwrite = True
+    if experiment_name in saved:
+        overwrite = st.checkbox(
+            f"Overwrite the saved analysis {experiment_name!r}", value=False
+        )
+    col_save, col_open = st.columns(2)
+    if col_save.button(
+        "Save analysis", disabled=df_raw_od_data is None or not overwrite
+    ):
+        try:
+            experiment_dir = piogrowth.store.experiment_dir(
+                experiments_root, experiment_name
+            )
+        except ValueError:
+            st.error(
+                "Use only letters, digits, '_', '-' and '.' in the name of the"
+                " experiment."
+            )
+            st.stop()
+        tables = {k: st.session_state.get(k) for k in SESSION_TABLES}
+        # trims and time windows of the reactors
+        tables["reactor_bounds"] = st.session_state.get("reactor_bounds")
+        if column_reactors is not None:
+            tables["column_reactors"] = column_reactors.to_frame()
+        if st.session_state.get("time_options") is not None:
+            tables["trim_time_options"] = pd.DataFrame(
+                {"time_option": st.session_state["time_options"]}
+            )
+        if st.session_state.get("reactor_time_options") is not None:
+            tables["trim_reactor_time_options"] = piogrowth.trim.time_options_to_frame(
+                st.session_state["reactor_time_options"]
+            )
+        piogrowth.store.save_experiment(
+            experiment_dir,
+            frames={k: st.session_state.get(k) for k in SESSION_FRAMES},
+            tables=tables,
+            params={k: st.session_state.get(k) for k in SESSION_PARAMS},
+        )
+        st.success(f"Saved analysis {experiment_name!r}")
+        saved = piogrowth.store.list_experiments(experiments_root)
+    name_to_open = col_open.selectbox("Saved analyses", options=saved)
+    if col_open.button("Reopen analysis", disabled=not saved):
+        experiment = piogrowth.store.load_experiment(
+            piogrowth.store.experiment_dir(experiments_root, name_to_open)
+        )
+        for key in experiment.keys():
+            if key == "trim_time_options":
+                st.session_state["time_options"] = pd.DatetimeIndex(
+                    experiment[key]["time_option"]
+                )
+            elif key == "trim_reactor_time_options":
+                st.session_state["reactor_time_options"] = (
+                    piogrowth.trim.time_options_from_frame(experiment[key])
+                )
+            elif key == "column_reactors":
+                st.session_state[key] = experiment[key]["reactor"]
+            else:
+                st.session_state[key] = experiment[key]
+        for key, value in experiment.params.items():
+            st.session_state[key] = value
+        st.rerun()
+
 st.markdown("### Store in QurvE format")
 st.info("This feature is not yet implemented.")
 # convert = st.button("Store in QurvE format", key="store_in_QurvE")
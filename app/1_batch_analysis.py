@@ -1,12 +1,46 @@
-import numpy as np
+import functools
+
 import pandas as pd
 import streamlit as st
 from buttons import download_data_button_in_sidebar
-from plots import plot_derivatives, plot_fitted_data
-from ui_components import render_markdown, show_warning_to_upload_data
+from plots import (
+    add_gaps_to_axes,
+    add_ranges_to_axes,
+    add_tangents_to_axes,
+    add_vlines_to_axes,
+    plot_derivatives,
+    plot_fitted_data,
+    tangent_segments,
+)
+from ui_components import (
+    get_column_cache,
+    get_job_runner,
+    get_session_id,
+    get_time_axis,
+    render_markdown,
+    select_page,
+    show_job_metrics,
+    show_warning_to_upload_data,
+    wait_for_job,
+)
 
-from piogrowth.durations import find_max_range
-from piogrowth.fit import fit_spline_and_derivatives_one_batch, get_smoothing_range
+from piogrowth.durations import find_max_ranges, threshold_index
+from piogrowth.fit import (
+    evaluate_splines_one_batch,
+    find_gaps,
+    fit_whittaker_splines,
+    get_smoothing_range,
+    is_uniform,
+    max_derivatives,
+)
+from piogrowth.jobs import (
+    fingerprint,
+    submit_bootstrap,
+    submit_growth_model_fits,
+    submit_spline_fits,
+)
+from piogrowth.models import MODELS
+from piogrowth.transform import apply_transforms, shift_log
 
 ########################################################################################
 # page
@@ -20,6 +54,7 @@ if no_data_uploaded:
     st.stop()
 
 df_rolling = st.session_state["df_rolling"]  # .interpolate()
+show_job_metrics()
 
 smoothing_range = get_smoothing_range(len(df_rolling))
 
@@ -42,8 +77,42 @@ with st.form("Batch_processing_options", enter_to_submit=True):
         smoothing_range.s_min,
         step=1,
     )
-    high_percentage_treshold = st.slider(
-        "Define percentage of µmax considered as high", 0, 100, 90, step=1
+    smoother = st.radio(
+        "Smoother",
+        options=["smoothing spline", "Whittaker"],
+        horizontal=True,
+        help=(
+            "Whittaker: penalized least squares smoother of all reactors at once,"
+            " much faster for long runs, but only for equally spaced timepoints"
+            " (no gaps after rounding). Falls back to smoothing splines otherwise."
+        ),
+    )
+    whittaker_lambda = 10 ** st.slider(
+        "Whittaker smoothness (log10 of penalty, larger is smoother)",
+        0.0,
+        14.0,
+        8.0,
+        step=0.5,
+    )
+    max_gap_minutes = st.number_input(
+        "Split spline fits at gaps without data longer than (in minutes, 0 means"
+        " one spline across all gaps)",
+        min_value=0.0,
+        value=0.0,
+        step=10.0,
+    )
+    n_resamples = st.number_input(
+        "Number of bootstrap resamples for confidence intervals of µmax, its "
+        "timepoint and the high growth window (0 means no confidence intervals)",
+        min_value=0,
+        value=0,
+        step=50,
+    )
+    growth_model = st.selectbox(
+        "Additionally fit a parametric growth model to obtain lag time, µmax and "
+        "carrying capacity (preferably on log transformed data)",
+        options=["none", *MODELS],
+        index=0,
     )
     # User inputs for analysis
     st.write("#### Plotting options:")
@@ -53,33 +122,88 @@ with st.form("Batch_processing_options", enter_to_submit=True):
     )
     form_submit = st.form_submit_button("Run Analysis", type="primary")
 
+# outside of the form: changing it only looks up the high growth window again
+high_percentage_treshold = st.slider(
+    "Define percentage of µmax considered as high",
+    0,
+    100,
+    90,
+    step=1,
+    key="high_percentage_treshold",
+)
+
 if not no_data_uploaded:
     with view_data_module:
         with st.expander("Data used for analysis (rolling median data):"):
             st.dataframe(st.session_state["df_rolling"], use_container_width=True)
 
-# Process button
-if form_submit and not no_data_uploaded:
+# Process button: keep showing results of the analysis on reruns
+if form_submit:
+    st.session_state["batch_analysis_requested"] = True
+    # confidence intervals of the high growth window use the percentage of µmax
+    # at submission, moving the slider afterwards does not bootstrap again
+    st.session_state["batch_bootstrap_prop_high"] = high_percentage_treshold / 100
+
+if st.session_state.get("batch_analysis_requested") and not no_data_uploaded:
     Y_LABEL = "OD readings"
     if apply_log:
         Y_LABEL = "ln(OD readings)"
-
-        def log_transform(s):
-            s_min = s.min()
-            if s_min < 0:
-                s = s - s_min
-
-            return np.log(s + 0.001)
-
-        df_rolling = df_rolling.apply(log_transform)
-    splines, derivatives = fit_spline_and_derivatives_one_batch(
-        df_rolling,
-        smoothing_factor=spline_smoothing_value,
-    )
+        df_rolling = apply_transforms(df_rolling, shift_log)
+    # timestamps in seconds, shared by all reactors, fits, evaluations and the
+    # tangents (the log transform keeps the index and the missing values)
+    axis = get_time_axis("df_rolling")
+    use_whittaker = smoother == "Whittaker" and is_uniform(df_rolling.index)
+    if smoother == "Whittaker" and not use_whittaker:
+        st.warning("Timepoints are not equally spaced, using smoothing splines.")
+    if use_whittaker:
+        # one banded solve for all reactors, fast enough to run in the page
+        fit_key = fingerprint("whittaker", df_rolling, whittaker_lambda)
+        whittaker_fit = st.session_state.get("batch_whittaker_fit")
+        if whittaker_fit is None or whittaker_fit[0] != fit_key:
+            # only reactors whose data changed are smoothed again
+            whittaker_fit = (
+                fit_key,
+                get_column_cache().apply_columns(
+                    "whittaker",
+                    functools.partial(
+                        fit_whittaker_splines, lam=whittaker_lambda, axis=axis
+                    ),
+                    df_rolling,
+                    params=whittaker_lambda,
+                ),
+            )
+            st.session_state["batch_whittaker_fit"] = whittaker_fit
+        fitted = whittaker_fit[1]
+    else:
+        # fits run in the background, a rerun picks up the running or finished job
+        job = submit_spline_fits(
+            get_job_runner(),
+            df_rolling,
+            smoothing_factor=spline_smoothing_value,
+            session_id=get_session_id(),
+            max_gap=max_gap_minutes * 60 if max_gap_minutes else None,
+            axis=axis,
+        )
+        fit_key = job.key
+        fitted = wait_for_job(job, label="Fitting splines")
+    # evaluate splines, index derivatives and find µmax (from roots of second
+    # derivative, not limited to sampled timepoints) once per fit, not on every
+    # rerun
+    evaluated = st.session_state.get("batch_evaluated_splines")
+    if evaluated is None or evaluated[0] != fit_key:
+        splines = evaluate_splines_one_batch(fitted, axis)
+        derivatives = evaluate_splines_one_batch(fitted, axis, nu=1)
+        evaluated = (
+            fit_key,
+            splines,
+            derivatives,
+            threshold_index(derivatives),
+            max_derivatives(fitted),
+        )
+        st.session_state["batch_evaluated_splines"] = evaluated
+    _, splines, derivatives, derivatives_index, df_maxima = evaluated
     prop_high = high_percentage_treshold / 100
-    cutoffs = derivatives.max() * prop_high
-    in_high_growth = derivatives.ge(cutoffs, axis=1)
-    max_time_range = in_high_growth.apply(find_max_range, axis=0).T.convert_dtypes()
+    max_time_range = find_max_ranges(derivatives_index, prop_high)
     st.session_state["splines"] = splines
     st.session_state["derivatives"] = derivatives
 
@@ -94,14 +218,29 @@ if form_submit and not no_data_uploaded:
         file_name="splines.csv",
     )
 
-    maxima = derivatives.max()
-    maxima_idx = derivatives.idxmax()
-
-    titles = [
-        f"{col} - max $\\mu$ {mu:<.5f} at {idx}"
-        for col, mu, idx in zip(df_rolling.columns, maxima, maxima_idx)
+    # reactors without any piece long enough to fit (split at gaps) are dropped
+    dropped = df_rolling.columns.difference(splines.columns, sort=False)
+    if len(dropped):
+        st.warning(
+            "No spline could be fitted for reactors (too few values between gaps):"
+            f" {', '.join(map(str, dropped))}"
+        )
+    df_maxima = df_maxima.reindex(splines.columns)
+    maxima = df_maxima["mu_max"]
+    maxima_idx = df_maxima["timepoint"]
+    # closest sampled timepoints to look up data values
+    maxima_idx_sampled = df_rolling.index[
+        df_rolling.index.get_indexer(maxima_idx, method="nearest")
     ]
 
+    titles = pd.Series(
+        [
+            f"{col} - max $\\mu$ {mu:<.5f} at {idx}"
+            for col, mu, idx in zip(splines.columns, maxima, maxima_idx)
+        ],
+        index=splines.columns,
+    )
+
     msg = f"""
     In plots the maximum change in OD (fitted) is indicated by the red dashed lines.
     The maximum change in OD (fitted) and it's timepoint is mentioned in the title of
@@ -110,48 +249,43 @@ if form_submit and not no_data_uploaded:
     this range was continous and had no spikes.
     """
     st.markdown(msg)
+    # both figures show the reactors of the selected page only
+    reactors = pd.Index(select_page(splines.columns, key="batch_plot_page"))
+    page_titles = titles[reactors].tolist()
     st.title("Fitted splines")
     with st.expander("Show fitted splines data:"):
         st.dataframe(splines, use_container_width=True)
-    fig, axes = plot_fitted_data(splines, titles=titles, ylabel=Y_LABEL)
+    fig, axes = plot_fitted_data(splines[reactors], titles=page_titles, ylabel=Y_LABEL)
     axes = axes.flatten()
     if not remove_raw_data:
-        for col, ax in zip(df_rolling.columns, axes):
+        for col, ax in zip(reactors, axes):
             df_rolling[col].plot(
                 ax=ax, c="black", style=".", alpha=0.3, ms=1, label="Raw data"
             )
-    for ax, x in zip(axes, maxima_idx):
-        ax.axvline(x=x, color="red", linestyle="--")
-    for ax, col in zip(axes, derivatives.columns):
-        row = max_time_range.loc[col]
-        if row.is_continues:
-            # only plot span if the time range is continous (no jumps)
-            ax.axvspan(row.start, row.end, color="gray", alpha=0.2)
+    add_vlines_to_axes(axes, maxima_idx, reactors, color="red", linestyle="--")
+    # only plot span if the time range is continous (no jumps)
+    add_ranges_to_axes(axes, max_time_range, reactors)
+    if max_gap_minutes and not use_whittaker:
+        gaps = find_gaps(df_rolling, max_gap_minutes * 60)
+        if not gaps.empty:
+            st.info(
+                f"Splines were fitted separately between {len(gaps)} gaps"
+                " (red shaded areas)."
+            )
+            add_gaps_to_axes(axes, gaps, reactors)
     if add_tangent_of_mu_max:
-        for ax, col in zip(axes, derivatives.columns):
-            b = maxima.loc[col]
-            x_center = maxima_idx.loc[col]
-            y_center = splines.loc[x_center, col]
-            x = (derivatives.index - x_center).total_seconds().to_numpy()
-            y = b * x + y_center
-            mask = (y < splines[col].max()) & (y > splines[col].min())
-            # only plot tangent if the time range is continous (no jumps)
-            ax.plot(derivatives.index[mask], y[mask], color="blue", linestyle="--")
-        del x, y, b, x_center, y_center, mask
+        # end points of all tangents, limited to the range of the fitted splines
+        segments = tangent_segments(df_maxima, splines.min(), splines.max(), axis.index)
+        add_tangents_to_axes(axes, segments, reactors)
     st.write(fig)
 
     st.title("First order derivatives")
     with st.expander("Show first derivative data:"):
         st.dataframe(derivatives, use_container_width=True)
-    fig, axes = plot_derivatives(derivatives=derivatives, titles=titles)
+    fig, axes = plot_derivatives(derivatives=derivatives[reactors], titles=page_titles)
     axes = axes.flatten()
-    for ax, x in zip(axes, maxima_idx):
-        ax.axvline(x=x, color="red", linestyle="--")
-    for ax, col in zip(axes, derivatives.columns):
-        row = max_time_range.loc[col]
-        if row.is_continues:
-            # only plot span if the time range is continous (no jumps)
-            ax.axvspan(row.start, row.end, color="gray", alpha=0.2)
+    add_vlines_to_axes(axes, maxima_idx, reactors, color="red", linestyle="--")
+    add_ranges_to_axes(axes, max_time_range, reactors)
     st.write(fig)
 
     batch_analysis_summary_df = pd.DataFrame(
@@ -160,15 +294,13 @@ if form_submit and not no_data_uploaded:
             "max_change_in_od": maxima,
             "reactor_od_rolling_median": [
                 df_rolling.loc[idx, col]
-                for idx, col in zip(maxima_idx, maxima_idx.index)
+                for idx, col in zip(maxima_idx_sampled, maxima_idx.index)
             ],
             "reactor_od_in_filtered_data": [
                 st.session_state["df_wide_raw_od_data_filtered"].loc[idx, col]
-                for idx, col in zip(maxima_idx, maxima_idx.index)
-            ],
-            "reactor_od_fitted_spline": [
-                splines.loc[idx, col] for idx, col in zip(maxima_idx, maxima_idx.index)
+                for idx, col in zip(maxima_idx_sampled, maxima_idx.index)
             ],
+            "reactor_od_fitted_spline": df_maxima["fitted"],
         }
     )
     # rename maximum range columns and add to summary table
@@ -183,6 +315,55 @@ if form_submit and not no_data_uploaded:
     batch_analysis_summary_df = pd.concat(
         [batch_analysis_summary_df, max_time_range], axis=1
     )
+    if n_resamples:
+        bootstrap_prop_high = st.session_state.get(
+            "batch_bootstrap_prop_high", prop_high
+        )
+        # block resampling of the residuals of the same smoother as the fit, one
+        # task per reactor in the shared worker pool, only once per fit and
+        # bootstrap parameters
+        bootstrap_key = (
+            fit_key,
+            spline_smoothing_value,
+            n_resamples,
+            bootstrap_prop_high,
+        )
+        bootstrap = st.session_state.get("batch_bootstrap")
+        if bootstrap is None or bootstrap[0] != bootstrap_key:
+            job = submit_bootstrap(
+                get_job_runner(),
+                df_rolling,
+                smoothing_factor=spline_smoothing_value,
+                n_resamples=n_resamples,
+                prop_high=bootstrap_prop_high,
+                seed=0,
+                session_id=get_session_id(),
+                max_gap=(
+                    max_gap_minutes * 60
+                    if max_gap_minutes and not use_whittaker
+                    else None
+                ),
+                lam=whittaker_lambda if use_whittaker else None,
+            )
+            bootstrap = (
+                bootstrap_key,
+                wait_for_job(job, label="Bootstrapping confidence intervals"),
+            )
+            st.session_state["batch_bootstrap"] = bootstrap
+        df_confidence_intervals = bootstrap[1]
+        if bootstrap_prop_high != prop_high:
+            st.info(
+                "Confidence intervals of the high growth window are for"
+                f" {bootstrap_prop_high:.0%} of µmax. Run the analysis again to"
+                f" update them to {prop_high:.0%}."
+            )
+        batch_analysis_summary_df = pd.concat(
+            [
+                batch_analysis_summary_df,
+                df_confidence_intervals.filter(regex="_(lower|upper)$"),
+            ],
+            axis=1,
+        )
     st.dataframe(batch_analysis_summary_df, use_container_width=True)
     st.session_state["batch_analysis_summary_df"] = batch_analysis_summary_df
     download_data_button_in_sidebar(
@@ -191,5 +372,36 @@ if form_submit and not no_data_uploaded:
         file_name="batch_analysis_summary_df.csv",
     )
 
+    if growth_model != "none":
+        st.title(f"Parametric growth model: {growth_model}")
+        st.write(
+            "Parameters: start value `y0`, amplitude `A`, maximum growth rate `mu` "
+            "(per second), lag time `lag` (in seconds) and carrying capacity `y_max`."
+        )
+        # fitted only once per fit and model, not on every rerun
+        growth_models_key = (fit_key, growth_model, spline_smoothing_value)
+        growth_models = st.session_state.get("batch_growth_models")
+        if growth_models is None or growth_models[0] != growth_models_key:
+            job = submit_growth_model_fits(
+                get_job_runner(),
+                df_rolling,
+                model=growth_model,
+                smoothing_factor=spline_smoothing_value,
+                session_id=get_session_id(),
+            )
+            growth_models = (
+                growth_models_key,
+                wait_for_job(job, label=f"Fitting {growth_model} models"),
+            )
+            st.session_state["batch_growth_models"] = growth_models
+        growth_model_params_df = growth_models[1]
+        st.dataframe(growth_model_params_df, use_container_width=True)
+        st.session_state["growth_model_params_df"] = growth_model_params_df
+        download_data_button_in_sidebar(
+            "growth_model_params_df",
+            label="Download growth model parameters",
+            file_name=f"growth_model_{growth_model}_params.csv",
+        )
+
 # info on used methods
 render_markdown("app/markdowns/curve_fitting.md")
@@ -4,33 +4,34 @@ import pandas as pd
 import streamlit as st
 from buttons import create_download_button, download_data_button_in_sidebar
 from plots import (
+    add_ranges_to_axes,
+    add_vlines_to_axes,
     create_figure_bytes_to_download,
+    growth_data_w_peaks_images,
+    growth_data_w_peaks_pdf,
     plot_derivatives,
     plot_fitted_data,
-    plot_growth_data_w_peaks,
 )
-from ui_components import show_warning_to_upload_data
+from ui_components import (
+    get_job_runner,
+    get_session_id,
+    get_time_axis,
+    select_page,
+    show_images,
+    show_job_metrics,
+    show_warning_to_upload_data,
+    wait_for_job,
+)
 
-from piogrowth.durations import find_max_range
-from piogrowth.fit import fit_growth_data_w_peaks
-from piogrowth.turbistat import detect_peaks
+from piogrowth.durations import find_max_ranges, threshold_index
+from piogrowth.fit import time_axis
+from piogrowth.jobs import submit_segment_fits
+from piogrowth.load import reactors_to_columns
+from piogrowth.transform import apply_transforms, mask_downward
+from piogrowth.turbistat import detect_dilutions, detect_peaks
 
 
 ## Logic and PLOTTING
-def create_summary(maxima: dict[str, pd.Series]) -> pd.DataFrame:
-    """Create a summary DataFrame from the maxima dictionary."""
-    df_summary = pd.DataFrame(maxima).stack()
-    df_summary.index.names = ["timestamp", "pioreactor_unit"]
-    df_summary.name = "max_derivative_value"
-    df_summary = df_summary.to_frame()
-    return df_summary
-
-
-def get_values_from_df(df_wide: pd.DataFrame, indices: pd.MultiIndex) -> pd.DataFrame:
-    """Get values from the wide DataFrame based on the index of the summary DataFrame."""
-    return df_wide.loc[indices.get_level_values("timestamp")].stack().loc[indices]
-
-
 def reset_metadata():
     st.session_state["df_meta"] = None
 
@@ -112,6 +113,34 @@ with st.form(key="turbidostat_form"):
         " (or should not be used)",
         expanded=False,
     ):
+        peak_detection_method = st.radio(
+            "Peak detection method",
+            options=["find_peaks", "sharp OD drops"],
+            help=(
+                "find_peaks: peaks with a minimum height and distance. Sharp OD"
+                " drops: dilutions are drops in OD much larger than the noise level,"
+                " merged if closer than the minimum time between dilutions and at"
+                " least half the size of the largest dilution of a reactor."
+            ),
+            key="turbiostat_peak_detection_method",
+        )
+        drop_threshold = st.number_input(
+            label=("Minimum OD drop in multiples of the noise level (sharp OD drops)."),
+            min_value=1.0,
+            value=10.0,
+            step=1.0,
+            key="turbiostat_drop_threshold",
+        )
+        drop_min_separation = st.number_input(
+            label=(
+                "Minimum time between dilutions in minutes (sharp OD drops). No value"
+                " uses five times the interval between timepoints."
+            ),
+            min_value=0.0,
+            value=None,
+            step=5.0,
+            key="turbiostat_drop_min_separation",
+        )
         minimum_peak_height = st.number_input(
             label=(
                 "Minimum peak height (in OD units) - used only if no metadata provided. "
@@ -153,6 +182,7 @@ with st.form(key="turbidostat_form"):
 
 with st.sidebar:
     st.button("Reset uploaded metadata", on_click=reset_metadata)
+show_job_metrics()
 
 ### Error messages
 if st.session_state.get("show_error"):
@@ -166,8 +196,11 @@ if df_meta is not None:
     with container_metadata:
         st.write(df_meta)
 
-### On Submission of form parameters
+### On Submission of form parameters: keep showing results on reruns
 if submitted:
+    st.session_state["turbidostat_analysis_requested"] = True
+
+if st.session_state.get("turbidostat_analysis_requested"):
     st.session_state["show_error"] = False
 
     if turbiostat_meta is None and df_meta is not None:
@@ -225,6 +258,27 @@ if submitted:
             st.rerun()
 
         st.dataframe(peaks, use_container_width=True)
+        # dilutions of a reactor apply to all its channels (columns)
+        peaks = reactors_to_columns(
+            peaks, df_rolling.columns, st.session_state.get("column_reactors")
+        )
+    elif peak_detection_method == "sharp OD drops":
+        st.subheader("Detected dilutions")
+        st.write(
+            "Note: Dilutions are detected as sharp drops in OD of more than"
+            f" {drop_threshold} times the noise level (scaled median absolute"
+            " deviation of changes between consecutive timepoints)."
+        )
+        if drop_min_separation is not None:
+            st.write(
+                f"Drops less than {drop_min_separation} minutes apart are one"
+                " dilution."
+            )
+            drop_min_separation *= 60
+        peaks = detect_dilutions(
+            df_rolling, threshold=drop_threshold, min_separation=drop_min_separation
+        )
+        st.dataframe(peaks)
     else:
         st.subheader("Detected peaks")
         st.write(
@@ -242,19 +296,26 @@ if submitted:
 
     if remove_downward_trending:
         # Remove downward trending data globally on averaged data
-        df_rolling = df_rolling.mask(df_rolling.diff().le(0))
+        df_rolling = apply_transforms(df_rolling, mask_downward)
         st.info(
             "Downward trending data points (negative OD changes) were removed globally."
         )
-    fig, axes = plot_growth_data_w_peaks(df_rolling, peaks)
-    st.pyplot(fig)
+    # only the reactors of the selected page are drawn, each as cached image
+    reactors = select_page(df_rolling.columns, key="turbidostat_plot_page")
+    show_images(growth_data_w_peaks_images(df_rolling, peaks, reactors))
 
     with st.sidebar:
+        # the figure of all reactors is only drawn on request
+        if st.button("Prepare: figure for growth data with peaks as PDF"):
+            st.session_state["turbidostat_peaks_pdf"] = growth_data_w_peaks_pdf(
+                df_rolling, peaks
+            )
+        peaks_pdf = st.session_state.get("turbidostat_peaks_pdf")
         create_download_button(
             label="Download figure for growth data with peaks as PDF",
-            data=create_figure_bytes_to_download(fig, fmt="pdf"),
+            data=peaks_pdf if peaks_pdf is not None else "",
             file_name="growth_data_with_peaks.pdf",
-            disabled=False,
+            disabled=peaks_pdf is None,
             mime="application/pdf",
         )
 
@@ -265,8 +326,19 @@ if submitted:
         label="Download data used for growth analysis",
         file_name="df_rolling_turbidostat.csv",
     )
-    splines, df_first_derivative, d_maxima = fit_growth_data_w_peaks(
-        df_rolling, peaks, smoothing_factor=smoothing_factor
+    # fits run in the background, a rerun picks up the running or finished job
+    # seconds of the timestamps are reused, removed data points change only the
+    # positions of valid values
+    job = submit_segment_fits(
+        get_job_runner(),
+        df_rolling,
+        peaks,
+        smoothing_factor=smoothing_factor,
+        session_id=get_session_id(),
+        axis=time_axis(df_rolling, seconds=get_time_axis("df_rolling").seconds),
+    )
+    splines, df_first_derivative, df_segments = wait_for_job(
+        job, label="Fitting splines per segment"
     )
     st.session_state["df_splines_turbidostat"] = splines
     st.session_state["df_derivatives_turbidostat"] = df_first_derivative
@@ -282,22 +354,22 @@ if submitted:
     )
 
     prop_high = high_percentage_threshold / 100
-    cutoffs = df_first_derivative.max() * prop_high
-    in_high_growth = df_first_derivative.ge(cutoffs, axis=1)
-    max_time_range = in_high_growth.apply(find_max_range, axis=0).T.convert_dtypes()
+    max_time_range = find_max_ranges(threshold_index(df_first_derivative), prop_high)
 
     fig, axes = plot_fitted_data(
         splines,
     )
     axes = axes.flatten()
-    for ax, s_maxima in zip(axes, d_maxima.values()):
-        for x in s_maxima.index:
-            ax.axvline(x=x, color="red", linestyle="--")
-    for ax, col in zip(axes, df_first_derivative.columns):
-        row = max_time_range.loc[col]
-        if row.is_continues:
-            # only plot span if the time range is continous (no jumps)
-            ax.axvspan(row.start, row.end, color="gray", alpha=0.2)
+    # µmax of all segments of a reactor as one collection of lines
+    add_vlines_to_axes(
+        axes,
+        df_segments.set_index("pioreactor_unit")["timepoint"],
+        splines.columns,
+        color="red",
+        linestyle="--",
+    )
+    # only plot span if the time range is continous (no jumps)
+    add_ranges_to_axes(axes, max_time_range, df_first_derivative.columns)
     st.subheader("Fitted splines per segment")
     st.pyplot(fig)
 
@@ -327,18 +399,14 @@ if submitted:
     # Summary table
     st.subheader("Summary of high growth periods")
 
+    st.write(
+        "One row per reactor and segment between dilutions: µmax (`mu_max`, change"
+        " in OD per second) and its `timepoint`, the OD (rolling median) and the"
+        " fitted OD at µmax, the specific growth rate at µmax (µmax divided by the"
+        " fitted OD), the `doubling_time` in seconds and the R² of the fit."
+    )
     # Sidebar Download buttons
-    df_summary = create_summary(d_maxima)
-    # ! to fix for automatic peak picking
-    try:
-        df_summary["OD_median"] = get_values_from_df(df_rolling, df_summary.index)
-        df_summary["OD_spline"] = get_values_from_df(splines, df_summary.index)
-        df_summary["OD_derivative"] = get_values_from_df(
-            df_first_derivative, df_summary.index
-        )
-    except ValueError as e:
-        st.error(f"Error occurred while creating summary - ValueError: {e}")
-    df_summary = df_summary.swaplevel(0, 1).sort_index()
+    df_summary = df_segments
     st.dataframe(df_summary)
     st.session_state["df_summary"] = df_summary
     download_data_button_in_sidebar(
@@ -1,14 +1,16 @@
+import functools
+
 import streamlit as st
 
+import piogrowth
+
 
 def convert_data(df):
     return df.to_csv(index=True).encode("utf-8")
 
 
 @st.fragment
-def create_download_button(
-    label: str, data: str, file_name: str, disabled: bool, mime: str
-):
+def create_download_button(label: str, data, file_name: str, disabled: bool, mime: str):
     st.download_button(
         label=label,
         data=data,
@@ -28,18 +30,39 @@ def download_data_button_in_sidebar(
 
     - nested keys not possible
     - session state must be a DataFrame (which we do not check yet)
+    - the CSV file is only created when the button is clicked
     """
-    if st.session_state.get(session_key) is not None:
-        disabled = False
-        data = convert_data(st.session_state[session_key])
-    else:
-        disabled = True
-        data = ""
+    df = st.session_state.get(session_key)
     with st.sidebar:
         create_download_button(
             label=label,
-            data=data,
+            data=functools.partial(convert_data, df) if df is not None else "",
             file_name=file_name,
-            disabled=disabled,
+            disabled=df is None,
             mime="text/csv",
         )
+
+
+def download_archive_button_in_sidebar(
+    session_keys: list[str],
+    params: dict,
+    label: str = "Download all results",
+    file_name: str = "results.zip",
+):
+    """Create a download button in the sidebar for one zip archive of Parquet
+    tables with all DataFrames in session state found under ``session_keys``.
+
+    The archive is only written when the button is clicked, to a temporary file
+    on disk (see :func:`piogrowth.export.export_to_temporary_file`).
+    """
+    tables = {k: st.session_state.get(k) for k in session_keys}
+    with st.sidebar:
+        create_download_button(
+            label=label,
+            data=functools.partial(
+                piogrowth.export.export_to_temporary_file, tables, params=params
+            ),
+            file_name=file_name,
+            disabled=all(df is None for df in tables.values()),
+            mime="application/zip",
+        )
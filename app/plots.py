@@ -1,11 +1,15 @@
+from __future__ import annotations
+
 import io
+from typing import TYPE_CHECKING
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 import streamlit as st
-from matplotlib.dates import DateFormatter
-from matplotlib.ticker import FormatStrFormatter
+
+if TYPE_CHECKING:
+    # matplotlib is imported when the first plot is created
+    import matplotlib.pyplot as plt
 
 st.cache_data()
 
@@ -18,6 +22,9 @@ def create_figure_bytes_to_download(fig: plt.Figure, fmt: str = "pdf") -> io.Byt
 
 def plot_growth_data(df_long: pd.DataFrame):
     """Plot optical density (OD) growth data."""
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import DateFormatter
+
     units = df_long["pioreactor_unit"].nunique()
     fig, axes = plt.subplots(
         units, 1, figsize=(10, 2 * units), sharey=True, sharex=True, squeeze=False
@@ -45,86 +52,90 @@ def plot_growth_data_w_mask(
     df_wide: pd.DataFrame,
     df_mask: pd.DataFrame,
     sharey: bool = False,
+    bounds: pd.DataFrame | None = None,
+    ylim: tuple[float, float] | None = None,
 ) -> plt.Figure:
-    """Plot optical density (OD) growth data."""
+    """Plot optical density (OD) growth data.
+
+    Only rows within the ``bounds`` of a reactor (see ``piogrowth.trim``) are
+    plotted, if given. ``ylim`` fixes the y-axis limits of all reactors, e.g.
+    to share the scale with reactors plotted in another figure.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import DateFormatter
+
     # ?check that index is datetime and columns are numeric?
 
     units = df_wide.shape[1]
     fig, axes = plt.subplots(
-        units, 1, figsize=(10, 2 * units), sharey=sharey, sharex=True, squeeze=False
+        units,
+        1,
+        figsize=(10, 2 * units + 1),
+        sharey=sharey,
+        sharex=True,
+        squeeze=False,
     )
     axes = axes.flatten()
-    df_columns = df_wide.columns
-    index_name = df_wide.index.name
-    df_wide = df_wide.loc[df_mask.index].reset_index()
-    df_mask = df_mask.reset_index()
+    df_wide = df_wide.loc[df_mask.index]
     # grid container (reactive to UI changes)
-    for col, ax in zip(df_columns, axes):
-        mask = df_mask[col]
-        # plot kept values in blue
-        df_wide.loc[~mask].plot.scatter(
-            x=index_name,
-            y=col,
-            rot=45,
-            c="blue",
-            ax=ax,
-            alpha=0.1,
-            s=1,
-            title=f"Reactor: {col}",  # Customize legend text here
-        )
-        # Plot removed values in red
-        df_wide.loc[mask].plot.scatter(
-            x=index_name,
-            y=col,
-            rot=45,
-            c="red",
-            ax=ax,
-            alpha=1.0,
-            s=2,
-            title=f"Reactor: {col}",  # Customize legend text here
-        )
+    for col, ax in zip(df_wide.columns, axes):
+        s = df_wide[col]
+        mask = df_mask[col].fillna(False).to_numpy(dtype=bool)
+        if bounds is not None and col in bounds.index:
+            start, end = bounds.loc[col, ["start", "end"]]
+            s, mask = s.iloc[start:end], mask[start:end]
+        # plot kept values in blue, removed values in red
+        ax.scatter(s.index[~mask], s.to_numpy()[~mask], c="blue", alpha=0.1, s=1)
+        ax.scatter(s.index[mask], s.to_numpy()[mask], c="red", alpha=1.0, s=2)
+        ax.set_title(f"Reactor: {col}")
+        ax.set_ylabel(col)
+        if ylim is not None:
+            ax.set_ylim(ylim)
+        ax.tick_params(axis="x", labelrotation=45)
     ax = axes[-1]
-    fig = ax.get_figure()
-    fig.tight_layout()
-
+    ax.set_xlabel(df_wide.index.name)
     date_form = DateFormatter("%Y-%m-%d %H:%M")
     _ = ax.xaxis.set_major_formatter(date_form)
+    fig = ax.get_figure()
+    fig.tight_layout()
     return fig
 
 
 def plot_growth_data_w_peaks(
     df_wide: pd.DataFrame,
     peaks: pd.DataFrame,
+    colors: list[str] | None = None,
 ) -> plt.Figure:
-    """Plot optical density (OD) growth data."""
+    """Plot optical density (OD) growth data with the peaks of each reactor.
+
+    ``colors`` are the colors per reactor, by default the color cycle.
+    """
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import DateFormatter
+
     # ?check that index is datetime and columns are numeric?
 
     units = df_wide.shape[1]
+    if colors is None:
+        colors = [f"C{i}" for i in range(units)]
     fig, axes = plt.subplots(
-        units, 1, figsize=(10, 2 * units), sharex=True, squeeze=False
+        units, 1, figsize=(10, 2 * units + 1), sharex=True, squeeze=False
     )
     axes = axes.flatten()
-    df_columns = df_wide.columns
-    index_name = df_wide.index.name
     # grid container (reactive to UI changes)
-    df_wide = df_wide.reset_index()
-    for i, (col, ax) in enumerate(zip(df_columns, axes)):
-        # plot kept values in blue
-        df_wide.plot.scatter(
-            x=index_name,
-            y=col,
-            rot=45,
-            c=f"C{i}",
-            ax=ax,
-            alpha=0.1,
-            s=1,
-            title=f"Reactor: {col}",  # Customize legend text here
+    for col, ax, color in zip(df_wide.columns, axes, colors):
+        ax.scatter(df_wide.index, df_wide[col].to_numpy(), c=color, alpha=0.1, s=1)
+        ax.set_title(f"Reactor: {col}")
+        ax.set_ylabel(col)
+        ax.tick_params(axis="x", labelrotation=45)
+        if col not in peaks.columns:
+            continue
+        # all peaks of a reactor as one collection of lines
+        add_vlines(
+            ax, peaks[col].dropna().index, color="red", alpha=0.5, linestyle="--"
         )
-        # Plot removed values in red
-        peak_times = peaks[col].dropna().index
-        for timepoint in peak_times:
-            ax.axvline(x=timepoint, color="red", alpha=0.5, linestyle="--")
     ax = axes[-1]
+    ax.set_xlabel(df_wide.index.name)
     date_form = DateFormatter("%Y-%m-%d %H:%M")
     _ = ax.xaxis.set_major_formatter(date_form)
     fig = ax.get_figure()
@@ -133,6 +144,88 @@ def plot_growth_data_w_peaks(
     return fig, axes
 
 
+def _figure_to_image(fig: plt.Figure) -> bytes:
+    import matplotlib.pyplot as plt
+
+    buf = create_figure_bytes_to_download(fig, fmt="png")
+    plt.close(fig)
+    return buf.getvalue()
+
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def reactor_image_w_mask(
+    s: pd.Series, mask: pd.Series, ylim: tuple[float, float] | None = None
+) -> bytes:
+    """PNG image of the growth data of one reactor with removed values in red.
+
+    Images are cached per reactor, so only reactors with changed data, mask or
+    y-axis limits are drawn again.
+    """
+    fig = plot_growth_data_w_mask(s.to_frame(), mask.to_frame(), ylim=ylim)
+    return _figure_to_image(fig)
+
+
+@st.cache_data(max_entries=1024, show_spinner=False)
+def reactor_image_w_peaks(s: pd.Series, peaks: pd.Series, color: str) -> bytes:
+    """PNG image of the growth data of one reactor with its peaks, cached per
+    reactor."""
+    fig, _ = plot_growth_data_w_peaks(s.to_frame(), peaks.to_frame(), [color])
+    return _figure_to_image(fig)
+
+
+def growth_data_w_peaks_pdf(df_wide: pd.DataFrame, peaks: pd.DataFrame) -> bytes:
+    """PDF of :func:`plot_growth_data_w_peaks` with all reactors in one figure."""
+    import matplotlib.pyplot as plt
+
+    fig, _ = plot_growth_data_w_peaks(df_wide, peaks)
+    buf = create_figure_bytes_to_download(fig, fmt="pdf")
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def growth_data_w_mask_images(
+    df_wide: pd.DataFrame,
+    df_mask: pd.DataFrame,
+    columns: list,
+    sharey: bool = False,
+    bounds: pd.DataFrame | None = None,
+) -> dict[str, bytes]:
+    """Images of :func:`plot_growth_data_w_mask` for the selected reactors only.
+
+    With ``sharey`` all reactors (not only the selected ones) share the y-axis
+    limits.
+    """
+    ylim = None
+    if sharey:
+        values = df_wide.to_numpy(dtype=float, na_value=np.nan)
+        low, high = np.nanmin(values), np.nanmax(values)
+        margin = 0.05 * (high - low)
+        ylim = (low - margin, high + margin)
+    images = {}
+    for col in columns:
+        s, mask = df_wide[col].loc[df_mask.index], df_mask[col]
+        if bounds is not None and col in bounds.index:
+            start, end = bounds.loc[col, ["start", "end"]]
+            s, mask = s.iloc[start:end], mask.iloc[start:end]
+        images[col] = reactor_image_w_mask(s, mask, ylim)
+    return images
+
+
+def growth_data_w_peaks_images(
+    df_wide: pd.DataFrame, peaks: pd.DataFrame, columns: list
+) -> dict[str, bytes]:
+    """Images of :func:`plot_growth_data_w_peaks` for the selected reactors only.
+
+    Reactors keep the color of their position in ``df_wide``.
+    """
+    images = {}
+    for col in columns:
+        color = f"C{df_wide.columns.get_loc(col)}"
+        reactor_peaks = peaks.reindex(columns=[col])[col]
+        images[col] = reactor_image_w_peaks(df_wide[col], reactor_peaks, color)
+    return images
+
+
 def plot_fitted_data(splines, titles=None, ylabel="OD readings"):
     rows = (splines.shape[-1] + 1) // 2
     axes = splines.plot.line(
@@ -155,6 +248,8 @@ def plot_fitted_data(splines, titles=None, ylabel="OD readings"):
 
 
 def plot_derivatives(derivatives: pd.DataFrame, titles=None) -> plt.Figure:
+    from matplotlib.ticker import FormatStrFormatter
+
     rows = (derivatives.shape[-1] + 1) // 2
     axes = derivatives.plot.line(
         style=".",
@@ -181,3 +276,129 @@ def plot_derivatives(derivatives: pd.DataFrame, titles=None) -> plt.Figure:
     fig = ax.get_figure()
     fig.tight_layout()
     return fig, axes
+
+
+def add_vlines(ax: plt.Axes, x, **kwargs):
+    """Draw vertical lines at all timepoints ``x`` as one collection.
+
+    The lines span the full height of the axes. Keyword arguments are passed to
+    :class:`matplotlib.collections.LineCollection`.
+    """
+    from matplotlib.collections import LineCollection
+
+    x = ax.convert_xunits(np.asarray(x))
+    if not len(x):
+        return None
+    segments = np.zeros((len(x), 2, 2))
+    segments[:, :, 0] = np.asarray(x, dtype=float)[:, None]
+    segments[:, 1, 1] = 1.0
+    lines = LineCollection(segments, transform=ax.get_xaxis_transform(), **kwargs)
+    ax.add_collection(lines, autolim=False)
+    return lines
+
+
+def add_spans(ax: plt.Axes, start, end, **kwargs):
+    """Shade all time ranges from ``start`` to ``end`` as one collection.
+
+    The ranges span the full height of the axes. Keyword arguments are passed to
+    :class:`matplotlib.collections.PolyCollection`.
+    """
+    from matplotlib.collections import PolyCollection
+
+    start = np.asarray(ax.convert_xunits(np.asarray(start)), dtype=float)
+    end = np.asarray(ax.convert_xunits(np.asarray(end)), dtype=float)
+    if not len(start):
+        return None
+    verts = np.zeros((len(start), 4, 2))
+    verts[:, :2, 0] = start[:, None]
+    verts[:, 2:, 0] = end[:, None]
+    verts[:, 1:3, 1] = 1.0
+    spans = PolyCollection(verts, transform=ax.get_xaxis_transform(), **kwargs)
+    ax.add_collection(spans, autolim=False)
+    return spans
+
+
+def add_vlines_to_axes(axes, x: pd.Series, columns: pd.Index, **kwargs) -> None:
+    """Draw vertical lines at the timepoints ``x`` indexed by reactor (one or
+    several per reactor) on the axes of each reactor."""
+    x = x.dropna()
+    for ax, col in zip(axes, columns):
+        if col in x.index:
+            add_vlines(ax, x.loc[[col]], **kwargs)
+
+
+def add_ranges_to_axes(axes, ranges: pd.DataFrame, columns: pd.Index) -> None:
+    """Shade the high growth range of each reactor (see
+    ``piogrowth.durations.find_max_ranges``) if it is continuous (no jumps)."""
+    ranges = ranges.loc[ranges["is_continues"].fillna(False).astype(bool)]
+    for ax, col in zip(axes, columns):
+        if col in ranges.index:
+            add_spans(
+                ax,
+                ranges.loc[[col], "start"],
+                ranges.loc[[col], "end"],
+                color="gray",
+                alpha=0.2,
+            )
+
+
+def add_gaps_to_axes(axes, gaps: pd.DataFrame, columns: pd.Index) -> None:
+    """Shade gaps (see ``piogrowth.fit.find_gaps``) on the axes of each reactor."""
+    by_reactor = gaps.groupby("pioreactor_unit")
+    for ax, col in zip(axes, columns):
+        if col in by_reactor.groups:
+            group = by_reactor.get_group(col)
+            add_spans(ax, group["start"], group["end"], color="red", alpha=0.1)
+
+
+def tangent_segments(
+    df_maxima: pd.DataFrame,
+    y_min: pd.Series,
+    y_max: pd.Series,
+    index: pd.DatetimeIndex,
+) -> pd.DataFrame:
+    """End points of the tangents at µmax for all reactors at once.
+
+    The tangent of a reactor runs through the fitted value at µmax with slope
+    µmax (per second) and is limited to the range of the fitted spline
+    (``y_min`` to ``y_max``) and of the timestamps.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns ``x_start``, ``x_end`` (timestamps), ``y_start`` and ``y_end``
+        with one row per reactor with an increasing tangent.
+    """
+    df_maxima = df_maxima.loc[df_maxima["mu_max"] > 0]
+    slope = df_maxima["mu_max"].to_numpy(dtype=float)
+    y_center = df_maxima["fitted"].to_numpy(dtype=float)
+    x_center = (df_maxima["timepoint"] - index[0]).dt.total_seconds().to_numpy()
+    y_min = y_min.reindex(df_maxima.index).to_numpy(dtype=float)
+    y_max = y_max.reindex(df_maxima.index).to_numpy(dtype=float)
+    x_last = (index[-1] - index[0]).total_seconds()
+    x_start = np.clip(x_center + (y_min - y_center) / slope, 0, x_last)
+    x_end = np.clip(x_center + (y_max - y_center) / slope, 0, x_last)
+    return pd.DataFrame(
+        {
+            "x_start": index[0] + pd.to_timedelta(x_start, unit="s"),
+            "x_end": index[0] + pd.to_timedelta(x_end, unit="s"),
+            "y_start": y_center + slope * (x_start - x_center),
+            "y_end": y_center + slope * (x_end - x_center),
+        },
+        index=df_maxima.index,
+    ).dropna()
+
+
+def add_tangents_to_axes(axes, segments: pd.DataFrame, columns: pd.Index) -> None:
+    """Draw the tangents from :func:`tangent_segments` on the axes of each reactor."""
+    for ax, col in zip(axes, columns):
+        if col not in segments.index:
+            continue
+        row = segments.loc[col]
+        x = ax.convert_xunits(np.array([row.x_start, row.x_end], dtype="M8[ns]"))
+        ax.plot(
+            x,
+            [row.y_start, row.y_end],
+            color="blue",
+            linestyle="--",
+        )
@@ -1,5 +1,15 @@
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING
+
 import streamlit as st
 
+if TYPE_CHECKING:
+    from piogrowth.cache import ColumnCache
+    from piogrowth.fit import TimeAxis
+    from piogrowth.jobs import Job, JobRunner
+
 
 def is_data_available(key):
     """Check that pioreactor data was uploaded."""
@@ -27,3 +37,121 @@ def render_markdown(fpath: str):
     with open(fpath, "r") as f:
         about_content = f.read()
     st.write(about_content)
+
+
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    """Background job runner with one worker pool shared across all sessions."""
+    from piogrowth.jobs import JobRunner
+
+    return JobRunner(cache=get_column_cache())
+
+
+@st.cache_resource
+def get_column_cache() -> ColumnCache:
+    """Per reactor cache of filter and fit results shared across all sessions."""
+    from piogrowth.cache import ColumnCache
+
+    return ColumnCache()
+
+
+def get_time_axis(key: str = "df_rolling") -> TimeAxis:
+    """Time axis of wide data in session state, stored under ``{key}_axis``.
+
+    It is computed again only if the data was replaced (e.g. by reopening a saved
+    analysis).
+    """
+    from piogrowth.fit import time_axis
+
+    df = st.session_state[key]
+    axis = st.session_state.get(f"{key}_axis")
+    if axis is None or axis.index is not df.index:
+        axis = time_axis(df)
+        st.session_state[f"{key}_axis"] = axis
+    return axis
+
+
+def select_page(items, key: str, per_page: int = 12) -> list:
+    """Items on the selected page, with a page selector for more than one page."""
+    items = list(items)
+    n_pages = -(-len(items) // per_page)
+    if n_pages <= 1:
+        return items
+    page = st.number_input(
+        f"Page of reactors (1 to {n_pages}, {per_page} reactors per page)",
+        min_value=1,
+        max_value=n_pages,
+        value=1,
+        step=1,
+        key=key,
+    )
+    start = (page - 1) * per_page
+    return items[start : start + per_page]
+
+
+def show_images(images: dict[str, bytes], n_columns: int = 1):
+    """Show images (e.g. one per reactor) in a grid of ``n_columns`` columns."""
+    images = list(images.values())
+    for start in range(0, len(images), n_columns):
+        for column, image in zip(
+            st.columns(n_columns), images[start : start + n_columns]
+        ):
+            column.image(image, use_container_width=True)
+
+
+def get_session_id() -> str:
+    """Identifier of the current user session, used for fair job queuing."""
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "default"
+
+
+def show_job_metrics():
+    """Show queue depth and latencies of the shared worker pool in the sidebar."""
+    metrics = get_job_runner().scheduler.metrics()
+    with st.sidebar.expander("Job queue"):
+        st.write(
+            f"Queued reactor fits: {metrics['queue_depth']:,d} "
+            f"(running: {metrics['in_flight']}/{metrics['max_workers']})"
+        )
+        st.write(
+            f"Waiting time: {metrics['wait_mean']:.2f}s on average, "
+            f"{metrics['wait_p95']:.2f}s (95th percentile)"
+        )
+        st.write(
+            f"Fitting time: {metrics['run_mean']:.2f}s on average, "
+            f"{metrics['run_p95']:.2f}s (95th percentile)"
+        )
+        st.write(
+            f"Completed: {metrics['completed']:,d}, failed: {metrics['failed']:,d}, "
+            f"cancelled: {metrics['cancelled']:,d}, "
+            f"deduplicated: {metrics['deduplicated']:,d}"
+        )
+
+
+def wait_for_job(job: Job, label: str = "Fitting"):
+    """Show the progress per reactor until the job is finished and return its
+    result. A rerun while waiting picks up the same job again. Stops the page with
+    an error message if the job was cancelled or failed."""
+    if not job.done():
+        progress_bar = st.progress(job.progress)
+        while not job.done():
+            progress_bar.progress(
+                job.progress, text=f"{label}: {job.n_done}/{job.n_total} reactors"
+            )
+            time.sleep(0.2)
+        progress_bar.empty()
+    if job.cancelled():
+        st.error(f"{label} was cancelled. Rerun the page to submit it again.")
+        st.stop()
+    errors = job.errors()
+    if errors:
+        st.error(
+            f"{label} failed for {len(errors)} of {job.n_total} reactors:\n\n"
+            + "\n".join(
+                f"- {name}: {type(e).__name__}: {e}" for name, e in errors.items()
+            )
+        )
+        st.stop()
+    return job.result()
@@ -1,11 +1,18 @@
 # The __init__.py file is loaded when the package is loaded.
 # It is used to indicate that the directory in which it resides is a Python package
+import importlib
 from importlib import metadata
 
-from . import filter, load
-
 __version__ = metadata.version("piogrowth")
 
 # The __all__ variable is a list of variables which are imported
 # when a user does "from example import *"
-__all__ = ["load", "filter"]
+__all__ = ["load", "filter", "store", "transform", "trim", "export"]
+
+
+def __getattr__(name: str):
+    # submodules are imported on first access (PEP 562), so that importing the
+    # package, e.g. for the version, does not import pandas, numpy or scipy
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,206 @@
+"""Cache results of column-wise stages per reactor.
+
+Filtering and smoothing treat each reactor (column of the wide data) on its own.
+A :class:`ColumnCache` keeps the output of such a stage per column, keyed by a
+hash of the column's values, the shared time index and the parameters. Changing
+the data or the parameters of one reactor (e.g. its time window) then only
+recomputes that reactor's column, the results of all other reactors are reused.
+The cache is bounded by the memory of the cached results.
+
+The :class:`~piogrowth.jobs.JobRunner` uses the same cache for the results of its
+tasks (one per reactor), so fits of unchanged reactors are not repeated either.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Mapping, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+_MISSING = object()
+
+
+def _nbytes(obj: Any) -> int:
+    """Approximate memory used by a cached result.
+
+    The index of a Series is not counted, cached columns share it with the data.
+    """
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=False, deep=True))
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=False, deep=True).sum())
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, (tuple, list)):
+        return sum(_nbytes(item) for item in obj)
+    if isinstance(obj, dict):
+        return sum(_nbytes(k) + _nbytes(v) for k, v in obj.items())
+    if hasattr(obj, "__dict__"):
+        # e.g. scipy.interpolate.BSpline
+        return _nbytes(vars(obj))
+    return sys.getsizeof(obj)
+
+
+def _hash_values(obj: pd.Index | pd.Series) -> bytes:
+    return pd.util.hash_pandas_object(obj, index=False).to_numpy().tobytes()
+
+
+class ColumnCache:
+    """Least recently used cache of stage outputs per column.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Memory the cached results may use, by default 256 MiB. The least
+        recently used results are removed first.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 2**20):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._results: OrderedDict[str, tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Cached result for a key, ``default`` if there is none."""
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._results.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any):
+        """Cache a result and remove the least recently used ones above the bound."""
+        size = _nbytes(value)
+        with self._lock:
+            if key in self._results:
+                self.nbytes -= self._results.pop(key)[1]
+            self._results[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                self.nbytes -= self._results.popitem(last=False)[1][1]
+
+    def column_keys(
+        self,
+        stage: str,
+        df: pd.DataFrame,
+        params: Any = (),
+        column_params: Mapping[Any, Any] | None = None,
+    ) -> dict[Any, str]:
+        """Key per column from the stage name, parameters, index and column values."""
+        h = hashlib.sha256(f"{stage}:{params!r}".encode())
+        h.update(_hash_values(df.index))
+        keys = {}
+        for col in df.columns:
+            h_col = h.copy()
+            h_col.update(repr(col).encode())
+            if column_params is not None:
+                h_col.update(repr(column_params.get(col)).encode())
+            h_col.update(_hash_values(df[col]))
+            keys[col] = h_col.hexdigest()
+        return keys
+
+    def apply(
+        self,
+        stage: str,
+        func: Callable[[pd.DataFrame], NamedTuple],
+        df: pd.DataFrame,
+        params: Any = (),
+        column_params: Mapping[Any, Any] | None = None,
+    ) -> NamedTuple:
+        """Run a column-wise stage only for the columns without cached results.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage, part of the keys.
+        func : Callable[[pd.DataFrame], NamedTuple]
+            Stage applied to a subset of the columns of ``df``. It returns a
+            namedtuple of DataFrames with one column per input column (indices
+            may differ between the fields).
+        df : pd.DataFrame
+            Wide data (timepoints x reactors).
+        params : Any, optional
+            Parameters of the stage with a deterministic ``repr``.
+        column_params : Mapping, optional
+            Additional parameters per column, e.g. the row bounds of a reactor.
+
+        Returns
+        -------
+        NamedTuple
+            The output of ``func`` for all columns of ``df``.
+        """
+        keys = self.column_keys(stage, df, params, column_params)
+        cached = {}
+        for col, key in keys.items():
+            entry = self.get(key, _MISSING)
+            if entry is not _MISSING:
+                cached[col] = entry
+        missing = [col for col in df.columns if col not in cached]
+        if missing or not len(df.columns):
+            result = func(df[missing])
+            computed = {
+                col: (type(result), tuple(field[col].copy() for field in result))
+                for col in missing
+            }
+            for col, entry in computed.items():
+                self.put(keys[col], entry)
+            if not cached:
+                return result
+            cached.update(computed)
+        result_type = next(iter(cached.values()))[0]
+        fields = []
+        for i in range(len(result_type._fields)):
+            field = pd.concat([cached[col][1][i] for col in df.columns], axis=1)
+            field.columns = df.columns
+            fields.append(field)
+        return result_type._make(fields)
+
+    def apply_columns(
+        self,
+        stage: str,
+        func: Callable[[pd.DataFrame], Mapping[Any, Any]],
+        df: pd.DataFrame,
+        params: Any = (),
+        column_params: Mapping[Any, Any] | None = None,
+    ) -> dict[Any, Any]:
+        """Like :meth:`apply` for stages returning one object per column.
+
+        ``func`` returns a mapping from the columns of its input to their
+        results, e.g. the fitted splines of
+        :func:`~piogrowth.fit.fit_whittaker_splines`.
+
+        Returns
+        -------
+        dict
+            The result of each column of ``df``.
+        """
+        keys = self.column_keys(stage, df, params, column_params)
+        results = {}
+        for col, key in keys.items():
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                results[col] = value
+        missing = [col for col in df.columns if col not in results]
+        if missing:
+            computed = func(df[missing])
+            for col in missing:
+                self.put(keys[col], computed[col])
+                results[col] = computed[col]
+        return {col: results[col] for col in df.columns}
+
+    def clear(self):
+        """Remove all cached results."""
+        with self._lock:
+            self._results.clear()
+            self.nbytes = 0
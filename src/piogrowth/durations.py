@@ -1,5 +1,8 @@
 """Operate on boolean series with a timestamp index."""
 
+from collections import namedtuple
+
+import numpy as np
 import pandas as pd
 
 
@@ -50,3 +53,92 @@ def find_max_range(s: pd.Series):
         [s_min, s_max, duration, continues],
         index=["start", "end", "duration", "is_continues"],
     )
+
+
+ThresholdIndex = namedtuple(
+    "ThresholdIndex",
+    ["index", "columns", "maximum", "prefix_max", "suffix_max", "sorted_values"],
+)
+
+
+def threshold_index(df: pd.DataFrame) -> ThresholdIndex:
+    """Index wide data (e.g. derivatives) once for queries of time ranges above
+    many thresholds, see :func:`find_max_ranges`.
+
+    Per column, the running maximum from the start and from the end and the sorted
+    values are stored. The first and last timepoint at or above a threshold and
+    the number of values at or above it are then binary searches. Missing values
+    never exceed a threshold.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Wide data with timestamps as index, e.g. first derivatives of splines.
+
+    Returns
+    -------
+    ThresholdIndex
+        Arrays of shape (timepoints x columns) and the maximum per column.
+    """
+    values = df.to_numpy(dtype=float, na_value=np.nan, copy=True)
+    values[np.isnan(values)] = -np.inf
+    return ThresholdIndex(
+        index=df.index,
+        columns=df.columns,
+        maximum=df.max().to_numpy(dtype=float, na_value=np.nan),
+        prefix_max=np.maximum.accumulate(values, axis=0),
+        # reversed, so that it is sorted in ascending order as well
+        suffix_max=np.maximum.accumulate(values[::-1], axis=0),
+        sorted_values=np.sort(values, axis=0),
+    )
+
+
+def find_max_ranges(tidx: ThresholdIndex, proportions) -> pd.DataFrame:
+    """Time ranges at or above proportions of the maximum for all columns.
+
+    The result for a proportion is the same as applying :func:`find_max_range` to
+    ``df.ge(df.max() * proportion, axis=1)``, but takes a few binary searches
+    per column instead of passes over the data.
+
+    Parameters
+    ----------
+    tidx : ThresholdIndex
+        Index created by :func:`threshold_index`.
+    proportions : float or array-like of float
+        Proportions of the maximum per column, e.g. 0.9 for 90% of µmax.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns ``start``, ``end``, ``duration`` and ``is_continues`` with the
+        columns of the indexed data as index, or with a MultiIndex of proportion
+        and column if several proportions are given.
+    """
+    scalar = np.ndim(proportions) == 0
+    proportions = np.atleast_1d(np.asarray(proportions, dtype=float))
+    n = len(tidx.index)
+    # cutoffs of shape (proportions x columns)
+    cutoffs = np.outer(proportions, tidx.maximum)
+    first, last, n_above = (np.empty(cutoffs.shape, dtype=int) for _ in range(3))
+    for i in range(cutoffs.shape[1]):
+        first[:, i] = np.searchsorted(tidx.prefix_max[:, i], cutoffs[:, i])
+        last[:, i] = n - 1 - np.searchsorted(tidx.suffix_max[:, i], cutoffs[:, i])
+        n_above[:, i] = n - np.searchsorted(tidx.sorted_values[:, i], cutoffs[:, i])
+    found = ((first < n) & ~np.isnan(cutoffs)).ravel()
+    first, last, n_above = first.ravel(), last.ravel(), n_above.ravel()
+    start = pd.DatetimeIndex(tidx.index[np.where(found, first, 0)]).where(found)
+    end = pd.DatetimeIndex(tidx.index[np.where(found, last, 0)]).where(found)
+    is_continues = pd.array(n_above == last - first + 1, dtype="boolean")
+    is_continues[~found] = pd.NA
+    df = pd.DataFrame(
+        {
+            "start": start,
+            "end": end,
+            "duration": end - start,
+            "is_continues": is_continues,
+        },
+        index=pd.MultiIndex.from_product([proportions, tidx.columns]),
+    )
+    if scalar:
+        return df.droplevel(0)
+    return df.rename_axis(["proportion", "column"])
@@ -0,0 +1,167 @@
+"""Export all results of an analysis as one archive of Parquet tables.
+
+The archive is a zip file holding
+
+- one compressed Parquet file per table (wide frames with the time index as the
+  first column, summary tables with their index as leading columns) and
+- a ``manifest.json`` describing all tables and the analysis parameters.
+
+Tables are encoded in row groups of ``chunk_rows`` rows which are written one
+after the other into the archive, directly from the columns of the frames without
+copying them. :func:`export_to_temporary_file` writes the archive to a temporary
+file on disk, so it is never held in memory as a whole.
+"""
+
+from __future__ import annotations
+
+import json
+import tempfile
+import zipfile
+from typing import IO
+
+import pandas as pd
+
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+
+
+def _import_parquet():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Exporting Parquet tables requires pyarrow: pip install 'piogrowth[arrow]'"
+        ) from e
+    return pa, pq
+
+
+def _index_names(df: pd.DataFrame) -> list[str]:
+    return [f"level_{i}" if n is None else str(n) for i, n in enumerate(df.index.names)]
+
+
+def _record_batch(pa, df: pd.DataFrame, schema=None):
+    """Arrow record batch of the index levels and columns of a DataFrame.
+
+    Columns are converted one at a time from their values, so unlike
+    ``reset_index`` the frame is not copied. Without ``schema`` the types are
+    inferred, otherwise the values are converted to the types of the schema.
+    """
+    values = [df.index.get_level_values(i) for i in range(df.index.nlevels)]
+    values += [df.iloc[:, j] for j in range(df.shape[1])]
+    names = _index_names(df) + [str(col) for col in df.columns]
+    types = [None] * len(values) if schema is None else schema.types
+    arrays = [pa.array(v, type=t, from_pandas=True) for v, t in zip(values, types)]
+    return pa.RecordBatch.from_arrays(arrays, names=names)
+
+
+def write_parquet(
+    fileobj: IO[bytes],
+    df: pd.DataFrame,
+    chunk_rows: int = 50_000,
+    compression: str = "zstd",
+) -> dict:
+    """Write a DataFrame to a Parquet file in row groups of ``chunk_rows`` rows.
+
+    The index levels are written as leading columns. Only one row group is
+    converted and encoded at a time.
+
+    Returns
+    -------
+    dict
+        Metadata of the table for the manifest.
+    """
+    pa, pq = _import_parquet()
+    batch = _record_batch(pa, df.iloc[:chunk_rows])
+    with pq.ParquetWriter(fileobj, batch.schema, compression=compression) as writer:
+        writer.write_batch(batch)
+        for start in range(chunk_rows, len(df), chunk_rows):
+            chunk = df.iloc[start : start + chunk_rows]
+            writer.write_batch(_record_batch(pa, chunk, batch.schema))
+    return {
+        "rows": len(df),
+        "columns": batch.schema.names,
+        "index": _index_names(df),
+    }
+
+
+def export_archive(
+    fileobj: IO[bytes],
+    tables: dict[str, pd.DataFrame],
+    params: dict | None = None,
+    chunk_rows: int = 50_000,
+    compression: str = "zstd",
+) -> dict:
+    """Write tables and parameters of an analysis as zip archive of Parquet files.
+
+    Parameters
+    ----------
+    fileobj : IO[bytes]
+        Writable binary file (object), e.g. an open file or a spooled temporary file.
+    tables : dict[str, pd.DataFrame]
+        Wide frames and summary tables by name. ``None`` values are skipped.
+    params : dict, optional
+        JSON serializable analysis parameters.
+    chunk_rows : int, optional
+        Rows per Parquet row group, by default 50_000.
+    compression : str, optional
+        Parquet compression codec, by default "zstd". The Parquet files are
+        stored in the zip archive without compressing them again.
+
+    Returns
+    -------
+    dict
+        The manifest written to the archive.
+    """
+    manifest = {"format_version": FORMAT_VERSION, "params": params or {}, "tables": {}}
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_STORED) as zf:
+        for name, df in tables.items():
+            if df is None:
+                continue
+            fname = f"{name}.parquet"
+            with zf.open(fname, "w", force_zip64=True) as f:
+                meta = write_parquet(
+                    f, df, chunk_rows=chunk_rows, compression=compression
+                )
+            manifest["tables"][name] = {"file": fname, **meta}
+        zf.writestr(MANIFEST, json.dumps(manifest, indent=2, default=str))
+    return manifest
+
+
+def export_to_temporary_file(
+    tables: dict[str, pd.DataFrame],
+    params: dict | None = None,
+    **kwargs,
+) -> IO[bytes]:
+    """Export to a temporary file on disk, which is removed once it is closed.
+    The file is rewound for reading.
+
+    Keyword arguments are passed to :func:`export_archive`.
+    """
+    fileobj = tempfile.TemporaryFile()
+    try:
+        export_archive(fileobj, tables, params=params, **kwargs)
+    except BaseException:
+        fileobj.close()
+        raise
+    fileobj.seek(0)
+    return fileobj
+
+
+def read_archive(fileobj: IO[bytes] | str) -> tuple[dict[str, pd.DataFrame], dict]:
+    """Read all tables and the parameters of an archive from :func:`export_archive`.
+
+    Returns
+    -------
+    tuple[dict[str, pd.DataFrame], dict]
+        Tables with their index restored, and the analysis parameters.
+    """
+    _, pq = _import_parquet()
+    tables = {}
+    with zipfile.ZipFile(fileobj) as zf:
+        manifest = json.loads(zf.read(MANIFEST))
+        for name, meta in manifest["tables"].items():
+            with zf.open(meta["file"]) as f:
+                df = pq.read_table(f).to_pandas()
+            tables[name] = df.set_index(meta["index"])
+    return tables, manifest["params"]
@@ -1,5 +1,17 @@
+from __future__ import annotations
+
+import enum
+import functools
+import warnings
+from collections import namedtuple
+
 import numpy as np
+import numpy.typing as npt
 import pandas as pd
+from pandas.api.indexers import BaseIndexer
+
+from .cache import ColumnCache
+from .trim import bounds_mask
 
 
 def out_of_iqr(s: pd.Series, factor: float = 1.5) -> pd.Series:
@@ -16,3 +28,376 @@ def out_of_iqr(s: pd.Series, factor: float = 1.5) -> pd.Series:
     # center point out of IQR?
 
     return (center < lower_bound) | (center > upper_bound)
+
+
+class CenteredTimeWindowIndexer(BaseIndexer):
+    """Centered windows of a fixed duration for (irregularly spaced) timepoints.
+
+    The window of each timepoint contains all timepoints at most half the window
+    duration before or after it. Window bounds are computed once using binary
+    search, so all rolling aggregations on the same data reuse them.
+    Use :func:`centered_time_window` to create an indexer.
+    """
+
+    def __init__(self, index_array: np.ndarray, window_size: float, **kwargs):
+        super().__init__(index_array=index_array, window_size=window_size, **kwargs)
+        half = window_size / 2
+        self._start = np.searchsorted(index_array, index_array - half, side="left")
+        self._end = np.searchsorted(index_array, index_array + half, side="right")
+
+    def get_window_bounds(
+        self,
+        num_values: int = 0,
+        min_periods: int | None = None,
+        center: bool | None = None,
+        closed: str | None = None,
+        step: int | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        return self._start.astype(np.int64), self._end.astype(np.int64)
+
+
+def centered_time_window(
+    index: pd.DatetimeIndex, window: float
+) -> CenteredTimeWindowIndexer:
+    """Create centered windows of ``window`` seconds for a sorted DatetimeIndex."""
+    x = (index - index[0]).total_seconds().to_numpy()
+    return CenteredTimeWindowIndexer(index_array=x, window_size=window)
+
+
+RollingIQR = namedtuple("RollingIQR", ["q1", "median", "q3"])
+
+
+def rolling_iqr(df: pd.DataFrame, window: float, min_periods: int = 5) -> RollingIQR:
+    """Rolling quartiles in centered time windows for all columns at once.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Wide data with a sorted DatetimeIndex.
+    window : float
+        Duration of the window in seconds.
+    min_periods : int, optional
+        Minimum number of non-missing values in a window, by default 5
+
+    Returns
+    -------
+    RollingIQR
+        First quartile, median and third quartile as DataFrames like ``df``.
+    """
+    rolling = df.rolling(
+        centered_time_window(df.index, window), min_periods=min_periods
+    )
+    return RollingIQR(rolling.quantile(0.25), rolling.median(), rolling.quantile(0.75))
+
+
+def default_window(index: pd.DatetimeIndex, n_rows: int = 31) -> float:
+    """Duration in seconds spanning ``n_rows`` rows of wide data at the median
+    spacing of the timestamps, i.e. the time based equivalent of a rolling window
+    of ``n_rows`` rows."""
+    if len(index) < 2:
+        return float(n_rows)
+    step = np.median(np.diff((index - index[0]).total_seconds().to_numpy()))
+    return float(n_rows * step)
+
+
+def rolling_median(
+    df: pd.DataFrame, window: float, min_periods: int = 5
+) -> pd.DataFrame:
+    """Rolling median in centered time windows of ``window`` seconds."""
+    return df.rolling(
+        centered_time_window(df.index, window), min_periods=min_periods
+    ).median()
+
+
+def out_of_rolling_iqr(
+    df: pd.DataFrame, window: float, factor: float = 1.5, min_periods: int = 5
+) -> pd.DataFrame:
+    """Return a boolean DataFrame indicating whether each value is an outlier based
+    on the IQR of the centered time window of ``window`` seconds around it.
+
+    Vectorized version of applying :func:`out_of_iqr` to rolling windows.
+    Missing values and windows with less than ``min_periods`` values are no outliers.
+    """
+    # nullable dtypes would propagate missing values into the mask
+    df = df.astype(float)
+    stats = rolling_iqr(df, window, min_periods=min_periods)
+    iqr = stats.q3 - stats.q1
+    return (df < stats.q1 - factor * iqr) | (df > stats.q3 + factor * iqr)
+
+
+def _window_medians(
+    values: np.ndarray,
+    start: np.ndarray,
+    end: np.ndarray,
+    rows: np.ndarray,
+    cols: np.ndarray,
+) -> np.ndarray:
+    """Median of the windows of the given rows of ``values``, one per column."""
+    width = int((end - start).max(initial=0))
+    positions = start[rows, None] + np.arange(width)
+    windows = values[np.minimum(positions, len(values) - 1), cols[:, None]]
+    windows[positions >= end[rows, None]] = np.nan
+    with warnings.catch_warnings():
+        # windows without any values
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nanmedian(windows, axis=1)
+
+
+def _affected_windows(
+    changed: np.ndarray, start: np.ndarray, end: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """Rows and columns of all windows containing a changed value."""
+    rows, cols = np.nonzero(changed)
+    # windows [start, end) are sorted, so windows containing a row are contiguous
+    first = np.searchsorted(end, rows, side="right")
+    lengths = np.searchsorted(start, rows, side="right") - first
+    offsets = np.repeat(first - np.cumsum(lengths) + lengths, lengths)
+    flat = np.unique(
+        (offsets + np.arange(lengths.sum())) * changed.shape[1]
+        + np.repeat(cols, lengths)
+    )
+    return np.divmod(flat, changed.shape[1])
+
+
+def _block_medians(
+    values: np.ndarray, index: pd.DatetimeIndex, duration: float, min_periods: int
+) -> np.ndarray:
+    """Median per column in consecutive blocks of ``duration`` seconds, repeated
+    for all rows of a block."""
+    seconds = (index - index[0]).total_seconds().to_numpy()
+    blocks = (seconds // duration).astype(np.int64)
+    codes = np.searchsorted(np.unique(blocks), blocks)
+    grouped = pd.DataFrame(values, copy=False).groupby(codes)
+    medians = grouped.median().where(grouped.count() >= min_periods)
+    return medians.to_numpy()[codes]
+
+
+def out_of_robust_residuals(
+    df: pd.DataFrame,
+    window: float,
+    factor: float = 5.0,
+    scale_window: float | None = None,
+    max_iter: int = 5,
+    min_periods: int = 5,
+) -> pd.DataFrame:
+    """Return a boolean DataFrame indicating outliers by their residuals to a
+    robust smoother, iteratively for all columns at once.
+
+    The smoother is a rolling median over a short centered time window of
+    ``window`` seconds, which follows sharp drops (dilutions) closely. Values
+    whose residual exceeds ``factor`` times the local scale of the residuals
+    (scaled median absolute deviation in consecutive blocks of ``scale_window``
+    seconds) are outliers. Outliers are replaced by the smoothed values and the
+    smoother is updated, until no outliers change or for ``max_iter`` passes.
+    Replacing instead of removing outliers keeps the windows balanced, so
+    outliers do not spread along steep slopes. After the first pass, only the
+    windows containing replaced values are computed again.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Wide data with a sorted DatetimeIndex.
+    window : float
+        Duration of the smoother window in seconds, e.g. 11 rows (see
+        :func:`default_window`).
+    factor : float, optional
+        Multiple of the scaled MAD beyond which values are outliers, by default 5.0
+    scale_window : float, optional
+        Duration of the blocks for the local scale in seconds, by default ten
+        times ``window``. The noise of OD readings grows with the OD.
+    max_iter : int, optional
+        Maximum number of smoothing passes, by default 5
+    min_periods : int, optional
+        Minimum number of residuals in a block to estimate its scale, by default 5
+
+    Returns
+    -------
+    pd.DataFrame
+        Outliers like ``df``. Missing values are no outliers.
+    """
+    if scale_window is None:
+        scale_window = 10 * window
+    values = df.to_numpy(dtype=float, na_value=np.nan)
+    indexer = centered_time_window(df.index, window)
+    start, end = indexer.get_window_bounds(len(values))
+    smoothed = (
+        pd.DataFrame(values, index=df.index, copy=False)
+        .rolling(indexer, min_periods=1)
+        .median()
+        .to_numpy(copy=True)
+    )
+    # local scale from the first pass, the median ignores the outliers
+    scale = 1.4826 * _block_medians(
+        np.abs(values - smoothed), df.index, scale_window, min_periods
+    )
+    cleaned = values
+    outliers = np.zeros(values.shape, dtype=bool)
+    for _ in range(max_iter):
+        with np.errstate(invalid="ignore"):
+            found = (np.abs(values - smoothed) > factor * scale) & (scale > 0)
+        if np.array_equal(found, outliers):
+            break
+        outliers = found
+        updated = np.where(outliers, smoothed, values)
+        changed = (updated != cleaned) & ~(np.isnan(updated) & np.isnan(cleaned))
+        cleaned = updated
+        rows, cols = _affected_windows(changed, start, end)
+        smoothed[rows, cols] = _window_medians(cleaned, start, end, rows, cols)
+    return pd.DataFrame(outliers, index=df.index, columns=df.columns)
+
+
+class FilterReason(enum.IntFlag):
+    """Bit flags encoding why a value was filtered."""
+
+    NEGATIVE = 1
+    QUANTILE = 2
+    IQR = 4
+    MAD = 8
+
+
+FilterResult = namedtuple(
+    "FilterResult", ["filtered", "flags", "rolling_median", "counts"]
+)
+
+
+class FilterPipeline:
+    """Filter wide OD data and compute the rolling median in one go.
+
+    The values are copied once into a float array. Each enabled filter sets the
+    removed values to NaN in place and records its reason as bit flag, so that
+    later filters operate on the already filtered values.
+
+    Parameters
+    ----------
+    remove_negative : bool, optional
+        Remove negative OD readings, by default False
+    quantile_max : float, optional
+        Remove values above this quantile per reactor, by default None (disabled)
+    iqr_factor : float, optional
+        Remove values outside ``iqr_factor`` times the IQR of the rolling window
+        around them, by default None (disabled)
+    window : float, optional
+        Duration of the centered rolling window in seconds, by default 31.0
+    mad_factor : float, optional
+        Remove values with residuals to a robust smoother beyond ``mad_factor``
+        times the local scaled MAD (see :func:`out_of_robust_residuals`), by
+        default None (disabled)
+    mad_window : float, optional
+        Duration of the smoother window in seconds for ``mad_factor``, by
+        default the duration of 11 rows (see :func:`default_window`)
+    min_periods : int, optional
+        Minimum number of values in a rolling window, by default 5
+    dtype : dtype, optional
+        Float type of the filtered data and rolling median, by default float
+        (float64). ``np.float32`` halves the memory, spline fits upcast the
+        values again (see :func:`piogrowth.precision.compare_precision`).
+    """
+
+    def __init__(
+        self,
+        remove_negative: bool = False,
+        quantile_max: float | None = None,
+        iqr_factor: float | None = None,
+        window: float = 31.0,
+        mad_factor: float | None = None,
+        mad_window: float | None = None,
+        min_periods: int = 5,
+        dtype: npt.DTypeLike = float,
+    ):
+        self.remove_negative = remove_negative
+        self.quantile_max = quantile_max
+        self.iqr_factor = iqr_factor
+        self.window = window
+        self.mad_factor = mad_factor
+        self.mad_window = mad_window
+        self.min_periods = min_periods
+        self.dtype = np.dtype(dtype)
+
+    def run(
+        self,
+        df: pd.DataFrame,
+        bounds: pd.DataFrame | None = None,
+        cache: ColumnCache | None = None,
+    ) -> FilterResult:
+        """Apply the filters to wide data (timepoints x reactors).
+
+        Values outside of the row ``bounds`` per reactor (see
+        :mod:`piogrowth.trim`) are set to NaN without being flagged.
+
+        All filters act on each reactor on its own. With a ``cache``, only the
+        reactors whose values, bounds or the filter parameters changed since an
+        earlier run are filtered again.
+
+        Returns
+        -------
+        FilterResult
+            Filtered data, reason coded mask (uint8 bit flags of
+            :class:`FilterReason`), rolling median of the filtered data and the
+            number of removed values per reason (rows) and reactor (columns).
+        """
+        if cache is not None:
+            column_bounds = None
+            if bounds is not None:
+                column_bounds = {
+                    col: tuple(row) for col, row in zip(bounds.index, bounds.to_numpy())
+                }
+            return cache.apply(
+                "filter_pipeline",
+                functools.partial(self.run, bounds=bounds),
+                df,
+                params=sorted(vars(self).items()),
+                column_params=column_bounds,
+            )
+        values = df.to_numpy(dtype=self.dtype, na_value=np.nan, copy=True)
+        if bounds is not None:
+            values[~bounds_mask(len(values), bounds, df.columns)] = np.nan
+        flags = np.zeros(values.shape, dtype=np.uint8)
+        # frame sharing memory with values for rolling window computations
+        df_values = pd.DataFrame(values, index=df.index, columns=df.columns, copy=False)
+
+        def _remove(mask: np.ndarray, reason: FilterReason):
+            flags[mask] |= np.uint8(reason)
+            values[mask] = np.nan
+
+        if self.remove_negative:
+            _remove(values < 0, FilterReason.NEGATIVE)
+        if self.quantile_max is not None:
+            with warnings.catch_warnings():
+                # reactors without any values
+                warnings.simplefilter("ignore", category=RuntimeWarning)
+                upper = np.nanquantile(values, self.quantile_max, axis=0)
+            _remove(values > upper, FilterReason.QUANTILE)
+        if self.iqr_factor is not None:
+            stats = rolling_iqr(df_values, self.window, min_periods=self.min_periods)
+            q1, q3 = stats.q1.to_numpy(), stats.q3.to_numpy()
+            iqr = q3 - q1
+            _remove(
+                (values < q1 - self.iqr_factor * iqr)
+                | (values > q3 + self.iqr_factor * iqr),
+                FilterReason.IQR,
+            )
+        if self.mad_factor is not None:
+            outliers = out_of_robust_residuals(
+                df_values,
+                self.mad_window or default_window(df.index, n_rows=11),
+                factor=self.mad_factor,
+                min_periods=self.min_periods,
+            )
+            _remove(outliers.to_numpy(), FilterReason.MAD)
+        # pandas computes rolling statistics in float64
+        df_rolling = rolling_median(
+            df_values, self.window, min_periods=self.min_periods
+        ).astype(self.dtype)
+        counts = pd.DataFrame(
+            {
+                reason.name: ((flags & reason) > 0).sum(axis=0)
+                for reason in FilterReason
+            },
+            index=df.columns,
+        ).T
+        return FilterResult(
+            df_values,
+            pd.DataFrame(flags, index=df.index, columns=df.columns, copy=False),
+            df_rolling,
+            counts,
+        )
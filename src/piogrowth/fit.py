@@ -1,10 +1,28 @@
+from __future__ import annotations
+
+import functools
 from collections import namedtuple
 
 import numpy as np
 import pandas as pd
-from scipy.interpolate import make_splrep, splev
+
+from .parallel import map_parallel
 
 SmoothingRange = namedtuple("SmoothingRange", ["s_min", "s", "s_max"])
+FittedSpline = namedtuple("FittedSpline", ["spline", "start", "end"])
+TimeAxis = namedtuple("TimeAxis", ["index", "seconds", "valid"])
+
+SEGMENT_COLUMNS = [
+    "segment_start",
+    "segment_end",
+    "timepoint",
+    "mu_max",
+    "OD_at_max",
+    "OD_spline_at_max",
+    "specific_growth_rate",
+    "doubling_time",
+    "r2",
+]
 
 
 def get_smoothing_range(m: int):
@@ -16,11 +34,161 @@ def get_smoothing_range(m: int):
     return s
 
 
+def time_axis(df: pd.DataFrame, seconds: np.ndarray | None = None) -> TimeAxis:
+    """Time axis shared by all reactors (columns) of wide data.
+
+    The timestamps are converted to seconds once, so fits and evaluations of
+    many reactors (or segments) only need to slice or shift float arrays.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Wide data with timestamps as index and reactors as columns.
+    seconds : np.ndarray, optional
+        Seconds of the time axis of data with the same index, e.g. before values
+        were masked, used instead of converting the timestamps again.
+
+    Returns
+    -------
+    TimeAxis
+        The ``index``, the float64 ``seconds`` since the first timepoint and a
+        dictionary of the (integer) positions of non-missing values per reactor
+        (``valid``).
+    """
+    index = df.index
+    if seconds is None:
+        seconds = (index - index[0]).total_seconds().to_numpy(dtype=float)
+    elif len(seconds) != len(index):
+        raise ValueError("seconds need to have the length of the index of df.")
+    notna = df.notna().to_numpy()
+    valid = {col: np.flatnonzero(notna[:, i]) for i, col in enumerate(df.columns)}
+    return TimeAxis(index, seconds, valid)
+
+
+def column_axis(axis: TimeAxis, s: pd.Series) -> TimeAxis:
+    """Time axis of one column (or a piece of it) of the wide data.
+
+    Only the seconds and valid positions of ``s`` are kept, e.g. to send a fit of
+    one reactor to a worker process together with ``s``.
+    """
+    start = axis.index.searchsorted(s.index[0]) if len(s) else 0
+    end = start + len(s)
+    valid = axis.valid[s.name]
+    valid = valid[(valid >= start) & (valid < end)] - start
+    return TimeAxis(s.index, axis.seconds[start:end], {s.name: valid})
+
+
+def _make_spline(x: np.ndarray, y: np.ndarray, smoothing_factor: float):
+    from scipy.interpolate import make_splrep
+
+    if len(x) < 4:
+        raise ValueError(
+            "Not enough data points to fit a spline. Need at least 4 non-NaN values."
+        )
+    return make_splrep(x, y, s=smoothing_factor, k=3)
+
+
+def fit_spline(
+    s: pd.Series, smoothing_factor: float = 1000.0, axis: TimeAxis | None = None
+) -> FittedSpline:
+    """Fit a cubic B-spline to a time series without evaluating it.
+
+    Parameters
+    ----------
+    s : pd.Series
+        Input Series with time series data (timestamps as index). NaNs are dropped.
+    smoothing_factor : float, optional
+        Smoothing factor for the spline fitting, by default 1000.0
+    axis : TimeAxis, optional
+        Time axis of the wide data ``s`` is a column of (see :func:`time_axis`),
+        used instead of converting the timestamps of ``s`` to seconds.
+
+    Returns
+    -------
+    FittedSpline
+        The spline (knots and coefficients) as function of seconds since ``start``
+        and the first and last timestamp used for fitting.
+    """
+    if axis is None:
+        s = s.dropna()
+        x = (s.index - s.index[0]).total_seconds().to_numpy()
+        y = s.to_numpy(dtype=float)
+        index = s.index
+    else:
+        valid = axis.valid[s.name]
+        x = axis.seconds[valid]
+        x = x - x[0] if len(x) else x
+        y = s.to_numpy(dtype=float)[valid]
+        index = axis.index[valid]
+    bspl = _make_spline(x, y, smoothing_factor)
+    return FittedSpline(bspl, index[0], index[-1])
+
+
+def evaluate_spline(
+    fitted: FittedSpline, index: pd.DatetimeIndex, nu: int = 0
+) -> pd.Series:
+    """Evaluate a fitted spline or one of its derivatives at arbitrary timestamps.
+
+    Parameters
+    ----------
+    fitted : FittedSpline
+        Spline returned by :func:`fit_spline`.
+    index : pd.DatetimeIndex
+        Timestamps to evaluate the spline at, e.g. a decimated index for plotting.
+    nu : int, optional
+        Order of derivative to evaluate, by default 0 (the spline itself).
+
+    Returns
+    -------
+    pd.Series
+        Values of the spline (or derivative) with ``index`` as index.
+    """
+    x = (index - fitted.start).total_seconds().to_numpy()
+    bspl = fitted.spline if nu == 0 else fitted.spline.derivative(nu=nu)
+    return pd.Series(bspl(x), index=index)
+
+
+def find_max_derivative(fitted: FittedSpline) -> tuple[pd.Timestamp, float]:
+    """Find the maximum of the first derivative of a fitted spline.
+
+    The candidates are the roots of the (piecewise linear) second derivative and
+    the boundaries of the fitted range, so the maximum is exact and not limited
+    to the resolution of the sampled timepoints.
+
+    Parameters
+    ----------
+    fitted : FittedSpline
+        Spline returned by :func:`fit_spline`.
+
+    Returns
+    -------
+    tuple[pd.Timestamp, float]
+        Timestamp of the maximum and the maximum of the first derivative (µmax).
+    """
+    x_end = (fitted.end - fitted.start).total_seconds()
+    x_max, mu_max = _max_derivative(fitted.spline, x_end)
+    return fitted.start + pd.to_timedelta(x_max, unit="s"), mu_max
+
+
+def _max_derivative(bspl, x_end: float) -> tuple[float, float]:
+    """Maximum of first derivative of a spline on [0, x_end] in seconds."""
+    from scipy.interpolate import PPoly
+
+    second_derivative = PPoly.from_spline(bspl.derivative(nu=2))
+    roots = second_derivative.roots(extrapolate=False)
+    # intervals where the second derivative is zero are reported as NaN
+    roots = roots[~np.isnan(roots) & (roots >= 0) & (roots <= x_end)]
+    candidates = np.concatenate([[0.0, x_end], roots])
+    values = bspl.derivative(nu=1)(candidates)
+    i = np.argmax(values)
+    return candidates[i], values[i]
+
+
 def fit_spline_and_derivatives(
     s: pd.Series,
     smoothing_factor: float = 1000.0,
-) -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Fit B-splines to each column in the DataFrame and compute specified derivatives.
+) -> tuple[pd.Series, pd.Series]:
+    """Fit B-spline to a Series and evaluate it and its first derivative.
     Values cannot be missing as NaNs, i.e. on rolling median of data.
 
     Parameters
@@ -30,38 +198,570 @@ def fit_spline_and_derivatives(
     smoothing_factor: float
         Smoothing factor for the spline fitting.
     Returns:
-        dict[str, pd.DataFrame]: Dictionary containing the fitted spline
-                                 and its derivatives.
+        tuple[pd.Series, pd.Series]: Fitted spline and its first derivative
+                                     evaluated at the non-missing timepoints.
     """
-    # drop NaN values
-    s = s.dropna()
+    fitted = fit_spline(s, smoothing_factor)
+    index = s.dropna().index
+    s_fitted = evaluate_spline(fitted, index)
+    s_first_derivative = evaluate_spline(fitted, index, nu=1)
 
-    if len(s) < 4:
-        raise ValueError(
-            "Not enough data points to fit a spline. Need at least 4 non-NaN values."
-        )
+    return s_fitted, s_first_derivative
 
-    x = (s.index - s.index[0]).total_seconds().to_numpy()
 
-    bspl = make_splrep(
-        x,
-        s,
-        s=smoothing_factor,
-        k=3,
-    )
-    s_fitted = pd.Series(
-        splev(x, bspl),
-        index=s.index,
+def fit_splines_one_batch(
+    df: pd.DataFrame,
+    smoothing_factor: float = 1000.0,
+) -> dict[str, FittedSpline]:
+    """Fit B-splines to each column in the DataFrame without evaluating them.
+    The timestamps are converted to seconds once for all columns.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        Input DataFrame with time series data.
+    smoothing_factor: float
+        Smoothing factor for the spline fitting.
+
+    Returns:
+        dict[str, FittedSpline]: Fitted spline per column.
+    """
+    axis = time_axis(df)
+    return {col: fit_spline(df[col], smoothing_factor, axis=axis) for col in df.columns}
+
+
+def evaluate_splines_one_batch(
+    fitted: dict[str, FittedSpline | list[FittedSpline]],
+    index: pd.DatetimeIndex | TimeAxis,
+    nu: int = 0,
+) -> pd.DataFrame:
+    """Evaluate fitted splines (or a derivative) at the given timestamps.
+
+    Timestamps outside of the range a spline was fitted on are set to NaN.
+    The timestamps are converted to seconds once (or taken from a
+    :class:`TimeAxis`) and shifted to the start of each spline. Columns fitted
+    in pieces (see :func:`fit_splines_with_gaps`) are evaluated piece by piece
+    into the same column.
+
+    Returns:
+        pd.DataFrame: Evaluated splines with ``index`` as index and one column
+                      per spline.
+    """
+    if not isinstance(index, TimeAxis):
+        index = TimeAxis(index, (index - index[0]).total_seconds().to_numpy(), {})
+    index, seconds = index.index, index.seconds
+    values = np.full((len(index), len(fitted)), np.nan)
+    for i, pieces in enumerate(fitted.values()):
+        for spline in pieces if isinstance(pieces, list) else [pieces]:
+            offset = (spline.start - index[0]).total_seconds()
+            x = seconds - offset
+            in_range = (x >= 0) & (x <= (spline.end - spline.start).total_seconds())
+            bspl = spline.spline if nu == 0 else spline.spline.derivative(nu=nu)
+            values[in_range, i] = bspl(x[in_range])
+    return pd.DataFrame(values, index=index, columns=list(fitted))
+
+
+def find_gaps(df: pd.DataFrame, max_gap: float) -> pd.DataFrame:
+    """Find gaps (e.g. sensor dropouts) longer than ``max_gap`` seconds.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Wide data with timestamps as index and reactors as columns.
+    max_gap : float
+        Longest time in seconds between consecutive non-missing values of a reactor
+        which is not considered a gap.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per gap with the reactor (``pioreactor_unit``), the last
+        timestamp before (``start``) and the first timestamp after the gap
+        (``end``) and its ``duration``.
+    """
+    axis = time_axis(df)
+    rows = []
+    for col, valid in axis.valid.items():
+        seconds = axis.seconds[valid]
+        for i in np.flatnonzero(np.diff(seconds) > max_gap):
+            rows.append((col, axis.index[valid[i]], axis.index[valid[i + 1]]))
+    gaps = pd.DataFrame(rows, columns=["pioreactor_unit", "start", "end"])
+    gaps["duration"] = gaps["end"] - gaps["start"]
+    return gaps
+
+
+def _pieces(axis: TimeAxis, max_gap: float) -> dict[str, list[tuple[int, int]]]:
+    """Row bounds [start, end) of the pieces of each column between gaps."""
+    pieces = {}
+    for col, valid in axis.valid.items():
+        if not len(valid):
+            pieces[col] = []
+            continue
+        breaks = np.flatnonzero(np.diff(axis.seconds[valid]) > max_gap) + 1
+        starts = valid[np.concatenate([[0], breaks])]
+        ends = valid[np.concatenate([breaks - 1, [len(valid) - 1]])] + 1
+        pieces[col] = list(zip(starts.tolist(), ends.tolist()))
+    return pieces
+
+
+def split_at_gaps(
+    df: pd.DataFrame,
+    max_gap: float,
+    min_length: int = 4,
+    axis: TimeAxis | None = None,
+) -> dict[tuple[str, int], pd.Series]:
+    """Split each column at gaps longer than ``max_gap`` seconds.
+
+    Pieces with fewer than ``min_length`` non-missing values are dropped. The time
+    axis of ``df`` (see :func:`time_axis`) is computed unless it is passed.
+
+    Returns:
+        dict[tuple[str, int], pd.Series]: Pieces keyed by column and piece number.
+    """
+    if axis is None:
+        axis = time_axis(df)
+    pieces = {}
+    for col, bounds in _pieces(axis, max_gap).items():
+        for i, (start, end) in enumerate(bounds):
+            s = df[col].iloc[start:end]
+            if s.count() >= min_length:
+                pieces[(col, i)] = s
+    return pieces
+
+
+def group_pieces(results: dict[tuple[str, int], FittedSpline]) -> dict[str, list]:
+    """Group fitted pieces keyed by (column, piece number) into lists per column."""
+    grouped = {}
+    for (col, _), spline in sorted(results.items(), key=lambda item: item[0][1]):
+        grouped.setdefault(col, []).append(spline)
+    return grouped
+
+
+def fit_splines_with_gaps(
+    df: pd.DataFrame,
+    smoothing_factor: float = 1000.0,
+    max_gap: float = 3600.0,
+    max_workers: int | None = None,
+) -> dict[str, list[FittedSpline]]:
+    """Fit splines to the pieces between gaps of each column independently.
+
+    A spline spanning a long gap (e.g. a sensor dropout) distorts the derivatives
+    around it. Instead, each column is split at gaps longer than ``max_gap``
+    seconds (see :func:`find_gaps`) and all pieces are fitted in parallel.
+    The result can be evaluated with :func:`evaluate_splines_one_batch` and
+    :func:`max_derivatives`, values within gaps are NaN.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Wide data with timestamps as index and reactors as columns.
+    smoothing_factor : float, optional
+        Smoothing factor for each spline fit, by default 1000.0
+    max_gap : float, optional
+        Longest time in seconds without values bridged by one spline, by default
+        3600.0 (one hour).
+    max_workers : int, optional
+        Number of worker processes, by default the number of CPUs.
+
+    Returns
+    -------
+    dict[str, list[FittedSpline]]
+        Fitted pieces in temporal order per column.
+    """
+    pieces = split_at_gaps(df, max_gap)
+    _fit = functools.partial(fit_spline, smoothing_factor=smoothing_factor)
+    results = map_parallel(_fit, list(pieces.values()), max_workers=max_workers)
+    return group_pieces(dict(zip(pieces, results)))
+
+
+def is_uniform(index: pd.DatetimeIndex, rtol: float = 1e-9) -> bool:
+    """Whether the timestamps are equally spaced (e.g. rounded without gaps)."""
+    if len(index) < 2:
+        return False
+    steps = np.diff((index - index[0]).total_seconds().to_numpy())
+    return bool(steps[0] > 0 and np.allclose(steps, steps[0], rtol=rtol, atol=0))
+
+
+def _difference_penalty_bands(n: int, order: int) -> np.ndarray:
+    """Upper bands of D'D for the difference matrix D of ``order`` (n columns),
+    in the layout of :func:`scipy.linalg.cholesky_banded`."""
+    from scipy.special import comb
+
+    k = np.arange(order + 1)
+    coefs = (-1.0) ** (order - k) * comb(order, k)
+    ab = np.zeros((order + 1, n))
+    for offset in range(order + 1):
+        # D'D[i, i + offset] sums c[m] * c[m + offset] over rows i - m of D
+        band = np.zeros(n - offset)
+        for m in range(order + 1 - offset):
+            band[m : n - order + m] += coefs[m] * coefs[m + offset]
+        ab[order - offset, offset:] = band
+    return ab
+
+
+def _group_columns(valid: np.ndarray) -> list[np.ndarray]:
+    """Positions of the columns sharing the same pattern of valid values."""
+    if valid.all():
+        return [np.arange(valid.shape[1])]
+    # one byte string per column, 8 timepoints per byte
+    packed = np.packbits(valid, axis=0)
+    groups = {}
+    for i, key in enumerate(packed.T):
+        groups.setdefault(key.tobytes(), []).append(i)
+    return [np.array(cols) for cols in groups.values()]
+
+
+def whittaker_smooth(
+    df: pd.DataFrame, lam: float = 1e8, order: int = 2
+) -> pd.DataFrame:
+    """Whittaker smoother for wide data sampled on a uniform time grid.
+
+    Solves ``(W + lam * D'D) z = W y`` per column, where ``D`` is the difference
+    matrix of ``order`` and ``W`` has zero weights for missing values, which are
+    thereby interpolated. The system is banded, so it is solved in linear time
+    using a banded Cholesky factorization. Columns sharing the same missing values
+    (e.g. all complete columns) share one factorization.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Wide data with equally spaced timestamps as index, see :func:`is_uniform`.
+    lam : float, optional
+        Smoothness penalty, larger is smoother, by default 1e8. It scales with
+        the number of timepoints per feature of the growth curve.
+    order : int, optional
+        Order of the differences penalized, by default 2.
+
+    Returns
+    -------
+    pd.DataFrame
+        Smoothed values of the same shape as ``df``.
+    """
+    from scipy.linalg import cho_solve_banded, cholesky_banded
+
+    if not is_uniform(df.index):
+        raise ValueError("Timestamps need to be equally spaced, see is_uniform.")
+    values = df.to_numpy(dtype=float, na_value=np.nan)
+    n = len(values)
+    penalty = lam * _difference_penalty_bands(n, order)
+    valid = ~np.isnan(values)
+    smoothed = np.full(values.shape, np.nan)
+    # group columns by their pattern of missing values
+    for cols in _group_columns(valid):
+        weights = valid[:, cols[0]]
+        if weights.sum() <= order:
+            continue
+        ab = penalty.copy()
+        ab[order] += weights
+        cholesky = cholesky_banded(ab)
+        rhs = np.where(weights[:, None], values[:, cols], 0.0)
+        smoothed[:, cols] = cho_solve_banded((cholesky, False), rhs)
+    return pd.DataFrame(smoothed, index=df.index, columns=df.columns)
+
+
+def fit_whittaker_splines(
+    df: pd.DataFrame,
+    lam: float = 1e8,
+    order: int = 2,
+    axis: TimeAxis | None = None,
+) -> dict[str, FittedSpline]:
+    """Fast alternative to :func:`fit_splines_one_batch` for uniform time grids.
+
+    The data is smoothed with :func:`whittaker_smooth` for all columns together
+    and a cubic interpolating spline is put through the smoothed values between
+    the first and last non-missing value of each column. The spline provides the
+    values and analytic derivatives, so the result can be used in place of
+    fitted smoothing splines, e.g. in :func:`evaluate_splines_one_batch` and
+    :func:`max_derivatives`. The splines of all columns spanning the same rows
+    are interpolated in one solve. The time axis of ``df`` (see
+    :func:`time_axis`) is computed unless it is passed.
+
+    Returns:
+        dict[str, FittedSpline]: Fitted spline per column.
+    """
+    from scipy.interpolate import BSpline, make_interp_spline
+
+    smoothed = whittaker_smooth(df, lam=lam, order=order).to_numpy()
+    if axis is None:
+        axis = time_axis(df)
+    spans = {}
+    for i, col in enumerate(df.columns):
+        valid = axis.valid[col]
+        if len(valid) < 4:
+            raise ValueError(
+                "Not enough data points to fit a spline. Need at least 4 non-NaN"
+                f" values, column {col!r} has {len(valid)}."
+            )
+        spans.setdefault((valid[0], valid[-1] + 1), []).append(i)
+    splines = {}
+    for (first, last), cols in spans.items():
+        x = axis.seconds[first:last] - axis.seconds[first]
+        bspl = make_interp_spline(x, smoothed[first:last, cols], k=3, axis=0)
+        for j, i in enumerate(cols):
+            splines[i] = FittedSpline(
+                BSpline.construct_fast(
+                    bspl.t, np.ascontiguousarray(bspl.c[:, j]), bspl.k
+                ),
+                axis.index[first],
+                axis.index[last - 1],
+            )
+    return {col: splines[i] for i, col in enumerate(df.columns)}
+
+
+def max_derivatives(
+    fitted: dict[str, FittedSpline | list[FittedSpline]],
+) -> pd.DataFrame:
+    """Find µmax and its timepoint for each fitted spline.
+    For columns fitted in pieces, the largest µmax of all pieces is used.
+
+    Returns:
+        pd.DataFrame: Columns ``timepoint``, ``mu_max`` and ``fitted`` (value of
+                      the spline at µmax) with one row per spline.
+    """
+    maxima = {}
+    for col, pieces in fitted.items():
+        for spline in pieces if isinstance(pieces, list) else [pieces]:
+            timepoint, mu_max = find_max_derivative(spline)
+            if col in maxima and maxima[col][1] >= mu_max:
+                continue
+            x = (timepoint - spline.start).total_seconds()
+            maxima[col] = (timepoint, mu_max, float(spline.spline(x)))
+    return pd.DataFrame.from_dict(
+        maxima, orient="index", columns=["timepoint", "mu_max", "fitted"]
     )
 
-    # for order in derivative_ord_ers:
-    der = bspl.derivative(nu=1)
-    s_first_derivative = pd.Series(
-        der(x),
-        index=s.index,
+
+def _growth_statistics(pieces: list[tuple], prop_high: float) -> np.ndarray:
+    """µmax, its timepoint and the high growth window of the splines fitted to
+    one column, in seconds since its first value.
+
+    ``pieces`` holds a tuple ``(spline, offset, x)`` per piece between gaps: the
+    spline as function of seconds since the start of the piece, the start in
+    seconds since the first value and the seconds of the values of the piece since
+    its start. As in :func:`max_derivatives`, µmax is the largest of all pieces.
+    """
+    maxima = [_max_derivative(bspl, x[-1]) for bspl, _, x in pieces]
+    i = int(np.argmax([mu_max for _, mu_max in maxima]))
+    x_max, mu_max = maxima[i]
+    x_max += pieces[i][1]
+    in_high_growth = np.concatenate(
+        [
+            offset + x[bspl.derivative(nu=1)(x) >= prop_high * mu_max]
+            for bspl, offset, x in pieces
+        ]
     )
+    if len(in_high_growth):
+        start, end = in_high_growth[0], in_high_growth[-1]
+    else:
+        start, end = np.nan, np.nan
+    return np.array([mu_max, x_max, start, end])
 
-    return s_fitted, s_first_derivative
+
+def _block_length(residuals: np.ndarray) -> int:
+    """Lag at which the autocorrelation of the residuals first drops to zero."""
+    n = len(residuals)
+    r = residuals - residuals.mean()
+    spectrum = np.fft.rfft(r, 2 * n)
+    acf = np.fft.irfft(spectrum * np.conj(spectrum))[:n]
+    below = np.flatnonzero(acf <= 0)
+    lag = below[0] if len(below) else n
+    return int(min(max(lag, 1), max(n // 2, 1)))
+
+
+def _moving_blocks(
+    residuals: np.ndarray, block_length: int, n_resamples: int, rng
+) -> np.ndarray:
+    """Moving block bootstrap: residual series (n_resamples x n) concatenated from
+    randomly placed blocks of consecutive residuals."""
+    n = len(residuals)
+    block_length = min(block_length, n)
+    n_blocks = -(-n // block_length)
+    starts = rng.integers(0, n - block_length + 1, size=(n_resamples, n_blocks))
+    positions = starts[:, :, None] + np.arange(block_length)
+    return residuals[positions.reshape(n_resamples, -1)[:, :n]]
+
+
+def bootstrap_max_derivative(
+    s: pd.Series,
+    smoothing_factor: float = 1000.0,
+    n_resamples: int = 200,
+    confidence_level: float = 0.95,
+    prop_high: float = 0.9,
+    seed: int | np.random.SeedSequence | None = None,
+    max_gap: float | None = None,
+    lam: float | None = None,
+    block_length: int | None = None,
+) -> pd.Series:
+    """Confidence intervals for µmax, its timepoint and the high growth window.
+
+    The column is smoothed as by the fit reporting µmax: smoothing splines (split
+    at gaps longer than ``max_gap`` as in :func:`fit_splines_with_gaps`) or, with
+    ``lam``, the Whittaker smoother of :func:`fit_whittaker_splines`. Residuals of
+    rolling median data are strongly autocorrelated, so they are resampled in
+    blocks of consecutive residuals (moving block bootstrap) and added to the
+    fitted values. The same smoother is applied to each resampled series and the
+    statistics are recomputed. Percentile intervals of the recomputed statistics,
+    with their median shifted to the estimate, are reported.
+
+    Parameters
+    ----------
+    s : pd.Series
+        Time series data (timestamps as index). Missing values are skipped.
+    smoothing_factor : float, optional
+        Smoothing factor for the spline fitting, by default 1000.0
+    n_resamples : int, optional
+        Number of bootstrap resamples, by default 200
+    confidence_level : float, optional
+        Confidence level of the intervals, by default 0.95
+    prop_high : float, optional
+        Proportion of µmax defining high growth, by default 0.9
+    seed : int | np.random.SeedSequence, optional
+        Seed for the random number generator for reproducible resamples.
+    max_gap : float, optional
+        Fit smoothing splines separately between gaps longer than ``max_gap``
+        seconds, see :func:`fit_splines_with_gaps`.
+    lam : float, optional
+        Smoothness penalty of the Whittaker smoother, used instead of smoothing
+        splines if given. The timestamps need to be equally spaced.
+    block_length : int, optional
+        Number of consecutive residuals per block, by default the lag at which
+        the autocorrelation of the residuals first drops to zero.
+
+    Returns
+    -------
+    pd.Series
+        Estimate, lower and upper bound for ``mu_max``, ``timepoint``,
+        ``high_growth_start`` and ``high_growth_end``. Times are timestamps.
+    """
+    from scipy.interpolate import BSpline, make_interp_spline
+    from scipy.linalg import cho_solve_banded, cholesky_banded
+
+    s = s.loc[s.first_valid_index() : s.last_valid_index()]
+    x = (s.index - s.index[0]).total_seconds().to_numpy()
+    y = s.to_numpy(dtype=float, na_value=np.nan)
+    valid = np.flatnonzero(~np.isnan(y))
+    rng = np.random.default_rng(seed)
+
+    if lam is not None:
+        if not is_uniform(s.index):
+            raise ValueError("Timestamps need to be equally spaced, see is_uniform.")
+        order = 2
+        ab = lam * _difference_penalty_bands(len(y), order)
+        ab[order, valid] += 1.0
+        cholesky = cholesky_banded(ab)
+
+        def smooth(values: np.ndarray) -> list[list[tuple]]:
+            # one solve and one batched interpolation for all series (columns)
+            rhs = np.zeros((len(y), values.shape[1]))
+            rhs[valid] = values
+            smoothed = cho_solve_banded((cholesky, False), rhs)
+            bspl = make_interp_spline(x, smoothed, k=3, axis=0)
+            return [
+                [(BSpline.construct_fast(bspl.t, bspl.c[:, j].copy(), bspl.k), 0, x)]
+                for j in range(values.shape[1])
+            ]
+
+        (pieces,) = smooth(y[valid, None])
+        fitted = pieces[0][0](x[valid])
+    else:
+        # valid positions of the pieces between gaps with enough values to fit
+        bounds = [valid]
+        if max_gap is not None:
+            bounds = np.split(valid, np.flatnonzero(np.diff(x[valid]) > max_gap) + 1)
+        bounds = [b for b in bounds if len(b) >= 4]
+        if not bounds:
+            raise ValueError(
+                "Not enough data points to fit a spline. Need at least 4 non-NaN"
+                " values."
+            )
+        valid = np.concatenate(bounds)
+        sizes = np.cumsum([len(b) for b in bounds])[:-1]
+
+        def smooth(values: np.ndarray) -> list[list[tuple]]:
+            return [
+                [
+                    (
+                        _make_spline(x[b] - x[b[0]], v, smoothing_factor),
+                        x[b[0]],
+                        x[b] - x[b[0]],
+                    )
+                    for b, v in zip(bounds, np.split(values[:, j], sizes))
+                ]
+                for j in range(values.shape[1])
+            ]
+
+        (pieces,) = smooth(y[valid, None])
+        fitted = np.concatenate([bspl(x_piece) for bspl, _, x_piece in pieces])
+
+    residuals = y[valid] - fitted
+    estimate = _growth_statistics(pieces, prop_high)
+    if block_length is None:
+        block_length = _block_length(residuals)
+    resampled_residuals = _moving_blocks(residuals, block_length, n_resamples, rng)
+    resampled = np.array(
+        [
+            _growth_statistics(pieces, prop_high)
+            for pieces in smooth(fitted[:, None] + resampled_residuals.T)
+        ]
+    ).reshape(n_resamples, len(estimate))
+    # smoothing the resampled series smooths the fitted values again, which
+    # shrinks µmax, so the resamples are centered on the estimate
+    resampled += estimate - np.nanmedian(resampled, axis=0)
+    alpha = (1 - confidence_level) / 2
+    lower, upper = np.nanquantile(resampled, [alpha, 1 - alpha], axis=0)
+
+    stats = ["mu_max", "timepoint", "high_growth_start", "high_growth_end"]
+    res = {}
+    for stat, est, low, up in zip(stats, estimate, lower, upper):
+        if stat != "mu_max":
+            est, low, up = s.index[0] + pd.to_timedelta([est, low, up], unit="s")
+        res[stat] = est
+        res[f"{stat}_lower"] = low
+        res[f"{stat}_upper"] = up
+    return pd.Series(res)
+
+
+def _bootstrap_column(s: pd.Series, seed: np.random.SeedSequence, **kwargs):
+    return bootstrap_max_derivative(s, seed=seed, **kwargs)
+
+
+def bootstrap_max_derivatives(
+    df: pd.DataFrame,
+    smoothing_factor: float = 1000.0,
+    n_resamples: int = 200,
+    confidence_level: float = 0.95,
+    prop_high: float = 0.9,
+    seed: int | None = None,
+    max_workers: int | None = None,
+    max_gap: float | None = None,
+    lam: float | None = None,
+    block_length: int | None = None,
+) -> pd.DataFrame:
+    """Bootstrap confidence intervals for each column using a process pool.
+
+    Each column gets its own independent random stream spawned from ``seed``, so
+    results are reproducible regardless of the number of workers.
+    See :func:`bootstrap_max_derivative` for the parameters.
+
+    Returns
+    -------
+    pd.DataFrame
+        Estimates and confidence intervals with one row per column.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(df.shape[1])
+    _bootstrap = functools.partial(
+        _bootstrap_column,
+        smoothing_factor=smoothing_factor,
+        n_resamples=n_resamples,
+        confidence_level=confidence_level,
+        prop_high=prop_high,
+        max_gap=max_gap,
+        lam=lam,
+        block_length=block_length,
+    )
+    columns = [df[col] for col in df.columns]
+    results = map_parallel(_bootstrap, columns, seeds, max_workers=max_workers)
+    return pd.DataFrame(results, index=df.columns)
 
 
 def fit_spline_and_derivatives_one_batch(
@@ -83,78 +783,147 @@ def fit_spline_and_derivatives_one_batch(
                                            and its first derivative.
     """
     assert df.isna().sum().sum() == 0, "Input DataFrame contains NaN values"
-    df_fitted = pd.DataFrame(index=df.index)
-    df_first_derivative = pd.DataFrame(index=df.index)
-
-    for col in df.columns:
-        s = df[col]
-        s_fitted, s_first_derivative = fit_spline_and_derivatives(s, smoothing_factor)
-        df_fitted[f"{col}"] = s_fitted
-        df_first_derivative[f"{col}"] = s_first_derivative
+    axis = time_axis(df)
+    fitted = {col: fit_spline(df[col], smoothing_factor, axis) for col in df.columns}
+    df_fitted = evaluate_splines_one_batch(fitted, axis)
+    df_first_derivative = evaluate_splines_one_batch(fitted, axis, nu=1)
 
     return df_fitted, df_first_derivative
 
 
+def _segment_statistics(
+    bspl, x: np.ndarray, y: np.ndarray, y_fitted: np.ndarray
+) -> tuple:
+    """Statistics of one segment fit, see :func:`fit_splines_to_segments`.
+
+    µmax is found with :func:`_max_derivative` as for whole time series. Returns
+    the position of µmax in seconds and µmax, the OD at the timepoint closest to
+    µmax and the fitted OD at µmax, the specific growth rate, the doubling time
+    and the R² of the fit.
+    """
+    x_max, mu_max = _max_derivative(bspl, x[-1])
+    od = y[np.abs(x - x_max).argmin()]
+    od_spline = float(bspl(x_max))
+    specific_growth_rate = mu_max / od_spline
+    with np.errstate(divide="ignore"):
+        doubling_time = np.log(2) / specific_growth_rate
+    ss_res = np.sum((y - y_fitted) ** 2)
+    ss_tot = np.sum((y - y.mean()) ** 2)
+    r2 = 1 - ss_res / ss_tot if ss_tot > 0 else np.nan
+    return x_max, mu_max, od, od_spline, specific_growth_rate, doubling_time, r2
+
+
 def fit_splines_to_segments(
-    s: pd.Series, peaks: pd.Series, smoothing_factor: float = 100.0
-) -> tuple[pd.DataFrame, pd.DataFrame]:
+    s: pd.Series,
+    peaks: pd.Series,
+    smoothing_factor: float = 100.0,
+    seconds: np.ndarray | None = None,
+) -> tuple[pd.Series, pd.Series, pd.DataFrame]:
     """Fit splines to segments of the time series data between detected peaks.
 
     Parameters
     ----------
     s : pd.Series
-        _description_
+        Time series data of one reactor (timestamps as index) without NaNs.
     peaks : pd.Series
-        _description_
+        Peaks (dilutions) with the timepoints as index, separating the segments.
     smoothing_factor : float, optional
-        _description_, by default 100.0
+        Smoothing factor for the spline fitting of each segment, by default 100.0
+    seconds : np.ndarray, optional
+        Timepoints of ``s`` in seconds (from any origin), e.g. a slice of the
+        seconds of a :class:`TimeAxis`. By default computed from the index of ``s``.
 
     Returns
     -------
-    tuple[pd.DataFrame, pd.DataFrame]
-        _description_
-    """
-    peak_timepoints = [s.index.min(), *peaks.dropna().index, s.index.max()]
-    res_fitted, res_derivative, res_max, res_idx_max = [], [], [], []
-    for start, end in zip(peak_timepoints, peak_timepoints[1:]):
-        s_segment = s[start:end]
-        if len(s_segment) < 4:
+    tuple[pd.Series, pd.Series, pd.DataFrame]
+        Fitted splines and their first derivative at the timepoints of ``s``, and
+        one row of statistics per segment: first and last timepoint of the segment,
+        µmax (``mu_max``, per second) and its ``timepoint``, the OD value and the
+        fitted value at µmax, the specific growth rate at µmax (µmax divided by
+        the fitted value), the corresponding ``doubling_time`` in seconds and the
+        coefficient of determination ``r2`` of the fit. Segments with fewer than
+        4 values are skipped.
+    """
+    index = s.index
+    values = s.to_numpy(dtype=float)
+    if seconds is None:
+        seconds = (index - index[0]).total_seconds().to_numpy()
+    peak_timepoints = [index.min(), *peaks.dropna().index, index.max()]
+    bounds = np.column_stack(
+        [
+            index.searchsorted(peak_timepoints[:-1], side="left"),
+            index.searchsorted(peak_timepoints[1:], side="right"),
+        ]
+    )
+    fitted = np.full(len(values), np.nan)
+    derivative = np.full(len(values), np.nan)
+    rows = []
+    for start, end in bounds:
+        if end - start < 4:
             continue
-        s_segment_fitted, s_segment_derivative = fit_spline_and_derivatives(
-            s_segment, smoothing_factor=smoothing_factor
-        )
-        res_fitted.append(s_segment_fitted)
-        res_derivative.append(s_segment_derivative)
-        idx_max = s_segment_derivative.idxmax()
-        res_max.append(s_segment.loc[idx_max])
-        res_idx_max.append(idx_max)
+        x = seconds[start:end] - seconds[start]
+        y = values[start:end]
+        bspl = _make_spline(x, y, smoothing_factor)
+        y_fitted = bspl(x)
+        y_derivative = bspl.derivative(nu=1)(x)
+        # peaks belong to two segments, keep the values of the first one
+        keep = np.isnan(fitted[start:end])
+        fitted[start:end][keep] = y_fitted[keep]
+        derivative[start:end][keep] = y_derivative[keep]
+        x_max, *stats = _segment_statistics(bspl, x, y, y_fitted)
+        timepoint = index[start] + pd.to_timedelta(x_max, unit="s")
+        rows.append((index[start], index[end - 1], timepoint, *stats))
 
-    res_fitted = pd.concat(res_fitted).sort_index()
-    res_fitted = res_fitted.loc[~res_fitted.index.duplicated(keep="first")]
-    res_derivative = pd.concat(res_derivative).sort_index()
-    res_derivative = res_derivative.loc[~res_derivative.index.duplicated(keep="first")]
-    res_max = pd.Series(res_max, index=res_idx_max).sort_index()
-    return res_fitted, res_derivative, res_max
+    keep = ~np.isnan(fitted)
+    s_fitted = pd.Series(fitted[keep], index=index[keep])
+    s_derivative = pd.Series(derivative[keep], index=index[keep])
+    df_segments = pd.DataFrame(rows, columns=SEGMENT_COLUMNS)
+    return s_fitted, s_derivative, df_segments
 
 
 def fit_growth_data_w_peaks(
     df_wide: pd.DataFrame,
     peaks: pd.DataFrame,
     smoothing_factor: float = 100.0,
-) -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Fit growth data with splines between detected peaks."""
-    df_fitted = pd.DataFrame(index=df_wide.index)
-    df_first_derivative = pd.DataFrame(index=df_wide.index)
-    df_max = {}
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Fit growth data with splines between detected peaks.
 
-    for col in df_wide.columns:
-        s = df_wide[col].dropna()
+    Returns the fitted splines and first derivatives as wide DataFrames and a
+    table with one row per reactor and segment, see :func:`combine_segment_fits`.
+    Columns of ``peaks`` need to match the columns of ``df_wide`` (see
+    :func:`~piogrowth.load.reactors_to_columns`), columns without peaks are fitted
+    as one segment.
+    """
+    axis = time_axis(df_wide)
+    peaks = peaks.reindex(columns=df_wide.columns)
+    results = {}
+    for col, valid in axis.valid.items():
+        s = df_wide[col].iloc[valid]
         s_peaks = peaks[col].dropna()
-        s_fitted, s_derivative, s_max = fit_splines_to_segments(
-            s, s_peaks, smoothing_factor=smoothing_factor
+        results[col] = fit_splines_to_segments(
+            s, s_peaks, smoothing_factor=smoothing_factor, seconds=axis.seconds[valid]
         )
+    return combine_segment_fits(df_wide.index, results)
+
+
+def combine_segment_fits(
+    index: pd.Index, results: dict[str, tuple[pd.Series, pd.Series, pd.DataFrame]]
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Combine results of :func:`fit_splines_to_segments` per reactor into wide
+    DataFrames of fitted splines and derivatives and one table of segments with
+    the reactor (``pioreactor_unit``) as first column."""
+    df_fitted = pd.DataFrame(index=index)
+    df_first_derivative = pd.DataFrame(index=index)
+    segments = []
+
+    for col, (s_fitted, s_derivative, df_segments) in results.items():
         df_fitted[col] = s_fitted
         df_first_derivative[col] = s_derivative
-        df_max[col] = s_max
+        segments.append(df_segments.assign(pioreactor_unit=col))
 
-    return df_fitted, df_first_derivative, df_max
+    if segments:
+        df_segments = pd.concat(segments, ignore_index=True)
+    else:
+        df_segments = pd.DataFrame(columns=[*SEGMENT_COLUMNS, "pioreactor_unit"])
+    df_segments = df_segments[["pioreactor_unit", *SEGMENT_COLUMNS]]
+    return df_fitted, df_first_derivative, df_segments
@@ -0,0 +1,571 @@
+"""Run fits in the background, one task per reactor.
+
+A :class:`Job` groups the tasks of one analysis. Jobs are keyed by a fingerprint
+of the input data and the parameters, so submitting the same analysis again
+returns the job which is still running or already finished instead of starting
+over. The tasks of all jobs are executed by one :class:`Scheduler`, a bounded
+process pool which is shared fairly between sessions (users). With a
+:class:`~piogrowth.cache.ColumnCache`, the results of the tasks are kept per
+reactor, so a job on data where only some reactors changed runs only their tasks.
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, Executor, Future, ProcessPoolExecutor
+from typing import Any, Callable
+
+import numpy as np
+import pandas as pd
+
+from .cache import ColumnCache
+from .fit import (
+    TimeAxis,
+    bootstrap_max_derivative,
+    column_axis,
+    combine_segment_fits,
+    fit_spline,
+    fit_splines_to_segments,
+    group_pieces,
+    split_at_gaps,
+    time_axis,
+)
+from .models import MODELS, combine_growth_model_fits, fit_growth_model
+
+
+def _cancelled(future: Future) -> bool:
+    # queued tasks are cancelled directly, running tasks finish with CancelledError
+    return future.cancelled() or (
+        future.done() and isinstance(future.exception(), CancelledError)
+    )
+
+
+def _update(h, obj: Any):
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        h.update(pd.util.hash_pandas_object(obj).to_numpy().tobytes())
+        if isinstance(obj, pd.DataFrame):
+            h.update(repr(obj.columns.tolist()).encode())
+    elif isinstance(obj, np.ndarray):
+        # the repr of large arrays is abbreviated
+        h.update(repr((obj.dtype, obj.shape)).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (tuple, list)):
+        h.update(f"{type(obj).__name__}:{len(obj)}".encode())
+        for item in obj:
+            _update(h, item)
+    elif isinstance(obj, dict):
+        h.update(f"dict:{len(obj)}".encode())
+        for key, value in obj.items():
+            _update(h, key)
+            _update(h, value)
+    else:
+        h.update(repr(obj).encode())
+
+
+def fingerprint(*objs: Any) -> str:
+    """Hash data (DataFrames, Series, arrays) and parameters into a hexadecimal
+    key. Tuples (e.g. a :class:`~piogrowth.fit.TimeAxis`), lists and dictionaries
+    are hashed item by item."""
+    h = hashlib.sha256()
+    for obj in objs:
+        _update(h, obj)
+    return h.hexdigest()
+
+
+class Job:
+    """Tasks of one analysis, one per reactor, combined once all are finished.
+
+    Parameters
+    ----------
+    key : str
+        Fingerprint of the input data and parameters.
+    futures : dict[str, Future]
+        Future per reactor.
+    combine : Callable[[dict], Any]
+        Called with the results per reactor to create the result of the job.
+    """
+
+    def __init__(
+        self, key: str, futures: dict[str, Future], combine: Callable[[dict], Any]
+    ):
+        self.key = key
+        self.futures = futures
+        self.combine = combine
+        self._result = None
+        self._lock = threading.Lock()
+
+    @property
+    def n_total(self) -> int:
+        return len(self.futures)
+
+    @property
+    def n_done(self) -> int:
+        return sum(future.done() for future in self.futures.values())
+
+    @property
+    def progress(self) -> float:
+        """Fraction of finished reactors."""
+        return self.n_done / self.n_total if self.n_total else 1.0
+
+    @property
+    def finished(self) -> list[str]:
+        """Reactors for which the fit is finished."""
+        return [name for name, future in self.futures.items() if future.done()]
+
+    def done(self) -> bool:
+        return all(future.done() for future in self.futures.values())
+
+    def cancelled(self) -> bool:
+        """Whether the task of any reactor was cancelled."""
+        return any(_cancelled(future) for future in self.futures.values())
+
+    def failed(self) -> bool:
+        """Whether the task of any reactor was cancelled or raised an exception."""
+        return any(
+            future.done() and (future.cancelled() or future.exception() is not None)
+            for future in self.futures.values()
+        )
+
+    def errors(self) -> dict[str, BaseException]:
+        """Exceptions of the failed (not cancelled) reactors."""
+        return {
+            name: future.exception()
+            for name, future in self.futures.items()
+            if future.done() and not _cancelled(future) and future.exception()
+        }
+
+    def result(self, timeout: float | None = None) -> Any:
+        """Wait for all reactors and return the combined result."""
+        with self._lock:
+            if self._result is None:
+                results = {
+                    name: future.result(timeout=timeout)
+                    for name, future in self.futures.items()
+                }
+                self._result = self.combine(results)
+        return self._result
+
+
+class Scheduler:
+    """Bounded worker pool shared by all sessions with fair queuing.
+
+    Tasks are queued per session and dispatched round-robin across sessions, so
+    a session submitting many reactors does not block other sessions. At most
+    ``max_workers`` tasks are handed to the pool at once. Identical tasks
+    (same key) which are queued, running or recently finished share one future.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Number of workers, by default the number of CPUs.
+    executor : Executor, optional
+        Executor running the tasks, by default a process pool with ``max_workers``
+        processes. Functions and arguments need to be picklable in that case.
+    max_finished : int, optional
+        Number of finished tasks kept for deduplication, by default 1024.
+    """
+
+    def __init__(
+        self,
+        max_workers: int | None = None,
+        executor: Executor | None = None,
+        max_finished: int = 1024,
+    ):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        if executor is None:
+            executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self.executor = executor
+        self.max_finished = max_finished
+        self._queues: OrderedDict[str, deque] = OrderedDict()
+        self._tasks: OrderedDict[str, Future] = OrderedDict()
+        self._in_flight = 0
+        self._counts = {
+            "submitted": 0,
+            "deduplicated": 0,
+            "completed": 0,
+            "failed": 0,
+            "cancelled": 0,
+        }
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+        self._cond = threading.Condition()
+        self._shutdown = False
+        self._dispatcher = threading.Thread(
+            target=self._dispatch, name="piogrowth-scheduler", daemon=True
+        )
+        self._dispatcher.start()
+
+    def submit(self, session_id: str, key: str, func: Callable, *args) -> Future:
+        """Queue a task for a session, or return the future of an identical task.
+
+        Parameters
+        ----------
+        session_id : str
+            Identifier of the session submitting the task.
+        key : str
+            Fingerprint of the task, see :func:`fingerprint`.
+        func : Callable
+            Function to run with positional arguments ``args``.
+
+        Returns
+        -------
+        Future
+            Future of the task result.
+        """
+        with self._cond:
+            future = self._tasks.get(key)
+            if future is not None and not (
+                future.done() and (future.cancelled() or future.exception() is not None)
+            ):
+                self._tasks.move_to_end(key)
+                self._counts["deduplicated"] += 1
+                return future
+            future = Future()
+            self._tasks[key] = future
+            self._queues.setdefault(session_id, deque()).append(
+                (future, func, args, time.perf_counter())
+            )
+            self._counts["submitted"] += 1
+            self._cond.notify()
+            return future
+
+    def _next_task(self):
+        # round-robin: take the first session's oldest task, move session to end
+        session_id, queue = next(iter(self._queues.items()))
+        task = queue.popleft()
+        del self._queues[session_id]
+        if queue:
+            self._queues[session_id] = queue
+        return task
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._shutdown and (
+                    not self._queues or self._in_flight >= self.max_workers
+                ):
+                    self._cond.wait()
+                if self._shutdown:
+                    return
+                future, func, args, submitted = self._next_task()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                self._in_flight += 1
+                started = time.perf_counter()
+                self._wait_times.append(started - submitted)
+            try:
+                pool_future = self.executor.submit(func, *args)
+            except Exception as e:  # e.g. a broken process pool
+                pool_future = Future()
+                pool_future.set_exception(e)
+            pool_future.add_done_callback(
+                functools.partial(self._on_done, future, started)
+            )
+
+    def _on_done(self, future: Future, started: float, pool_future: Future):
+        with self._cond:
+            self._in_flight -= 1
+            self._run_times.append(time.perf_counter() - started)
+            if pool_future.cancelled():
+                # the outer future is already running and cannot be cancelled
+                exception = CancelledError()
+                self._counts["cancelled"] += 1
+            else:
+                exception = pool_future.exception()
+                self._counts["failed" if exception else "completed"] += 1
+            # forget oldest finished tasks
+            while len(self._tasks) > self.max_finished:
+                key, oldest = next(iter(self._tasks.items()))
+                if not oldest.done():
+                    break
+                del self._tasks[key]
+            self._cond.notify()
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(pool_future.result())
+
+    def metrics(self) -> dict:
+        """Queue depth, task counts and latencies (in seconds) of the scheduler.
+
+        ``wait`` is the time from submission until a worker picks up a task,
+        ``run`` the time a worker needs for a task.
+        """
+        with self._cond:
+            metrics = {
+                "queue_depth": sum(len(q) for q in self._queues.values()),
+                "queue_depth_per_session": {
+                    session_id: len(q) for session_id, q in self._queues.items()
+                },
+                "in_flight": self._in_flight,
+                "max_workers": self.max_workers,
+                **self._counts,
+            }
+            for name, times in (("wait", self._wait_times), ("run", self._run_times)):
+                times = np.array(times) if times else np.array([np.nan])
+                metrics[f"{name}_mean"] = float(times.mean())
+                metrics[f"{name}_p95"] = float(np.quantile(times, 0.95))
+        return metrics
+
+    def shutdown(self, wait: bool = True):
+        with self._cond:
+            self._shutdown = True
+            for queue in self._queues.values():
+                for future, *_ in queue:
+                    future.cancel()
+            self._queues.clear()
+            self._cond.notify_all()
+        self.executor.shutdown(wait=wait)
+
+
+class JobRunner:
+    """Submit jobs to a scheduler and keep the most recent jobs.
+
+    Parameters
+    ----------
+    scheduler : Scheduler, optional
+        Scheduler running the tasks, by default one with a process pool.
+    max_jobs : int, optional
+        Number of jobs kept for later retrieval, by default 32.
+    cache : ColumnCache, optional
+        Cache of task results, keyed by the fingerprint of the task. Tasks with
+        a cached result are not submitted to the scheduler.
+    """
+
+    def __init__(
+        self,
+        scheduler: Scheduler | None = None,
+        max_jobs: int = 32,
+        cache: ColumnCache | None = None,
+    ):
+        if scheduler is None:
+            scheduler = Scheduler()
+        self.scheduler = scheduler
+        self.max_jobs = max_jobs
+        self.cache = cache
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Job | None:
+        """Return the job for a key if it was submitted before."""
+        with self._lock:
+            return self._jobs.get(key)
+
+    def submit(
+        self,
+        key: str,
+        func: Callable,
+        tasks: dict[str, tuple],
+        combine: Callable[[dict], Any],
+        session_id: str = "default",
+    ) -> Job:
+        """Submit one task per reactor unless a job with the same key exists.
+
+        Parameters
+        ----------
+        key : str
+            Fingerprint of data and parameters, see :func:`fingerprint`.
+        func : Callable
+            Function called with the arguments of each task.
+        tasks : dict[str, tuple]
+            Positional arguments of ``func`` per reactor.
+        combine : Callable[[dict], Any]
+            Combines the results per reactor into the result of the job.
+        session_id : str, optional
+            Session submitting the job, used for fair queuing.
+
+        Returns
+        -------
+        Job
+            The new job, or the running or finished job submitted before.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and not job.failed():
+                self._jobs.move_to_end(key)
+                return job
+            func_name = f"{func.__module__}.{func.__qualname__}"
+            futures = {
+                name: self._submit_task(
+                    session_id, fingerprint(func_name, *args), func, args
+                )
+                for name, args in tasks.items()
+            }
+            job = Job(key, futures, combine)
+            self._jobs[key] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+            return job
+
+    def _submit_task(
+        self, session_id: str, key: str, func: Callable, args: tuple
+    ) -> Future:
+        if self.cache is None:
+            return self.scheduler.submit(session_id, key, func, *args)
+        future = Future()
+        result = self.cache.get(key, future)
+        if result is not future:
+            future.set_result(result)
+            return future
+        future = self.scheduler.submit(session_id, key, func, *args)
+        future.add_done_callback(functools.partial(self._cache_result, key))
+        return future
+
+    def _cache_result(self, key: str, future: Future):
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(key, future.result())
+
+
+def _as_dict(results: dict) -> dict:
+    return results
+
+
+def _as_frame(results: dict[str, pd.Series]) -> pd.DataFrame:
+    return pd.DataFrame(list(results.values()), index=list(results))
+
+
+def submit_spline_fits(
+    runner: JobRunner,
+    df: pd.DataFrame,
+    smoothing_factor: float,
+    session_id: str = "default",
+    max_gap: float | None = None,
+    axis: TimeAxis | None = None,
+) -> Job:
+    """Fit a spline to each column of a batch experiment in the background.
+
+    The result of the job is a dictionary of
+    :class:`~piogrowth.fit.FittedSpline` per column. If ``max_gap`` (in seconds)
+    is given, columns are split at longer gaps and each piece is a task of its
+    own, see :func:`~piogrowth.fit.fit_splines_with_gaps`. The result then holds
+    a list of fitted pieces per column.
+
+    Each task gets the seconds of its column (or piece) from the time axis of
+    ``df``, which is computed unless passed as ``axis``.
+    """
+    if axis is None:
+        axis = time_axis(df)
+    if max_gap is None:
+        key = fingerprint("spline_fits", df, smoothing_factor)
+        tasks = {
+            col: (df[col], smoothing_factor, column_axis(axis, df[col]))
+            for col in df.columns
+        }
+        return runner.submit(key, fit_spline, tasks, _as_dict, session_id=session_id)
+    key = fingerprint("spline_fits_with_gaps", df, smoothing_factor, max_gap)
+    tasks = {
+        piece: (s, smoothing_factor, column_axis(axis, s))
+        for piece, s in split_at_gaps(df, max_gap, axis=axis).items()
+    }
+    return runner.submit(key, fit_spline, tasks, group_pieces, session_id=session_id)
+
+
+def submit_segment_fits(
+    runner: JobRunner,
+    df_wide: pd.DataFrame,
+    peaks: pd.DataFrame,
+    smoothing_factor: float,
+    session_id: str = "default",
+    axis: TimeAxis | None = None,
+) -> Job:
+    """Fit splines between peaks (dilutions) for each reactor in the background.
+
+    The result of the job is the same as of
+    :func:`~piogrowth.fit.fit_growth_data_w_peaks`. Each task gets the seconds of
+    its reactor from the time axis of ``df_wide``, which is computed unless
+    passed as ``axis``. Columns without peaks are fitted as one segment.
+    """
+    if axis is None:
+        axis = time_axis(df_wide)
+    peaks = peaks.reindex(columns=df_wide.columns)
+    key = fingerprint("segment_fits", df_wide, peaks, smoothing_factor)
+    tasks = {
+        col: (
+            df_wide[col].iloc[valid],
+            peaks[col].dropna(),
+            smoothing_factor,
+            axis.seconds[valid],
+        )
+        for col, valid in axis.valid.items()
+    }
+    combine = functools.partial(combine_segment_fits, df_wide.index)
+    return runner.submit(
+        key, fit_splines_to_segments, tasks, combine, session_id=session_id
+    )
+
+
+def submit_bootstrap(
+    runner: JobRunner,
+    df: pd.DataFrame,
+    smoothing_factor: float = 1000.0,
+    n_resamples: int = 200,
+    confidence_level: float = 0.95,
+    prop_high: float = 0.9,
+    seed: int | None = None,
+    session_id: str = "default",
+    max_gap: float | None = None,
+    lam: float | None = None,
+    block_length: int | None = None,
+) -> Job:
+    """Bootstrap confidence intervals of µmax for each column in the background.
+
+    The result of the job is the same as of
+    :func:`~piogrowth.fit.bootstrap_max_derivatives`, see
+    :func:`~piogrowth.fit.bootstrap_max_derivative` for the parameters. Pass the
+    ``max_gap`` or ``lam`` of the fit reporting µmax.
+    """
+    key = fingerprint(
+        "bootstrap",
+        df,
+        smoothing_factor,
+        n_resamples,
+        confidence_level,
+        prop_high,
+        seed,
+        max_gap,
+        lam,
+        block_length,
+    )
+    seeds = np.random.SeedSequence(seed).spawn(df.shape[1])
+    tasks = {
+        col: (
+            df[col],
+            smoothing_factor,
+            n_resamples,
+            confidence_level,
+            prop_high,
+            col_seed,
+            max_gap,
+            lam,
+            block_length,
+        )
+        for col, col_seed in zip(df.columns, seeds)
+    }
+    return runner.submit(
+        key, bootstrap_max_derivative, tasks, _as_frame, session_id=session_id
+    )
+
+
+def submit_growth_model_fits(
+    runner: JobRunner,
+    df: pd.DataFrame,
+    model: str = "logistic",
+    smoothing_factor: float | None = None,
+    session_id: str = "default",
+) -> Job:
+    """Fit a parametric growth model to each column in the background.
+
+    The result of the job is the same as of
+    :func:`~piogrowth.models.fit_growth_models`.
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown model {model!r}, choose from {list(MODELS)}")
+    key = fingerprint("growth_models", df, model, smoothing_factor)
+    tasks = {col: (df[col], model, smoothing_factor) for col in df.columns}
+    combine = functools.partial(combine_growth_model_fits, df)
+    return runner.submit(key, fit_growth_model, tasks, combine, session_id=session_id)
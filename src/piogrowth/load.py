@@ -1,5 +1,11 @@
 """Load PioGrowth data from CSV files."""
 
+from __future__ import annotations
+
+from collections import namedtuple
+
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
 
 # specify datecolumns for now
@@ -15,6 +21,165 @@ COLUMN_TYPES: dict = {
 }
 
 
-def read_csv(file: str) -> pd.DataFrame:
-    """Read a CSV file processed with PioGrowth reactor software."""
-    return pd.read_csv(file, converters=COLUMN_TYPES).convert_dtypes()
+def read_csv(file: str, dtype: npt.DTypeLike | None = None) -> pd.DataFrame:
+    """Read a CSV file processed with PioGrowth reactor software.
+
+    By default the OD readings are nullable ``Float64``. With a ``dtype``, e.g.
+    ``np.float32``, they are kept as plain numpy floats of that type with NaN
+    for missing readings.
+    """
+    if dtype is None:
+        return pd.read_csv(file, converters=COLUMN_TYPES).convert_dtypes()
+    return pd.read_csv(
+        file, converters=COLUMN_TYPES, dtype={"od_reading": dtype}
+    ).convert_dtypes(convert_floating=False)
+
+
+class ODArray(namedtuple("ODArray", ["values", "index", "reactors", "channels"])):
+    """OD readings as (time x reactor x channel) float array with labeled axes.
+
+    Channels are the combinations of ``angle`` and ``channel`` of the readings.
+    Use :meth:`to_frame` to get wide data for the filters and fits, which then
+    process all reactors and channels together as columns, and
+    :meth:`column_reactors` to map these columns back to their reactors.
+    """
+
+    __slots__ = ()
+
+    def _columns(self, channel: str | None = None) -> pd.Index:
+        if channel is not None or len(self.channels) == 1:
+            return self.reactors
+        return pd.Index(
+            [f"{r}_{c}" for r in self.reactors for c in self.channels],
+            name=self.reactors.name,
+        )
+
+    def column_reactors(self, channel: str | None = None) -> pd.Series:
+        """Reactor of each column of :meth:`to_frame` (indexed by the columns)."""
+        columns = self._columns(channel)
+        reactors = self.reactors
+        if len(columns) != len(reactors):
+            reactors = reactors.repeat(len(self.channels))
+        return pd.Series(reactors.to_numpy(), index=columns, name="reactor")
+
+    def to_frame(self, channel: str | None = None) -> pd.DataFrame:
+        """Wide data (timepoints x reactors) of one or of all channels.
+
+        Without a selected channel and more than one channel, the columns are all
+        combinations of reactor and channel labeled ``{reactor}_{channel}``. The
+        returned frame is a view of :attr:`values` (no copy) in that case.
+        """
+        if channel is not None:
+            values = self.values[:, :, self.channels.get_loc(channel)]
+        elif len(self.channels) == 1:
+            values = self.values[:, :, 0]
+        else:
+            # reactor major order, so channels of a reactor are adjacent columns
+            values = self.values.reshape(len(self.index), -1)
+        return pd.DataFrame(
+            values, index=self.index, columns=self._columns(channel), copy=False
+        )
+
+
+def _channel_labels(df_long: pd.DataFrame, channel_columns: list[str]) -> pd.Series:
+    """Label of angle and channel per reading, empty if both are missing."""
+    labels = None
+    for col in channel_columns:
+        if col not in df_long.columns:
+            continue
+        s = df_long[col].astype("string").fillna("")
+        labels = s if labels is None else labels.str.cat(s, sep="_")
+    if labels is None:
+        return pd.Series("", index=df_long.index)
+    return labels.str.strip("_")
+
+
+def to_od_array(
+    df_long: pd.DataFrame,
+    time_column: str = "timestamp_rounded",
+    reactor_column: str = "pioreactor_unit",
+    channel_columns: tuple[str, ...] = ("angle", "channel"),
+    value_column: str = "od_reading",
+    dtype: npt.DTypeLike = float,
+) -> ODArray:
+    """Arrange long format OD readings in a (time x reactor x channel) array.
+
+    Parameters
+    ----------
+    df_long : pd.DataFrame
+        OD readings with one row per reading, e.g. from :func:`read_csv` with
+        rounded timestamps.
+    time_column : str, optional
+        Column with the (rounded) timestamps, by default "timestamp_rounded"
+    reactor_column : str, optional
+        Column with the reactor names, by default "pioreactor_unit"
+    channel_columns : tuple[str, ...], optional
+        Columns which together define a channel, by default ("angle", "channel")
+    value_column : str, optional
+        Column with the OD values, by default "od_reading"
+    dtype : dtype, optional
+        Float type of the array, by default float (float64)
+
+    Returns
+    -------
+    ODArray
+        Values with NaN for missing readings, sorted timestamps, reactors and
+        channels.
+
+    Raises
+    ------
+    ValueError
+        If a reactor has several readings of one channel at a timepoint.
+    """
+    t_codes, index = pd.factorize(df_long[time_column], sort=True)
+    r_codes, reactors = pd.factorize(df_long[reactor_column], sort=True)
+    labels = _channel_labels(df_long, list(channel_columns))
+    c_codes, channels = pd.factorize(labels, sort=True)
+    shape = (len(index), len(reactors), len(channels))
+    flat = np.ravel_multi_index((t_codes, r_codes, c_codes), shape)
+    if len(np.unique(flat)) < len(flat):
+        raise ValueError(
+            "Index contains duplicate entries: several readings of a reactor and"
+            " channel at the same timepoint."
+        )
+    values = np.full(shape, np.nan, dtype=dtype)
+    values.reshape(-1)[flat] = df_long[value_column].to_numpy(
+        dtype=dtype, na_value=np.nan
+    )
+    return ODArray(
+        values,
+        pd.DatetimeIndex(index, name=time_column),
+        pd.Index(reactors, name=reactor_column),
+        pd.Index(channels, name="channel"),
+    )
+
+
+def reactors_to_columns(
+    df: pd.DataFrame,
+    columns: pd.Index,
+    column_reactors: pd.Series | None = None,
+) -> pd.DataFrame:
+    """Data per reactor (e.g. pivoted dilution events) as data per column of the
+    wide data.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Data with reactors as columns.
+    columns : pd.Index
+        Columns of the wide data.
+    column_reactors : pd.Series, optional
+        Reactor per column, see :meth:`ODArray.column_reactors`. Columns missing
+        in it (or all, if not given) are reactors themselves.
+
+    Returns
+    -------
+    pd.DataFrame
+        Data with ``columns`` as columns, the channels of a reactor share the data
+        of the reactor. Columns of reactors missing in ``df`` are NaN.
+    """
+    if column_reactors is None:
+        reactors = list(columns)
+    else:
+        reactors = [column_reactors.get(col, col) for col in columns]
+    return df.reindex(columns=reactors).set_axis(columns, axis=1)
@@ -0,0 +1,274 @@
+"""Fit parametric growth models to OD time series.
+
+All models are parametrized as in Zwietering et al. (1990) using
+
+- ``y0``: value at the start of the time series (lower asymptote),
+- ``A``: amplitude, i.e. the carrying capacity is ``y0 + A``,
+- ``mu``: maximum growth rate (maximum slope), per second,
+- ``lag``: lag time in seconds since the first timepoint.
+
+Usually the models are fitted to log-transformed OD data, so that ``mu`` is the
+maximum specific growth rate. Initial guesses are derived from a smoothing spline
+fitted to the data, see :func:`initial_guess`.
+"""
+
+from __future__ import annotations
+
+import functools
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .fit import find_max_derivative, fit_spline
+from .parallel import map_parallel
+
+GrowthModel = namedtuple("GrowthModel", ["function", "jacobian"])
+
+PARAMETERS = ["y0", "A", "mu", "lag"]
+
+
+def logistic(t: np.ndarray, y0: float, A: float, mu: float, lag: float) -> np.ndarray:
+    """Modified logistic model of Zwietering et al. (1990)."""
+    from scipy.special import expit
+
+    u = 4 * mu / A * (lag - t) + 2
+    return y0 + A * expit(-u)
+
+
+def logistic_jacobian(
+    t: np.ndarray, y0: float, A: float, mu: float, lag: float
+) -> np.ndarray:
+    """Jacobian of :func:`logistic` with respect to (y0, A, mu, lag)."""
+    from scipy.special import expit
+
+    u = 4 * mu / A * (lag - t) + 2
+    g = expit(-u)
+    # derivative of A * g with respect to u
+    df_du = -A * g * (1 - g)
+    return np.column_stack(
+        [
+            np.ones_like(t),
+            g + df_du * (-4 * mu * (lag - t) / A**2),
+            df_du * (4 * (lag - t) / A),
+            df_du * np.full_like(t, 4 * mu / A),
+        ]
+    )
+
+
+def _gompertz_exponent(t, A, mu, lag):
+    # clip to avoid overflow, exp(-exp(500)) is zero in double precision anyway
+    return np.minimum(mu * np.e / A * (lag - t) + 1, 500.0)
+
+
+def gompertz(t: np.ndarray, y0: float, A: float, mu: float, lag: float) -> np.ndarray:
+    """Modified Gompertz model of Zwietering et al. (1990)."""
+    v = _gompertz_exponent(t, A, mu, lag)
+    return y0 + A * np.exp(-np.exp(v))
+
+
+def gompertz_jacobian(
+    t: np.ndarray, y0: float, A: float, mu: float, lag: float
+) -> np.ndarray:
+    """Jacobian of :func:`gompertz` with respect to (y0, A, mu, lag)."""
+    h = np.exp(_gompertz_exponent(t, A, mu, lag))
+    g = np.exp(-h)
+    # derivative of A * g with respect to the exponent v
+    df_dv = -A * g * h
+    return np.column_stack(
+        [
+            np.ones_like(t),
+            g + df_dv * (-mu * np.e * (lag - t) / A**2),
+            df_dv * (np.e * (lag - t) / A),
+            df_dv * np.full_like(t, mu * np.e / A),
+        ]
+    )
+
+
+def _baranyi_terms(t, A, mu, lag):
+    """Terms of the Baranyi model computed in log space."""
+    with np.errstate(divide="ignore"):
+        # log(1 - exp(-x)) is -inf for x = 0
+        log1m_q = np.log(-np.expm1(-mu * t))
+        log1m_p = np.log(-np.expm1(-mu * lag))
+    # log(q + p - q * p) with q = exp(-mu * t) and p = exp(-mu * lag)
+    log_inner = np.logaddexp(-mu * t, -mu * lag + log1m_q)
+    B = mu * t + log_inner
+    # log(exp(A) - 1 + exp(B))
+    S = np.logaddexp(np.log(np.expm1(A)), B)
+    return B, S, log_inner, log1m_q, log1m_p
+
+
+def baranyi(t: np.ndarray, y0: float, A: float, mu: float, lag: float) -> np.ndarray:
+    """Baranyi and Roberts (1994) model with the lag time as parameter."""
+    B, S, *_ = _baranyi_terms(t, A, mu, lag)
+    return y0 + B + A - S
+
+
+def baranyi_jacobian(
+    t: np.ndarray, y0: float, A: float, mu: float, lag: float
+) -> np.ndarray:
+    """Jacobian of :func:`baranyi` with respect to (y0, A, mu, lag)."""
+    B, S, log_inner, log1m_q, log1m_p = _baranyi_terms(t, A, mu, lag)
+    # weights q * (1 - p) / inner and p * (1 - q) / inner
+    w_q = np.exp(-mu * t + log1m_p - log_inner)
+    w_p = np.exp(-mu * lag + log1m_q - log_inner)
+    df_dB = 1 - np.exp(B - S)
+    dB_dmu = t - t * w_q - lag * w_p
+    dB_dlag = -mu * w_p
+    return np.column_stack(
+        [
+            np.ones_like(t),
+            np.exp(B - S) - np.exp(-S),
+            df_dB * dB_dmu,
+            df_dB * dB_dlag,
+        ]
+    )
+
+
+MODELS: dict[str, GrowthModel] = {
+    "logistic": GrowthModel(logistic, logistic_jacobian),
+    "gompertz": GrowthModel(gompertz, gompertz_jacobian),
+    "baranyi": GrowthModel(baranyi, baranyi_jacobian),
+}
+
+
+def initial_guess(s: pd.Series, smoothing_factor: float | None = None) -> np.ndarray:
+    """Derive initial model parameters from a smoothing spline.
+
+    The maximum slope of the spline and its timepoint define ``mu`` and the
+    tangent at that point. The lag time is where the tangent crosses ``y0``.
+
+    Parameters
+    ----------
+    s : pd.Series
+        Time series data (timestamps as index) without missing values.
+    smoothing_factor : float, optional
+        Smoothing factor for the spline, by default the number of data points.
+
+    Returns
+    -------
+    np.ndarray
+        Initial parameters (y0, A, mu, lag).
+    """
+    if smoothing_factor is None:
+        smoothing_factor = len(s)
+    fitted = fit_spline(s, smoothing_factor=smoothing_factor)
+    timepoint, mu = find_max_derivative(fitted)
+    t_max = (timepoint - fitted.start).total_seconds()
+    x = (s.index - s.index[0]).total_seconds().to_numpy()
+    y_fitted = fitted.spline(x)
+    y0 = y_fitted.min()
+    A = max(y_fitted.max() - y0, np.finfo(float).eps)
+    mu = max(mu, np.finfo(float).eps)
+    y_t_max = fitted.spline(t_max)
+    lag = max(t_max - (y_t_max - y0) / mu, 0.0)
+    return np.array([y0, A, mu, lag])
+
+
+def fit_growth_model(
+    s: pd.Series,
+    model: str = "logistic",
+    smoothing_factor: float | None = None,
+) -> pd.Series:
+    """Fit a parametric growth model to a time series.
+
+    Parameters
+    ----------
+    s : pd.Series
+        Time series data (timestamps as index). NaNs are dropped.
+    model : str, optional
+        One of ``logistic``, ``gompertz`` or ``baranyi``, by default "logistic"
+    smoothing_factor : float, optional
+        Smoothing factor of the spline used for the initial guess.
+
+    Returns
+    -------
+    pd.Series
+        Fitted parameters (y0, A, mu, lag), the carrying capacity ``y_max``,
+        the root mean squared error ``rmse``, the number of function evaluations
+        ``nfev`` and whether the optimizer converged (``success``).
+    """
+    from scipy.optimize import least_squares
+
+    growth_model = MODELS[model]
+    s = s.dropna()
+    t = (s.index - s.index[0]).total_seconds().to_numpy()
+    y = s.to_numpy(dtype=float)
+    x0 = initial_guess(s, smoothing_factor=smoothing_factor)
+
+    def residuals(params):
+        return growth_model.function(t, *params) - y
+
+    def jacobian(params):
+        return growth_model.jacobian(t, *params)
+
+    tiny = np.finfo(float).eps
+    res = least_squares(
+        residuals,
+        x0,
+        jac=jacobian,
+        bounds=([-np.inf, tiny, tiny, 0.0], np.inf),
+        x_scale="jac",
+    )
+    y0, A, mu, lag = res.x
+    return pd.Series(
+        {
+            "y0": y0,
+            "A": A,
+            "mu": mu,
+            "lag": lag,
+            "y_max": y0 + A,
+            "rmse": np.sqrt(np.mean(res.fun**2)),
+            "nfev": res.nfev,
+            "success": res.success,
+        }
+    )
+
+
+def fit_growth_models(
+    df: pd.DataFrame,
+    model: str = "logistic",
+    smoothing_factor: float | None = None,
+    max_workers: int | None = None,
+) -> pd.DataFrame:
+    """Fit a parametric growth model to each reactor (column) in parallel.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Wide data with timestamps as index and reactors as columns.
+    model : str, optional
+        One of ``logistic``, ``gompertz`` or ``baranyi``, by default "logistic"
+    smoothing_factor : float, optional
+        Smoothing factor of the spline used for the initial guess.
+    max_workers : int, optional
+        Number of worker processes, by default the number of CPUs.
+
+    Returns
+    -------
+    pd.DataFrame
+        Fitted parameters with one row per reactor, see :func:`fit_growth_model`.
+        ``lag_end`` is the timestamp at which the lag phase ends.
+    """
+    if model not in MODELS:
+        raise ValueError(f"Unknown model {model!r}, choose from {list(MODELS)}")
+    _fit = functools.partial(
+        fit_growth_model, model=model, smoothing_factor=smoothing_factor
+    )
+    columns = [df[col] for col in df.columns]
+    results = map_parallel(_fit, columns, max_workers=max_workers)
+    return combine_growth_model_fits(df, dict(zip(df.columns, results)))
+
+
+def combine_growth_model_fits(
+    df: pd.DataFrame, results: dict[str, pd.Series]
+) -> pd.DataFrame:
+    """Table of the parameters from :func:`fit_growth_model` per column of ``df``.
+
+    ``lag_end`` is the timestamp at which the lag phase ends.
+    """
+    df_params = pd.DataFrame([results[col] for col in df.columns], index=df.columns)
+    starts = df.apply(pd.Series.first_valid_index)
+    df_params["lag_end"] = starts + pd.to_timedelta(df_params["lag"], unit="s")
+    return df_params
@@ -0,0 +1,32 @@
+"""Run independent per-reactor computations in a process pool."""
+
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable
+
+
+def map_parallel(
+    func: Callable, *iterables: Iterable, max_workers: int | None = None
+) -> list:
+    """Map a function over iterables using a process pool.
+
+    Parameters
+    ----------
+    func : Callable
+        Function to apply. Needs to be importable (defined at module level).
+    *iterables : Iterable
+        Arguments passed to ``func``, as for the builtin ``map``.
+    max_workers : int, optional
+        Number of worker processes, by default the number of CPUs. With one
+        worker the function is applied in the current process.
+
+    Returns
+    -------
+    list
+        Results in the order of the arguments.
+    """
+    if max_workers == 1:
+        return list(map(func, *iterables))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(func, *iterables))
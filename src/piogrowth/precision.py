@@ -0,0 +1,86 @@
+"""Guardrails for analysing OD readings in single precision (float32).
+
+OD readings have about four significant digits, so loading and filtering them as
+``np.float32`` (see the ``dtype`` options of :func:`piogrowth.load.read_csv`,
+:func:`piogrowth.load.to_od_array` and :class:`piogrowth.filter.FilterPipeline`)
+halves the memory of the wide data. Spline fits always upcast to float64.
+:func:`compare_precision` runs both paths on the same data and bounds the
+differences in µmax and its timepoint.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import numpy.typing as npt
+import pandas as pd
+
+from .filter import FilterPipeline
+from .fit import fit_splines_one_batch, max_derivatives
+
+
+def compare_precision(
+    df: pd.DataFrame,
+    smoothing_factor: float = 1000.0,
+    dtype: npt.DTypeLike = np.float32,
+    rtol: float = 1e-3,
+    max_shift: float | None = None,
+    **filter_kwargs,
+) -> pd.DataFrame:
+    """Compare µmax of the float64 analysis with an analysis in lower precision.
+
+    Both paths filter the data and compute the rolling median with a
+    :class:`~piogrowth.filter.FilterPipeline` and fit splines to the rolling
+    median.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Wide raw OD data (timepoints x reactors), e.g. from
+        :meth:`piogrowth.load.ODArray.to_frame`.
+    smoothing_factor : float, optional
+        Smoothing factor for the spline fitting, by default 1000.0
+    dtype : dtype, optional
+        Precision to compare with float64, by default np.float32
+    rtol : float, optional
+        Largest accepted relative difference of µmax, by default 1e-3
+    max_shift : float, optional
+        Largest accepted shift of the timepoint of µmax in seconds, by default
+        the median spacing of the timestamps.
+    **filter_kwargs
+        Parameters of the :class:`~piogrowth.filter.FilterPipeline`.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per reactor with ``mu_max`` of both paths (``mu_max_float64``
+        and ``mu_max_{dtype}``), the relative difference ``mu_max_rel_diff``, the
+        shift of the timepoint in seconds ``timepoint_shift`` and whether both are
+        ``within_tolerance``.
+    """
+    dtype = np.dtype(dtype)
+    if max_shift is None:
+        max_shift = float(np.median(np.diff(df.index.asi8))) / 1e9
+    maxima = []
+    for _dtype in (np.dtype(float), dtype):
+        pipeline = FilterPipeline(dtype=_dtype, **filter_kwargs)
+        df_rolling = pipeline.run(df).rolling_median
+        maxima.append(
+            max_derivatives(fit_splines_one_batch(df_rolling, smoothing_factor))
+        )
+    reference, other = maxima
+    mu_max_rel_diff = (other["mu_max"] - reference["mu_max"]).abs() / reference[
+        "mu_max"
+    ].abs()
+    timepoint_shift = (
+        (other["timepoint"] - reference["timepoint"]).dt.total_seconds().abs()
+    )
+    return pd.DataFrame(
+        {
+            "mu_max_float64": reference["mu_max"],
+            f"mu_max_{dtype.name}": other["mu_max"],
+            "mu_max_rel_diff": mu_max_rel_diff,
+            "timepoint_shift": timepoint_shift,
+            "within_tolerance": (mu_max_rel_diff <= rtol)
+            & (timepoint_shift <= max_shift),
+        }
+    )
@@ -0,0 +1,381 @@
+"""HTTP service (ASGI) returning growth parameters for uploaded OD exports.
+
+The service is a plain ASGI application without web framework, run it with any
+ASGI server, e.g. ``uvicorn``::
+
+    pip install 'piogrowth[service]'
+    python -m piogrowth.service --port 8000
+
+Endpoints
+
+- ``GET /health``: ``{"status": "ok"}``
+- ``POST /batch``: body is a PioReactor OD export (CSV). Returns µmax, its
+  timepoint and the high growth window per reactor (and channel).
+- ``POST /turbidostat``: body is a PioReactor OD export (CSV). Dilutions are
+  detected as sharp OD drops and the returned table has one row per segment
+  between dilutions.
+
+Parameters are passed as query string, e.g.
+``/batch?smoothing_factor=1000&round_time=5&prop_high=0.9``, see
+:data:`PARAMETERS`. The rolling median window (``window``, in seconds) defaults
+to the duration of 31 timepoints. Results are JSON records by default, or an
+Arrow IPC stream for ``format=arrow`` (or an
+``Accept: application/vnd.apache.arrow.stream`` header).
+
+Uploads are streamed into a temporary file which the worker process reads, so
+the upload is not held in memory. Uploads larger than ``max_upload_size`` are
+rejected with status 413 (by their ``Content-Length`` or while streaming).
+Uploads which cannot be parsed as OD export are rejected with status 400, data
+which cannot be analysed with 422. Fits run in a process pool and results are
+cached by the hash of the upload and the parameters.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import functools
+import hashlib
+import io
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from urllib.parse import parse_qs
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+# query parameter name: (type, default)
+PARAMETERS = {
+    "batch": {
+        "round_time": (int, 5),
+        "remove_negative": (bool, False),
+        "window": (float, None),
+        "smoothing_factor": (float, 1000.0),
+        "prop_high": (float, 0.9),
+        "log": (bool, False),
+    },
+    "turbidostat": {
+        "round_time": (int, 5),
+        "remove_negative": (bool, False),
+        "window": (float, None),
+        "smoothing_factor": (float, 100.0),
+        "threshold": (float, 10.0),
+        "min_separation": (float, None),
+    },
+}
+
+
+class InvalidUpload(ValueError):
+    """The upload is not a PioReactor OD export which can be parsed."""
+
+
+def _parse_bool(value: str) -> bool:
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise ValueError(f"Not a boolean: {value!r}")
+
+
+def parse_params(kind: str, query_string: bytes) -> dict:
+    """Parse and validate the query parameters of an analysis.
+
+    Raises
+    ------
+    ValueError
+        For unknown parameters or values which cannot be converted.
+    """
+    query = parse_qs(query_string.decode("latin-1"))
+    query.pop("format", None)
+    unknown = set(query) - set(PARAMETERS[kind])
+    if unknown:
+        raise ValueError(f"Unknown parameters: {sorted(unknown)}")
+    params = {}
+    for name, (dtype, default) in PARAMETERS[kind].items():
+        if name not in query:
+            params[name] = default
+        elif dtype is bool:
+            params[name] = _parse_bool(query[name][-1])
+        else:
+            params[name] = dtype(query[name][-1])
+    return params
+
+
+def _wide_data(data: bytes | str, params: dict):
+    """Filtered rolling median of the uploaded OD readings (wide format).
+
+    Raises
+    ------
+    InvalidUpload
+        If the upload (bytes or path of a file) cannot be parsed as OD export.
+    """
+    from . import filter, load
+
+    try:
+        df_long = load.read_csv(data if isinstance(data, str) else io.BytesIO(data))
+        df_long.insert(
+            0,
+            "timestamp_rounded",
+            df_long["timestamp_localtime"].dt.round(f"{params['round_time']}s"),
+        )
+        df_wide = load.to_od_array(df_long).to_frame()
+    except Exception as e:  # any parser error, missing columns or wrong types
+        raise InvalidUpload(f"Cannot parse the upload as OD export: {e!r}") from e
+    pipeline = filter.FilterPipeline(
+        remove_negative=params["remove_negative"],
+        window=params["window"] or filter.default_window(df_wide.index),
+    )
+    return pipeline.run(df_wide).rolling_median
+
+
+def analyse(kind: str, data: bytes | str, params: dict):
+    """Run an analysis on an uploaded OD export (executed in a worker process).
+
+    ``data`` is the content of the export or the path of a file holding it.
+
+    Returns
+    -------
+    pd.DataFrame
+        Summary table, see the module documentation.
+    """
+    from . import durations, fit, transform, turbistat
+
+    df = _wide_data(data, params)
+    if kind == "batch":
+        if params["log"]:
+            df = transform.apply_transforms(df, transform.shift_log)
+        fitted = fit.fit_splines_one_batch(df, params["smoothing_factor"])
+        df_summary = fit.max_derivatives(fitted)
+        derivatives = fit.evaluate_splines_one_batch(fitted, fit.time_axis(df), nu=1)
+        high_growth = durations.find_max_ranges(
+            durations.threshold_index(derivatives), params["prop_high"]
+        )
+        df_summary = df_summary.join(high_growth.add_prefix("high_growth_"))
+        return df_summary.rename_axis("pioreactor_unit").reset_index()
+    peaks = turbistat.detect_dilutions(
+        df, threshold=params["threshold"], min_separation=params["min_separation"]
+    )
+    df = transform.apply_transforms(df, transform.mask_downward)
+    *_, df_segments = fit.fit_growth_data_w_peaks(
+        df, peaks, smoothing_factor=params["smoothing_factor"]
+    )
+    return df_segments
+
+
+def to_json(df) -> bytes:
+    """JSON records with ISO timestamps and durations in seconds."""
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype.kind == "m":
+            df[col] = df[col].dt.total_seconds()
+    return df.to_json(orient="records", date_format="iso").encode()
+
+
+def to_arrow(df) -> bytes:
+    """Arrow IPC stream of a table."""
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class GrowthService:
+    """ASGI application running analyses in a process pool.
+
+    Parameters
+    ----------
+    executor : Executor, optional
+        Executor running :func:`analyse`, by default a process pool created on
+        startup (or on the first request).
+    max_workers : int, optional
+        Number of worker processes of the default process pool.
+    max_cached : int, optional
+        Number of results kept in the cache, by default 128.
+    max_upload_size : int, optional
+        Largest accepted upload in bytes, by default 256 MiB.
+    """
+
+    def __init__(
+        self,
+        executor: Executor | None = None,
+        max_workers: int | None = None,
+        max_cached: int = 128,
+        max_upload_size: int = 2**28,
+    ):
+        self.executor = executor
+        self.max_workers = max_workers
+        self.max_cached = max_cached
+        self.max_upload_size = max_upload_size
+        self._cache: OrderedDict[str, object] = OrderedDict()
+        self._running: dict[str, asyncio.Future] = {}
+        # uploads read by a running analysis, removed once it is done
+        self._in_use: set[str] = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._executor()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _executor(self) -> Executor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.executor
+
+    async def _http(self, scope, receive, send):
+        path, method = scope["path"].rstrip("/"), scope["method"]
+        if path == "/health" and method == "GET":
+            return await self._respond(send, 200, {"status": "ok"})
+        kind = path.lstrip("/")
+        if kind not in PARAMETERS:
+            return await self._respond(send, 404, {"error": "Not found"})
+        if method != "POST":
+            return await self._respond(send, 405, {"error": "Use POST"})
+        try:
+            params = parse_params(kind, scope["query_string"])
+        except ValueError as e:
+            return await self._respond(send, 400, {"error": str(e)})
+        query = parse_qs(scope["query_string"].decode("latin-1"))
+        headers = dict(scope["headers"])
+        as_arrow = query.get("format", [""])[-1] == "arrow" or ARROW_STREAM in (
+            headers.get(b"accept", b"").decode("latin-1")
+        )
+        too_large = {"error": f"Upload larger than {self.max_upload_size} bytes"}
+        try:
+            content_length = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            return await self._respond(send, 400, {"error": "Invalid Content-Length"})
+        if content_length > self.max_upload_size:
+            return await self._respond(send, 413, too_large)
+
+        # the worker process reads the upload from the file
+        upload = tempfile.NamedTemporaryFile(suffix=".csv", delete=False)
+        try:
+            with upload:
+                digest = hashlib.sha256(f"{kind}:{sorted(params.items())}".encode())
+                size = 0
+                more_body = True
+                while more_body:
+                    message = await receive()
+                    if message["type"] == "http.disconnect":
+                        return
+                    chunk = message.get("body", b"")
+                    size += len(chunk)
+                    if size > self.max_upload_size:
+                        return await self._respond(send, 413, too_large)
+                    digest.update(chunk)
+                    upload.write(chunk)
+                    more_body = message.get("more_body", False)
+            if not size:
+                return await self._respond(send, 400, {"error": "Empty upload"})
+            key = digest.hexdigest()
+            try:
+                df = await self._result(key, kind, upload.name, params)
+            except InvalidUpload as e:
+                return await self._respond(send, 400, {"error": str(e)})
+            except (ValueError, KeyError) as e:
+                return await self._respond(send, 422, {"error": repr(e)})
+        finally:
+            # an analysis reading the file removes it when done (or did already)
+            if upload.name not in self._in_use:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(upload.name)
+
+        if as_arrow:
+            body, content_type = to_arrow(df), ARROW_STREAM
+        else:
+            body, content_type = to_json(df), "application/json"
+        await self._send(send, 200, body, content_type, [(b"x-cache-key", key)])
+
+    async def _result(self, key: str, kind: str, path: str, params: dict):
+        """Cached result, or the running or a new analysis for a key."""
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        future = self._running.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor(), analyse, kind, path, params)
+            self._in_use.add(path)
+            future.add_done_callback(functools.partial(self._release, path))
+            self._running[key] = future
+        try:
+            df = await asyncio.shield(future)
+        finally:
+            self._running.pop(key, None)
+        self._cache[key] = df
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+        return df
+
+    def _release(self, path: str, future: asyncio.Future):
+        self._in_use.discard(path)
+        os.unlink(path)
+
+    async def _respond(self, send, status: int, content: dict):
+        await self._send(send, status, json.dumps(content).encode(), "application/json")
+
+    @staticmethod
+    async def _send(send, status, body: bytes, content_type: str, headers=()):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", content_type.encode()),
+                    (b"content-length", str(len(body)).encode()),
+                    *[(k, v.encode()) for k, v in headers],
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+app = GrowthService()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--max-upload-size",
+        type=int,
+        default=2**28,
+        help="Largest accepted upload in bytes (default: 256 MiB).",
+    )
+    args = parser.parse_args()
+    try:
+        import uvicorn
+    except ImportError as e:
+        raise ImportError(
+            "Running the service requires uvicorn: pip install 'piogrowth[service]'"
+        ) from e
+    uvicorn.run(
+        GrowthService(max_upload_size=args.max_upload_size),
+        host=args.host,
+        port=args.port,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""Save analysed experiments to disk and reopen them using memory mapping.
+
+An experiment is stored in a directory holding
+
+- one ``.npy`` file per time index (datetime64[ns] as int64),
+- one ``.npy`` file per wide matrix (timepoints x reactors) in column-major order,
+  so that the values of a single reactor are contiguous on disk,
+- one Arrow IPC (feather) file per summary table and
+- a ``manifest.json`` describing all files and the analysis parameters.
+
+Wide matrices are opened with ``numpy.load(..., mmap_mode="r")``, so reopening an
+analysed run only reads the manifest and the time indices. Values of a reactor are
+paged in by the operating system when they are accessed.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MANIFEST = "manifest.json"
+FORMAT_VERSION = 1
+
+
+def _import_feather():
+    try:
+        from pyarrow import feather
+    except ImportError as e:
+        raise ImportError(
+            "Storing summary tables requires pyarrow: pip install 'piogrowth[arrow]'"
+        ) from e
+    return feather
+
+
+def _to_numpy(df: pd.DataFrame) -> np.ndarray:
+    """Convert (possibly nullable) wide data to a column-major numpy array."""
+    if all(pd.api.types.is_bool_dtype(dtype) for dtype in df.dtypes):
+        values = df.to_numpy(dtype=bool, na_value=False)
+    elif all(isinstance(dtype, np.dtype) and dtype.kind in "iu" for dtype in df.dtypes):
+        # e.g. bit flags of filter reasons
+        values = df.to_numpy()
+    else:
+        values = df.to_numpy(dtype=float, na_value=np.nan)
+    return np.asfortranarray(values)
+
+
+def save_experiment(
+    path: str | Path,
+    frames: dict[str, pd.DataFrame],
+    tables: dict[str, pd.DataFrame] | None = None,
+    params: dict | None = None,
+) -> Path:
+    """Save wide frames, summary tables and parameters of an analysis to a directory.
+
+    Parameters
+    ----------
+    path : str | Path
+        Directory to write to. Created if it does not exist.
+    frames : dict[str, pd.DataFrame]
+        Wide frames (timestamps x reactors), e.g. raw, filtered and rolling median
+        OD data, filter masks, fitted splines and derivatives. Frames sharing the
+        same time index store it only once.
+    tables : dict[str, pd.DataFrame], optional
+        Summary tables with arbitrary column types, stored as Arrow IPC files.
+    params : dict, optional
+        JSON serializable analysis parameters.
+
+    Returns
+    -------
+    Path
+        The directory the experiment was saved to.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "params": params or {},
+        "indices": [],
+        "frames": {},
+        "tables": {},
+    }
+    indices = []
+    for name, df in frames.items():
+        if df is None:
+            continue
+        for i, index in enumerate(indices):
+            if index.equals(df.index):
+                index_id = i
+                break
+        else:
+            index_id = len(indices)
+            indices.append(df.index)
+            fname = f"index_{index_id}.npy"
+            np.save(path / fname, df.index.to_numpy(dtype="datetime64[ns]"))
+            manifest["indices"].append({"file": fname, "name": df.index.name})
+        fname = f"{name}.npy"
+        np.save(path / fname, _to_numpy(df))
+        manifest["frames"][name] = {
+            "file": fname,
+            "index": index_id,
+            "columns": df.columns.tolist(),
+            "columns_name": df.columns.name,
+        }
+    for name, df in (tables or {}).items():
+        if df is None:
+            continue
+        feather = _import_feather()
+        fname = f"{name}.arrow"
+        index_names = [
+            f"level_{i}" if n is None else n for i, n in enumerate(df.index.names)
+        ]
+        df_table = df.rename_axis(index_names).reset_index()
+        # uncompressed files can be memory mapped when reading
+        feather.write_feather(df_table, path / fname, compression="uncompressed")
+        manifest["tables"][name] = {
+            "file": fname,
+            "index": index_names,
+            "index_names": list(df.index.names),
+        }
+    with open(path / MANIFEST, "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    return path
+
+
+_NAME = re.compile(r"^[\w][\w.-]*$")
+
+
+def experiment_dir(root: str | Path, name: str) -> Path:
+    """Directory of the experiment ``name`` below ``root``.
+
+    Experiments are keyed by their name only, so they can be reopened from any
+    later session. Names are restricted to plain directory names, so no file
+    outside ``root`` can be written or read.
+
+    Raises
+    ------
+    ValueError
+        If the name is not a plain directory name (e.g. paths with separators or
+        ``..``).
+    """
+    if not _NAME.match(name) or ".." in name:
+        raise ValueError(f"Not a valid experiment name: {name!r}")
+    return Path(root) / name
+
+
+def list_experiments(root: str | Path) -> list[str]:
+    """Names of all experiments saved below ``root``."""
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    return sorted(p.parent.name for p in root.glob(f"*/{MANIFEST}"))
+
+
+class Experiment:
+    """Lazily opened experiment saved with :func:`save_experiment`.
+
+    Frames and tables are only read on first access. Wide frames are backed by
+    read-only memory maps, so accessing a single reactor only reads its values.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path / MANIFEST) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported format version: {self.manifest.get('format_version')}"
+            )
+        self._indices = {}
+        self._cache = {}
+
+    @property
+    def params(self) -> dict:
+        return self.manifest["params"]
+
+    @property
+    def frames(self) -> list[str]:
+        return list(self.manifest["frames"])
+
+    @property
+    def tables(self) -> list[str]:
+        return list(self.manifest["tables"])
+
+    def keys(self) -> list[str]:
+        return self.frames + self.tables
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.manifest["frames"] or name in self.manifest["tables"]
+
+    def __getitem__(self, name: str) -> pd.DataFrame:
+        if name not in self._cache:
+            if name in self.manifest["frames"]:
+                self._cache[name] = self._read_frame(name)
+            elif name in self.manifest["tables"]:
+                self._cache[name] = self._read_table(name)
+            else:
+                raise KeyError(name)
+        return self._cache[name]
+
+    def _index(self, index_id: int) -> pd.DatetimeIndex:
+        if index_id not in self._indices:
+            meta = self.manifest["indices"][index_id]
+            values = np.load(self.path / meta["file"])
+            self._indices[index_id] = pd.DatetimeIndex(values, name=meta["name"])
+        return self._indices[index_id]
+
+    def _read_frame(self, name: str) -> pd.DataFrame:
+        meta = self.manifest["frames"][name]
+        values = np.load(self.path / meta["file"], mmap_mode="r")
+        columns = pd.Index(meta["columns"], name=meta["columns_name"])
+        # copy=False keeps the memory map as backing store of the frame
+        return pd.DataFrame(
+            values, index=self._index(meta["index"]), columns=columns, copy=False
+        )
+
+    def _read_table(self, name: str) -> pd.DataFrame:
+        feather = _import_feather()
+        meta = self.manifest["tables"][name]
+        df = feather.read_table(self.path / meta["file"], memory_map=True).to_pandas()
+        df = df.set_index(meta["index"])
+        df.index.names = meta["index_names"]
+        return df
+
+
+def load_experiment(path: str | Path) -> Experiment:
+    """Open an experiment saved with :func:`save_experiment`.
+
+    Parameters
+    ----------
+    path : str | Path
+        Directory the experiment was saved to.
+
+    Returns
+    -------
+    Experiment
+        Mapping-like access to frames and tables. Values are read on access.
+    """
+    return Experiment(path)
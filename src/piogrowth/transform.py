@@ -0,0 +1,93 @@
+"""Vectorized transformations of wide OD data (timepoints x reactors).
+
+All transformations operate on a two-dimensional float numpy array, modify it in
+place and return it, so that they can be chained without intermediate copies:
+
+>>> df_log = apply_transforms(df_rolling, mask_downward, shift_log)
+
+Parameters of a transformation are bound using :func:`functools.partial`:
+
+>>> from functools import partial
+>>> df = apply_transforms(df_rolling, partial(clip, lower=0.0))
+"""
+
+from __future__ import annotations
+
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+Transform = Callable[[np.ndarray], np.ndarray]
+
+
+def shift_log(arr: np.ndarray, offset: float = 0.001) -> np.ndarray:
+    """Shift columns with negative values to a minimum of zero and log transform.
+
+    Computes :math:`\\ln(y - \\min(\\min(y), 0) + \\text{offset})` per column.
+    Missing values (NaN) are ignored for the minimum and stay missing.
+    """
+    # minimum per column including zero, NaNs are ignored by fmin
+    shift = np.fmin.reduce(arr, axis=0, initial=0.0)
+    arr -= shift
+    arr += offset
+    np.log(arr, out=arr)
+    return arr
+
+
+def subtract_blank(arr: np.ndarray, blank: float | np.ndarray) -> np.ndarray:
+    """Subtract a blank OD value, either one for all or one per reactor (column)."""
+    arr -= blank
+    return arr
+
+
+def mask_downward(arr: np.ndarray) -> np.ndarray:
+    """Set values to NaN which are lower or equal to the previous value.
+
+    Equivalent to ``df.mask(df.diff().le(0))``.
+    """
+    is_downward = arr[1:] <= arr[:-1]
+    np.putmask(arr[1:], is_downward, np.nan)
+    return arr
+
+
+def clip(
+    arr: np.ndarray, lower: float | None = None, upper: float | None = None
+) -> np.ndarray:
+    """Clip values to the interval [lower, upper]. Missing values stay missing."""
+    np.clip(arr, lower, upper, out=arr)
+    return arr
+
+
+def compose(*transforms: Transform) -> Transform:
+    """Chain transformations into one, applied in the given order."""
+
+    def _composed(arr: np.ndarray) -> np.ndarray:
+        for transform in transforms:
+            arr = transform(arr)
+        return arr
+
+    return _composed
+
+
+def apply_transforms(df: pd.DataFrame, *transforms: Transform) -> pd.DataFrame:
+    """Apply transformations to a wide DataFrame.
+
+    The values are copied once into a float array on which all transformations
+    operate in place.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Wide data with timepoints as index and reactors as columns.
+    *transforms : Transform
+        Transformations applied in the given order.
+
+    Returns
+    -------
+    pd.DataFrame
+        Transformed data with the same index and columns.
+    """
+    arr = df.to_numpy(dtype=float, na_value=np.nan, copy=True)
+    arr = compose(*transforms)(arr)
+    return pd.DataFrame(arr, index=df.index, columns=df.columns, copy=False)
@@ -0,0 +1,109 @@
+"""Trim reactors to time windows using integer row bounds instead of copies.
+
+Bounds are stored as a DataFrame with one row per reactor and the columns
+``start`` and ``end``, the half-open range ``[start, end)`` of row positions in
+the wide data which are kept.
+"""
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+def valid_bounds(df: pd.DataFrame) -> pd.DataFrame:
+    """Row bounds spanning the first to the last non-missing value per reactor."""
+    valid = df.notna().to_numpy()
+    n = len(valid)
+    start = valid.argmax(axis=0)
+    end = n - valid[::-1].argmax(axis=0)
+    # reactors without any values
+    empty = ~valid.any(axis=0)
+    start[empty], end[empty] = 0, 0
+    return pd.DataFrame({"start": start, "end": end}, index=df.columns)
+
+
+def time_ranges_to_bounds(
+    index: pd.DatetimeIndex,
+    time_ranges: dict[str, tuple[pd.Timestamp, pd.Timestamp]],
+) -> pd.DataFrame:
+    """Convert (inclusive) time windows per reactor to row bounds.
+
+    Parameters
+    ----------
+    index : pd.DatetimeIndex
+        Sorted index of the wide data.
+    time_ranges : dict[str, tuple[pd.Timestamp, pd.Timestamp]]
+        First and last timestamp to keep per reactor.
+
+    Returns
+    -------
+    pd.DataFrame
+        Columns ``start`` and ``end`` with one row per reactor.
+    """
+    reactors = list(time_ranges)
+    t_min = pd.DatetimeIndex([time_ranges[r][0] for r in reactors])
+    t_max = pd.DatetimeIndex([time_ranges[r][1] for r in reactors])
+    return pd.DataFrame(
+        {
+            "start": index.searchsorted(t_min, side="left"),
+            "end": index.searchsorted(t_max, side="right"),
+        },
+        index=reactors,
+    )
+
+
+def bounds_mask(n: int, bounds: pd.DataFrame, columns: pd.Index) -> np.ndarray:
+    """Boolean array (rows x columns) which is True within the bounds.
+    Columns without bounds are kept entirely."""
+    bounds = bounds.reindex(columns).fillna({"start": 0, "end": n}).astype(int)
+    rows = np.arange(n)[:, None]
+    start = bounds["start"].to_numpy()
+    end = bounds["end"].to_numpy()
+    return (rows >= start) & (rows < end)
+
+
+def iter_trimmed(df: pd.DataFrame, bounds: pd.DataFrame):
+    """Yield reactor name and the trimmed Series (a slice, not a copy)."""
+    for col in df.columns:
+        if col in bounds.index:
+            start, end = bounds.loc[col, ["start", "end"]]
+            yield col, df[col].iloc[start:end]
+        else:
+            yield col, df[col]
+
+
+def decimate_options(
+    index: pd.Index, start: int = 0, end: int | None = None, max_options: int = 200
+) -> pd.Index:
+    """At most ``max_options`` evenly spaced entries of ``index[start:end]``,
+    always including the first and last entry, e.g. for sliders."""
+    end = len(index) if end is None else end
+    if end - start <= max_options:
+        return index[start:end]
+    positions = np.linspace(start, end - 1, max_options).round().astype(int)
+    return index[np.unique(positions)]
+
+
+def time_options_to_frame(
+    options: dict[str, pd.Index], column: str = "pioreactor_unit"
+) -> pd.DataFrame:
+    """Slider options per reactor as long table, e.g. to save them."""
+    return pd.DataFrame(
+        {
+            column: np.repeat(list(options), [len(o) for o in options.values()]),
+            "time_option": np.concatenate(
+                [np.asarray(o) for o in options.values()] or [np.array([], "M8[ns]")]
+            ),
+        }
+    )
+
+
+def time_options_from_frame(
+    df: pd.DataFrame, column: str = "pioreactor_unit"
+) -> dict[str, pd.Index]:
+    """Slider options per reactor from :func:`time_options_to_frame`."""
+    return {
+        reactor: pd.DatetimeIndex(group["time_option"])
+        for reactor, group in df.groupby(column, sort=False)
+    }
@@ -1,5 +1,9 @@
+from __future__ import annotations
+
+import warnings
+
+import numpy as np
 import pandas as pd
-from scipy.signal import find_peaks
 
 
 def detect_peaks(
@@ -19,8 +23,110 @@ def detect_peaks(
     Returns:
         pd.Series: Detected peaks in the series.
     """
+    from scipy.signal import find_peaks
+
     s = series.dropna()
     if prominence is None:
         prominence = s.max() / 5
     peaks, _ = find_peaks(s, distance=distance, prominence=prominence)
     return s.iloc[peaks]
+
+
+def detect_dilutions(
+    df: pd.DataFrame,
+    threshold: float = 10.0,
+    relative_drop: float = 0.5,
+    min_separation: float | None = None,
+) -> pd.DataFrame:
+    """Detect dilution events as sharp drops in OD for all reactors at once.
+
+    The change between consecutive valid values of each reactor is compared to a
+    robust estimate of its noise, the scaled median absolute deviation (MAD) of
+    all non-zero changes of that reactor. Drops of more than ``threshold`` times
+    this noise level at consecutive timepoints or less than ``min_separation``
+    seconds apart belong to the same event, e.g. a dilution spread over several
+    timepoints by a rolling median.
+    An event is a dilution if its total drop is at least ``relative_drop`` times
+    the largest total drop of the reactor, as dilutions of a turbidostat are
+    similar in size. Each dilution is assigned to the highest value before one of
+    its drops (the peak). All steps are vectorized over reactors and timepoints.
+
+    Args:
+        df (pd.DataFrame): Wide OD data with timestamps as index and reactors as
+                           columns. Missing values are skipped.
+        threshold (float): Minimum drop between consecutive values in multiples
+                           of the noise level (scaled MAD of the non-zero changes
+                           between consecutive values).
+        relative_drop (float): Minimum total drop of an event as fraction of the
+                               largest total drop of a reactor.
+        min_separation (float): Minimum time between two dilutions in seconds.
+                                Closer drops are merged into one event. By
+                                default five times the median interval between
+                                the valid values of each reactor, so only drops
+                                a few timepoints apart are merged.
+
+    Returns:
+        pd.DataFrame: OD values at the detected events with the timepoints as index
+                      and reactors as columns (NaN elsewhere), i.e. the same
+                      shape as the peaks from :func:`detect_peaks` or the pivoted
+                      dilution event metadata.
+    """
+    if df.empty:
+        return df.iloc[:0].astype(float)
+    values = df.to_numpy(dtype=float, na_value=np.nan)
+    n, _ = values.shape
+    valid = ~np.isnan(values)
+    # position of the previous valid value for each timepoint and reactor
+    positions = np.where(valid, np.arange(n)[:, None], -1)
+    last_valid = np.maximum.accumulate(positions, axis=0)
+    prev_valid = np.vstack([np.full((1, values.shape[1]), -1), last_valid[:-1]])
+    has_prev = valid & (prev_valid >= 0)
+    cols = np.arange(values.shape[1])
+    prev_values = values[np.maximum(prev_valid, 0), cols]
+    diff = np.where(has_prev, values - prev_values, np.nan)
+
+    # plateaus (no change) of a rolling median would shrink the noise level
+    changes = np.where(diff != 0, diff, np.nan)
+    with warnings.catch_warnings():
+        # reactors without any (consecutive) values
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        center = np.nanmedian(changes, axis=0)
+        noise = 1.4826 * np.nanmedian(np.abs(changes - center), axis=0)
+    with np.errstate(invalid="ignore"):
+        drops = diff < -threshold * noise
+
+    seconds = (df.index - df.index[0]).total_seconds().to_numpy(dtype=float)
+    if min_separation is None:
+        intervals = np.where(has_prev, seconds[:, None] - seconds[prev_valid], np.nan)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            min_separation = np.nan_to_num(5 * np.nanmedian(intervals, axis=0))
+    min_separation = np.broadcast_to(min_separation, values.shape[1])
+
+    # drops ordered by reactor, then time; a new event starts with a new reactor
+    # or after a gap of more than min_separation to the previous drop
+    event_cols, rows = np.nonzero(drops.T)
+    seconds = seconds[rows]
+    starts = np.ones(len(rows), dtype=bool)
+    consecutive = prev_valid[rows[1:], event_cols[1:]] == rows[:-1]
+    starts[1:] = (event_cols[1:] != event_cols[:-1]) | (
+        (np.diff(seconds) > min_separation[event_cols[1:]]) & ~consecutive
+    )
+    event_ids = np.cumsum(starts) - 1
+    # total drop per event and largest total drop per reactor
+    sizes = np.bincount(event_ids, weights=-diff[rows, event_cols])
+    first = np.flatnonzero(starts)
+    largest = np.zeros(values.shape[1])
+    np.maximum.at(largest, event_cols[first], sizes)
+    keep = sizes >= relative_drop * largest[event_cols[first]]
+
+    # peak: the highest value before any drop of an event
+    before = prev_valid[rows, event_cols]
+    order = np.lexsort((values[before, event_cols], event_ids))
+    highest = order[np.r_[first[1:], len(order)] - 1]
+    peak_rows = before[highest][keep]
+    peak_cols = event_cols[highest][keep]
+    peaks = np.full(values.shape, np.nan)
+    peaks[peak_rows, peak_cols] = values[peak_rows, peak_cols]
+    peaks = pd.DataFrame(peaks, index=df.index, columns=df.columns)
+    return peaks.iloc[np.unique(peak_rows)]
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from piogrowth import filter, fit
+from piogrowth.cache import ColumnCache
+
+
+@pytest.fixture(scope="module")
+def df():
+    index = pd.date_range("2025-01-01", periods=300, freq="30s")
+    t = np.linspace(-5, 5, len(index))[:, None]
+    rng = np.random.default_rng(0)
+    values = np.log(0.05 + 1 / (1 + np.exp(-t))) + rng.normal(0, 0.01, (300, 3))
+    return pd.DataFrame(values, index=index, columns=["P01", "P02", "P03"])
+
+
+def test_filter_pipeline_recomputes_changed_column(df):
+    cache = ColumnCache()
+    pipeline = filter.FilterPipeline(window=5)
+    pipeline.run(df, cache=cache)
+    assert (cache.hits, cache.misses) == (0, 3)
+    changed = df.copy()
+    changed.iloc[:10, 1] = np.nan
+    res = pipeline.run(changed, cache=cache)
+    assert (cache.hits, cache.misses) == (2, 4)
+    expected = pipeline.run(changed)
+    for field, field_expected in zip(res, expected):
+        pd.testing.assert_frame_equal(field, field_expected)
+
+
+def test_whittaker_fits_per_column(df):
+    cache = ColumnCache()
+
+    def fit_whittaker(df):
+        return cache.apply_columns(
+            "whittaker",
+            lambda sub: fit.fit_whittaker_splines(sub, lam=1e4),
+            df,
+            params=1e4,
+        )
+
+    fit_whittaker(df)
+    changed = df.copy()
+    changed["P03"] += 0.1
+    fitted = fit_whittaker(changed)
+    assert list(fitted) == list(df.columns)
+    assert (cache.hits, cache.misses) == (2, 4)
+    pd.testing.assert_frame_equal(
+        fit.max_derivatives(fitted),
+        fit.max_derivatives(fit.fit_whittaker_splines(changed, lam=1e4)),
+    )
+
+
+def test_bounded_by_bytes(df):
+    column_bytes = df["P01"].memory_usage(index=False)
+    cache = ColumnCache(max_bytes=2 * column_bytes)
+    columns = {col: df[col] for col in df.columns}
+    for col, s in columns.items():
+        cache.put(col, s)
+    assert cache.nbytes == 2 * column_bytes
+    # least recently used result is removed first
+    assert cache.get("P01") is None
+    assert cache.get("P03") is columns["P03"]
+    cache.clear()
+    assert cache.nbytes == 0
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from piogrowth import export
+
+pytest.importorskip("pyarrow")
+
+
+def test_archive_round_trip():
+    index = pd.date_range(
+        "2025-01-01", periods=1_001, freq="5s", unit="ns", name="timestamp_rounded"
+    )
+    df_wide = pd.DataFrame(
+        np.random.default_rng(0).random((len(index), 3)),
+        index=index,
+        columns=["P01", "P02", "P03"],
+    )
+    df_wide.iloc[5, 1] = np.nan
+    df_summary = pd.DataFrame(
+        {"mu_max": [1e-4, 2e-4], "timepoint": index[[10, 20]]},
+        index=pd.Index(["P01", "P02"], name="pioreactor_unit"),
+    )
+    tables = {"df_rolling": df_wide, "summary": df_summary, "missing": None}
+    with export.export_to_temporary_file(
+        tables, params={"round_time": 5}, chunk_rows=100
+    ) as f:
+        restored, params = export.read_archive(f)
+    assert params == {"round_time": 5}
+    assert list(restored) == ["df_rolling", "summary"]
+    pd.testing.assert_frame_equal(
+        restored["df_rolling"], df_wide, check_freq=False, check_index_type=False
+    )
+    pd.testing.assert_frame_equal(
+        restored["summary"], df_summary, check_index_type=False, check_dtype=False
+    )
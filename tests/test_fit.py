@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.interpolate import make_interp_spline
+
+from piogrowth import fit
+
+
+@pytest.fixture
+def df_uniform():
+    rng = np.random.default_rng(0)
+    index = pd.date_range("2025-01-01", periods=500, freq="5s")
+    t = np.linspace(0, 10, len(index))[:, None]
+    values = 1 / (1 + np.exp(-(t - 5))) + rng.normal(0, 0.01, (len(index), 6))
+    df = pd.DataFrame(values, index=index, columns=[f"P{i:02d}" for i in range(6)])
+    # columns with different (and shared) patterns of missing values
+    df.iloc[:50, [0, 3]] = np.nan
+    df.iloc[200:220, 1] = np.nan
+    return df
+
+
+def test_whittaker_smooth_groups_columns(df_uniform):
+    smoothed = fit.whittaker_smooth(df_uniform, lam=1e6)
+    for col in df_uniform.columns:
+        expected = fit.whittaker_smooth(df_uniform[[col]], lam=1e6)[col]
+        np.testing.assert_allclose(smoothed[col], expected, equal_nan=True)
+
+
+def test_fit_whittaker_splines_per_column(df_uniform):
+    smoothed = fit.whittaker_smooth(df_uniform, lam=1e6)
+    axis = fit.time_axis(df_uniform)
+    fitted = fit.fit_whittaker_splines(df_uniform, lam=1e6, axis=axis)
+    assert list(fitted) == list(df_uniform.columns)
+    for col, spline in fitted.items():
+        valid = axis.valid[col]
+        rows = slice(valid[0], valid[-1] + 1)
+        x = axis.seconds[rows] - axis.seconds[valid[0]]
+        expected = make_interp_spline(x, smoothed[col].to_numpy()[rows], k=3)
+        assert spline.start == df_uniform.index[valid[0]]
+        np.testing.assert_allclose(spline.spline(x, nu=1), expected(x, nu=1))
+
+
+def test_segment_mu_max_matches_max_derivatives(df_uniform):
+    df = df_uniform.iloc[50:].drop(columns="P01")
+    maxima = fit.max_derivatives(fit.fit_splines_one_batch(df, 0.01))
+    no_peaks = pd.Series(dtype=float)
+    for col in df.columns:
+        *_, segments = fit.fit_splines_to_segments(df[col], no_peaks, 0.01)
+        (segment,) = segments.itertuples()
+        assert segment.mu_max == pytest.approx(maxima.loc[col, "mu_max"])
+        assert segment.timepoint == maxima.loc[col, "timepoint"]
+        assert segment.OD_spline_at_max == pytest.approx(maxima.loc[col, "fitted"])
+
+
+@pytest.mark.parametrize(
+    "fit_kwargs, bootstrap_kwargs",
+    [
+        ({}, {}),
+        ({"max_gap": 600.0}, {"max_gap": 600.0}),
+        ({"lam": 1e6}, {"lam": 1e6}),
+    ],
+    ids=["spline", "spline_with_gaps", "whittaker"],
+)
+def test_bootstrap_resamples_the_fit(df_uniform, fit_kwargs, bootstrap_kwargs):
+    df = df_uniform.iloc[:, :3]
+    if "lam" in fit_kwargs:
+        fitted = fit.fit_whittaker_splines(df, **fit_kwargs)
+    elif "max_gap" in fit_kwargs:
+        fitted = fit.fit_splines_with_gaps(df, 0.1, max_workers=1, **fit_kwargs)
+    else:
+        fitted = fit.fit_splines_one_batch(df, 0.1)
+    maxima = fit.max_derivatives(fitted)
+    res = fit.bootstrap_max_derivatives(
+        df, 0.1, n_resamples=20, seed=0, max_workers=1, **bootstrap_kwargs
+    )
+    np.testing.assert_allclose(res["mu_max"], maxima["mu_max"])
+    assert (res["timepoint"] == maxima["timepoint"]).all()
+    assert (res["mu_max_lower"] <= res["mu_max"]).all()
+    assert (res["mu_max"] <= res["mu_max_upper"]).all()
+
+
+def test_bootstrap_blocks_widen_intervals_of_autocorrelated_residuals(df_uniform):
+    s = df_uniform["P02"].rolling(31, center=True).median()
+    kwargs = dict(lam=1e6, n_resamples=50, seed=0)
+    blocks = fit.bootstrap_max_derivative(s, **kwargs)
+    iid = fit.bootstrap_max_derivative(s, block_length=1, **kwargs)
+    width = blocks["mu_max_upper"] - blocks["mu_max_lower"]
+    assert width > 2 * (iid["mu_max_upper"] - iid["mu_max_lower"])
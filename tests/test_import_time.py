@@ -0,0 +1,54 @@
+"""Import times of piogrowth modules, measured with ``python -X importtime``.
+
+Heavy dependencies (scipy, matplotlib) are only imported when a fit, peak
+detection or plot is first run. Set ``PIOGROWTH_IMPORT_TIME_SCALE`` to scale all
+budgets, e.g. on slower machines.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+SCALE = float(os.environ.get("PIOGROWTH_IMPORT_TIME_SCALE", 1.0))
+
+# module: (budget in milliseconds, modules which must not be imported)
+BUDGETS = {
+    "piogrowth": (100, ["numpy", "pandas", "scipy", "matplotlib"]),
+    "piogrowth.fit": (1_000, ["scipy", "matplotlib"]),
+    "piogrowth.models": (1_000, ["scipy", "matplotlib"]),
+    "piogrowth.turbistat": (1_000, ["scipy", "matplotlib"]),
+}
+
+
+def import_time(module: str) -> tuple[float, set[str]]:
+    """Import a module in a fresh interpreter.
+
+    Returns the cumulative import time of the piogrowth modules in milliseconds
+    and the names of all imported modules.
+    """
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total_us, imported = 0, set()
+    for line in res.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        imported.add(name.strip())
+        # top level imports are not indented
+        if name.startswith(" piogrowth"):
+            total_us += int(cumulative)
+    return total_us / 1_000, imported
+
+
+@pytest.mark.parametrize("module", BUDGETS)
+def test_import_time(module):
+    budget_ms, lazy_modules = BUDGETS[module]
+    elapsed_ms, imported = import_time(module)
+    assert not [m for m in lazy_modules if m in imported]
+    assert elapsed_ms <= budget_ms * SCALE
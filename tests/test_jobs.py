@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from piogrowth import fit, jobs, models
+from piogrowth.cache import ColumnCache
+
+
+@pytest.fixture
+def runner():
+    scheduler = jobs.Scheduler(max_workers=2, executor=ThreadPoolExecutor(2))
+    yield jobs.JobRunner(scheduler)
+    scheduler.shutdown()
+
+
+@pytest.fixture(scope="module")
+def df():
+    index = pd.date_range("2025-01-01", periods=300, freq="30s")
+    t = np.linspace(-5, 5, len(index))[:, None]
+    rng = np.random.default_rng(0)
+    values = np.log(0.05 + 1 / (1 + np.exp(-t))) + rng.normal(0, 0.01, (300, 3))
+    return pd.DataFrame(values, index=index, columns=["P01", "P02", "P03"])
+
+
+def test_submit_bootstrap(runner, df):
+    job = jobs.submit_bootstrap(
+        runner, df, smoothing_factor=0.1, n_resamples=10, seed=0
+    )
+    expected = fit.bootstrap_max_derivatives(
+        df, smoothing_factor=0.1, n_resamples=10, seed=0, max_workers=1
+    )
+    pd.testing.assert_frame_equal(job.result(), expected)
+    assert runner.scheduler.metrics()["submitted"] == df.shape[1]
+    # submitting the same bootstrap again returns the job
+    again = jobs.submit_bootstrap(
+        runner, df, smoothing_factor=0.1, n_resamples=10, seed=0
+    )
+    assert again is job
+
+
+def test_submit_growth_model_fits(runner, df):
+    job = jobs.submit_growth_model_fits(runner, df, model="gompertz")
+    expected = models.fit_growth_models(df, model="gompertz", max_workers=1)
+    pd.testing.assert_frame_equal(job.result(), expected)
+    with pytest.raises(ValueError):
+        jobs.submit_growth_model_fits(runner, df, model="unknown")
+
+
+def test_cached_tasks_are_not_submitted(df):
+    cache = ColumnCache()
+    changed = df.copy()
+    changed["P02"] += 0.1
+    for data, n_submitted in [(df, 3), (changed, 1)]:
+        # a new scheduler does not know earlier tasks, results come from the cache
+        scheduler = jobs.Scheduler(max_workers=2, executor=ThreadPoolExecutor(2))
+        runner = jobs.JobRunner(scheduler, cache=cache)
+        job = jobs.submit_growth_model_fits(runner, data, model="gompertz")
+        pd.testing.assert_frame_equal(
+            job.result(), models.fit_growth_models(data, model="gompertz")
+        )
+        assert scheduler.metrics()["submitted"] == n_submitted
+        scheduler.shutdown()
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from piogrowth import load
+
+
+def _readings(channels):
+    index = pd.date_range("2025-01-01", periods=3, freq="5s")
+    return pd.DataFrame(
+        [
+            (t, reactor, channel, float(i))
+            for i, t in enumerate(index)
+            for reactor in ("P01", "P02")
+            for channel in channels
+        ],
+        columns=["timestamp_rounded", "pioreactor_unit", "channel", "od_reading"],
+    )
+
+
+def test_column_reactors_of_channels():
+    od_array = load.to_od_array(_readings(["1", "2"]))
+    column_reactors = od_array.column_reactors()
+    assert column_reactors.index.equals(od_array.to_frame().columns)
+    assert column_reactors.to_dict() == {
+        "P01_1": "P01",
+        "P01_2": "P01",
+        "P02_1": "P02",
+        "P02_2": "P02",
+    }
+
+
+def test_column_reactors_of_one_channel():
+    od_array = load.to_od_array(_readings(["1"]))
+    assert od_array.column_reactors().to_dict() == {"P01": "P01", "P02": "P02"}
+
+
+def test_reactors_to_columns():
+    od_array = load.to_od_array(_readings(["1", "2"]))
+    columns = od_array.to_frame().columns
+    peaks = pd.DataFrame({"P01": [0.5]}, index=[pd.Timestamp("2025-01-01")])
+    peaks = load.reactors_to_columns(peaks, columns, od_array.column_reactors())
+    assert peaks.columns.equals(columns)
+    np.testing.assert_array_equal(peaks.iloc[0], [0.5, 0.5, np.nan, np.nan])
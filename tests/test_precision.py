@@ -0,0 +1,39 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from piogrowth import filter, load
+from piogrowth.precision import compare_precision
+
+DATA = Path(__file__).parents[1] / "data"
+
+
+@pytest.fixture(
+    scope="module",
+    params=sorted(p.name for p in DATA.glob("example_*_od_readings.csv")),
+)
+def df_wide(request):
+    df = load.read_csv(DATA / request.param)
+    df.insert(0, "timestamp_rounded", df["timestamp_localtime"].dt.round("5s"))
+    return load.to_od_array(df).to_frame()
+
+
+def test_float32_within_tolerance(df_wide):
+    res = compare_precision(df_wide, window=filter.default_window(df_wide.index))
+    assert res.index.equals(df_wide.columns)
+    assert "mu_max_float32" in res.columns
+    assert res["within_tolerance"].all(), res
+
+
+def test_float32_pipeline_keeps_dtype(df_wide):
+    window = filter.default_window(df_wide.index)
+    reference = filter.FilterPipeline(window=window).run(df_wide)
+    res = filter.FilterPipeline(dtype=np.float32, window=window).run(df_wide)
+    assert (res.rolling_median.dtypes == np.float32).all()
+    np.testing.assert_allclose(
+        res.rolling_median.to_numpy(),
+        reference.rolling_median.to_numpy(),
+        rtol=1e-5,
+        equal_nan=True,
+    )
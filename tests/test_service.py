@@ -0,0 +1,120 @@
+import asyncio
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from piogrowth.service import GrowthService
+
+DATA = Path(__file__).parents[1] / "data"
+CHUNK_SIZE = 2**16
+
+
+@pytest.fixture
+def app():
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        yield GrowthService(executor=executor)
+
+
+@pytest.fixture(scope="module")
+def batch_data():
+    return (DATA / "example_batch_data_od_readings.csv").read_bytes()
+
+
+def request(app, method, path, body=b"", query_string=b"", headers=()):
+    """Send a request to the ASGI app, returns status, headers and body."""
+    chunks = [body[i : i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)] or [
+        b""
+    ]
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "query_string": query_string,
+        "headers": list(headers),
+    }
+    asyncio.run(app(scope, receive, send))
+    start, response = sent
+    return start["status"], dict(start["headers"]), response["body"]
+
+
+def test_health(app):
+    status, _, body = request(app, "GET", "/health")
+    assert status == 200
+    assert json.loads(body) == {"status": "ok"}
+
+
+def test_batch(app, batch_data):
+    status, headers, body = request(app, "POST", "/batch", batch_data)
+    assert status == 200
+    assert headers[b"content-type"] == b"application/json"
+    records = json.loads(body)
+    assert len(records) == 6
+    assert all(record["mu_max"] > 0 for record in records)
+
+
+def test_batch_arrow(app, batch_data):
+    pa = pytest.importorskip("pyarrow")
+    status, _, body = request(
+        app, "POST", "/batch", batch_data, query_string=b"format=arrow"
+    )
+    assert status == 200
+    table = pa.ipc.open_stream(io.BytesIO(body)).read_all()
+    assert "mu_max" in table.column_names
+
+
+def test_turbidostat(app):
+    data = (DATA / "example_2_Pio_Experiment_od_readings.csv").read_bytes()
+    status, _, body = request(app, "POST", "/turbidostat", data)
+    assert status == 200
+    assert len(json.loads(body))
+
+
+@pytest.mark.parametrize(
+    "method, path, expected", [("POST", "/unknown", 404), ("GET", "/batch", 405)]
+)
+def test_routes(app, method, path, expected):
+    status, _, _ = request(app, method, path)
+    assert status == expected
+
+
+@pytest.mark.parametrize(
+    "body, query_string",
+    [
+        (b"", b""),
+        (b"\x00\xff not an OD export", b""),
+        (b"a,b\n1,2\n", b""),
+        (b"timestamp_localtime\n", b"unknown=1"),
+        (b"timestamp_localtime\n", b"smoothing_factor=abc"),
+    ],
+)
+def test_bad_request(app, body, query_string):
+    status, _, body = request(app, "POST", "/batch", body, query_string)
+    assert status == 400
+    assert "error" in json.loads(body)
+
+
+def test_upload_too_large(batch_data):
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        app = GrowthService(executor=executor, max_upload_size=CHUNK_SIZE)
+        # rejected by the Content-Length header
+        headers = [(b"content-length", str(len(batch_data)).encode())]
+        status, _, _ = request(app, "POST", "/batch", batch_data, headers=headers)
+        assert status == 413
+        # rejected while streaming the upload
+        status, _, _ = request(app, "POST", "/batch", batch_data)
+        assert status == 413
@@ -0,0 +1,43 @@
+import pandas as pd
+import pytest
+
+from piogrowth import store
+
+
+@pytest.fixture
+def df_wide():
+    index = pd.date_range(
+        "2025-01-01", periods=4, freq="5s", unit="ns", name="timestamp"
+    )
+    return pd.DataFrame(
+        {"P01": [0.1, 0.2, 0.3, 0.4], "P02": [0.2, 0.1, 0.4, 0.3]}, index
+    )
+
+
+def _save(root, name, df_wide):
+    """Save an experiment like the upload page, which knows nothing but its name."""
+    return store.save_experiment(
+        store.experiment_dir(root, name),
+        frames={"df_rolling": df_wide},
+        params={"custom_id": name},
+    )
+
+
+def test_reopen_experiment_in_another_session(tmp_path, df_wide):
+    # saved in an earlier session, no session id is part of the location
+    _save(tmp_path, "run_1", df_wide)
+    _save(tmp_path, "run_2", df_wide)
+    assert store.list_experiments(tmp_path) == ["run_1", "run_2"]
+    experiment = store.load_experiment(store.experiment_dir(tmp_path, "run_1"))
+    pd.testing.assert_frame_equal(experiment["df_rolling"], df_wide, check_freq=False)
+    assert experiment.params == {"custom_id": "run_1"}
+
+
+def test_list_experiments_without_root(tmp_path):
+    assert store.list_experiments(tmp_path / "missing") == []
+
+
+@pytest.mark.parametrize("name", ["..", "../run", "a/b", "/tmp", "", ".hidden"])
+def test_experiment_dir_rejects_paths(tmp_path, name):
+    with pytest.raises(ValueError):
+        store.experiment_dir(tmp_path, name)
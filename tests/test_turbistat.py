@@ -0,0 +1,71 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from piogrowth import filter, load
+from piogrowth.turbistat import detect_dilutions
+
+DATA = Path(__file__).parents[1] / "data"
+
+
+@pytest.fixture(scope="module")
+def df_rolling():
+    df = load.read_csv(DATA / "example_2_Pio_Experiment_od_readings.csv")
+    df.insert(0, "timestamp_rounded", df["timestamp_localtime"].dt.round("5s"))
+    df_wide = load.to_od_array(df).to_frame()
+    return filter.rolling_median(df_wide, filter.default_window(df_wide.index))
+
+
+@pytest.fixture(scope="module")
+def n_dilutions():
+    df_meta = pd.read_csv(DATA / "example_2-Pio_Experiment_dilution_events.csv")
+    df_meta = df_meta.loc[df_meta["event_name"] == "DilutionEvent"]
+    return df_meta["pioreactor_unit"].value_counts()  # P06: 8, P07/P08: 2, P10: 3
+
+
+@pytest.mark.parametrize(
+    "threshold, min_separation",
+    # only the largest steps of a dilution smoothed by the rolling median (window
+    # of 930 s) exceed a high threshold, they are merged across the window
+    [(5.0, None), (10.0, None), (20.0, 930.0)],
+)
+def test_detect_dilutions_matches_metadata(
+    df_rolling, n_dilutions, threshold, min_separation
+):
+    peaks = detect_dilutions(
+        df_rolling, threshold=threshold, min_separation=min_separation
+    )
+    assert peaks.notna().sum().to_dict() == n_dilutions.to_dict()
+
+
+def test_detect_dilutions_threshold(df_rolling):
+    n_default = detect_dilutions(df_rolling).notna().sum().sum()
+    n_strict = detect_dilutions(df_rolling, threshold=100.0).notna().sum().sum()
+    assert n_strict < n_default
+
+
+def test_detect_dilutions_merges_close_drops():
+    index = pd.date_range("2025-01-01", periods=200, freq="30s")
+    od = pd.Series(0.1 + 1e-4 * (index.second % 7), index=index)
+    # one dilution spread over three timepoints
+    od.iloc[100:] -= 0.01
+    od.iloc[101:] -= 0.01
+    od.iloc[102:] -= 0.01
+    peaks = detect_dilutions(od.to_frame("P01"))
+    assert peaks.index.tolist() == [index[99]]
+    assert len(detect_dilutions(od.to_frame("P01"), min_separation=0.0)) == 1
+
+
+def test_detect_dilutions_keeps_close_dilutions_by_default():
+    index = pd.date_range("2025-01-01", periods=200, freq="30s")
+    rng = np.random.default_rng(0)
+    od = pd.Series(0.1 + rng.normal(0, 1e-4, len(index)), index=index)
+    # two dilutions ten minutes apart
+    od.iloc[100:] -= 0.01
+    od.iloc[120:] -= 0.01
+    peaks = detect_dilutions(od.to_frame("P01"))
+    assert peaks.index.tolist() == [index[99], index[119]]
+    merged = detect_dilutions(od.to_frame("P01"), min_separation=1800.0)
+    assert merged.index.tolist() == [index[99]]